@@ -22,6 +22,55 @@ STATICFILES_DIRS = [
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Пагинация результатов поиска (page_size из запроса ограничен сверху)
+TOURS_PAGE_SIZE = 24
+TOURS_MAX_PAGE_SIZE = 100
+TOURS_REVIEWS_PAGE_SIZE = 10
+
+# Сколько минут держать места за клиентом, пока идет оплата
+BOOKING_HOLD_MINUTES = 15
+
+# Время жизни кэша фасетов поиска, секунды
+TOURS_FACETS_TIMEOUT = 300
+
+# Индекс действующих акций на день; правки акций сбрасывают его сигналами
+TOURS_PROMOTIONS_TIMEOUT = 60 * 60
+
+# Справочники (страны, города) инвалидируются сигналами, таймаут — страховка
+TOURS_REFERENCE_TIMEOUT = 24 * 60 * 60
+
+# Множество избранных туров пользователя; сбрасывается при каждой правке избранного
+TOURS_FAVORITES_TIMEOUT = 24 * 60 * 60
+
+# Сколько переключений избранного принимает один запрос синхронизации
+TOURS_FAVORITES_SYNC_MAX = 500
+
+# Процессы для фоновой обработки картинок (загрузки, уменьшенные копии).
+# 0 — выполнять в самом запросе после коммита (для отладки)
+TOURS_WORKERS = 2
+
+# Ширины уменьшенных копий картинок
+TOURS_RENDITION_WIDTHS = (320, 640, 1280)
+
+# Загрузки из формы тура: предельный размер файла и большая сторона после обработки
+TOURS_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+TOURS_UPLOAD_MAX_SIDE = 2560
+
+# Сколько хранить staging-файлы и картинки без ссылок, прежде чем их удалит gc_uploads
+TOURS_UPLOAD_GRACE = 24 * 60 * 60
+
+# Общий кэш процессов: в нем версии справочников и каталога (ETag API), фасеты,
+# избранное. Он обязан быть общим для всех воркеров — LocMemCache здесь не годится:
+# смена версии в одном процессе не дошла бы до остальных. Файловый кэш общий
+# для процессов одной машины; при нескольких серверах укажите Redis или Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -89,6 +138,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL: чтение не ждет писателя; IMMEDIATE: блокировка записи берется
+            # сразу при BEGIN, без взаимоблокировок при повышении уровня
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
     }
 }
 
@@ -129,6 +185,20 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Сюда collectstatic собирает статику для продакшена
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Без DEBUG статика получает хеш в имени и сжатые .gz/.br варианты при collectstatic,
+# а отдает ее и медиа tours.assets (см. tour_agency/urls.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'tours.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# Cache-Control для медиа без хеша в имени: браузер перепроверяет их по ETag
+TOURS_MEDIA_MAX_AGE = 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,6 +1,14 @@
-from django.contrib import admin
-from .models import User, Country, City, Hotel, Image, Tour, Booking, Review, Promotion, Favorite
+from django import forms
+from django.contrib import admin, messages
+from django.db.models import BooleanField, Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Value, When
+from . import fulltext
+from .availability import refresh_tours
+from .booking import BookingError, cancel_booking, confirm_booking, reserve_slots
+from .exports import BOOKING_COLUMNS, TOUR_COLUMNS, export_response
+from .models import User, Country, City, Hotel, Image, Tour, Booking, BookingHold, Review, Promotion, Favorite
+from .pagination import EstimatedCountPaginator
 from datetime import date
+from decimal import Decimal
 
 class TourImageInline(admin.TabularInline):
     model = Tour.images.through
@@ -10,6 +18,97 @@ class HotelImageInline(admin.TabularInline):
     model = Hotel.images.through
     extra = 1
 
+class CityListFilter(admin.RelatedFieldListFilter):
+    """Фильтр по городу: City.__str__ читает страну, поэтому грузим их одним запросом."""
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin) or ('name',)
+        cities = City.objects.select_related('country').order_by(*ordering)
+        return [(city.pk, str(city)) for city in cities]
+
+class CitySelectMixin:
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'city':
+            kwargs['queryset'] = City.objects.select_related('country')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+class LargeTableMixin:
+    """Списки больших таблиц: без точного COUNT(*) по всей таблице на каждой странице."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+class ExportMixin:
+    """Действия выгрузки выбранных строк в CSV и XLSX потоковым ответом."""
+    export_columns = ()
+    export_name = 'export'
+
+    @admin.action(description='Выгрузить в CSV')
+    def export_csv(self, request, queryset):
+        return export_response(queryset.order_by('pk'), self.export_columns, self.export_name, 'csv')
+
+    @admin.action(description='Выгрузить в Excel (XLSX)')
+    def export_xlsx(self, request, queryset):
+        return export_response(queryset.order_by('pk'), self.export_columns, self.export_name, 'xlsx')
+
+class BookingAdminForm(forms.ModelForm):
+    def clean(self):
+        cleaned = super().clean()
+        tour, num_people = cleaned.get('tour'), cleaned.get('num_people')
+        if self.instance.pk is None:
+            if cleaned.get('status') == 'cancelled':
+                raise forms.ValidationError("Нельзя создать отмененное бронирование")
+            if num_people is not None and num_people < 1:
+                self.add_error('num_people', "Количество человек должно быть положительным")
+            elif tour is not None and num_people is not None and tour.available_slots < num_people:
+                self.add_error('num_people', f"В туре осталось мест: {tour.available_slots}")
+        return cleaned
+
+class BookingServiceMixin:
+    """Брони меняются через tours.booking, чтобы места тура и календарь не расходились с ними.
+
+    У сохраненной брони тур, число мест и статус только для чтения: подтверждение
+    и отмена — действиями, а удаление сначала отменяет бронь и возвращает места.
+    """
+    form = BookingAdminForm
+    booking_fields = ('tour', 'num_people', 'status')
+
+    def get_readonly_fields(self, request, obj=None):
+        readonly = super().get_readonly_fields(request, obj)
+        return (*readonly, *self.booking_fields) if obj else readonly
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            return super().save_model(request, obj, form, change)
+        # То же, что book_tour, но в транзакции формы админки
+        reserve_slots(obj.tour_id, obj.num_people)
+        super().save_model(request, obj, form, change)
+        refresh_tours([obj.tour_id])
+
+    def delete_model(self, request, obj):
+        cancel_booking(obj)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for booking in queryset.exclude(status='cancelled'):
+            cancel_booking(booking)
+        super().delete_queryset(request, queryset)
+
+    @admin.action(description='Подтвердить выбранные брони')
+    def confirm_bookings(self, request, queryset):
+        confirmed = 0
+        for booking in queryset.filter(status='pending'):
+            try:
+                confirm_booking(booking)
+                confirmed += 1
+            except BookingError as e:
+                self.message_user(request, str(e), messages.WARNING)
+        self.message_user(request, f"Подтверждено броней: {confirmed}")
+
+    @admin.action(description='Отменить выбранные брони и вернуть места')
+    def cancel_bookings(self, request, queryset):
+        cancelled = sum(cancel_booking(booking) for booking in queryset.exclude(status='cancelled'))
+        self.message_user(request, f"Отменено броней: {cancelled}")
+
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'phone', 'role', 'date_registered', 'is_staff')
@@ -25,58 +124,100 @@ class CountryAdmin(admin.ModelAdmin):
 @admin.register(City)
 class CityAdmin(admin.ModelAdmin):
     list_display = ('name', 'country')
+    list_select_related = ('country',)
     list_filter = ('country',)
     search_fields = ('name', 'country__name')
 
 @admin.register(Hotel)
-class HotelAdmin(admin.ModelAdmin):
+class HotelAdmin(CitySelectMixin, admin.ModelAdmin):
     list_display = ('name', 'stars', 'city', 'country')
-    list_filter = ('stars', 'country', 'city')
+    list_select_related = ('country', 'city__country')
+    list_filter = ('stars', 'country', ('city', CityListFilter))
     search_fields = ('name', 'address', 'city__name', 'country__name')
     inlines = [HotelImageInline]
 
 @admin.register(Tour)
-class TourAdmin(admin.ModelAdmin):
-    list_display = ('title', 'country', 'city', 'price', 'start_date', 'end_date', 'available_slots', 'tour_type', 'is_tour_active')
-    list_filter = ('tour_type', 'country', 'city', 'start_date', 'end_date')
+class TourAdmin(ExportMixin, LargeTableMixin, CitySelectMixin, admin.ModelAdmin):
+    list_display = ('title', 'country', 'city', 'price', 'effective_price', 'start_date', 'end_date', 'available_slots', 'tour_type', 'is_tour_active')
+    list_select_related = ('country', 'city__country')
+    list_filter = ('tour_type', 'country', ('city', CityListFilter), 'start_date', 'end_date')
     search_fields = ('title', 'description', 'country__name', 'city__name', 'hotel__name')
     date_hierarchy = 'start_date'
     raw_id_fields = ('hotel', 'main_image')
     inlines = [TourImageInline]
+    actions = ['export_csv', 'export_xlsx']
+    export_columns = TOUR_COLUMNS
+    export_name = 'tours'
 
-    @admin.display(description='Активен', boolean=True)
+    def get_queryset(self, request):
+        # Тот же критерий, что и Tour.is_active(), но вычисленный в SQL и пригодный для сортировки
+        return super().get_queryset(request).annotate(is_active_flag=Case(
+            When(available_slots__gt=0, end_date__gte=date.today(), then=Value(True)),
+            default=Value(False), output_field=BooleanField(),
+        ))
+
+    @admin.display(description='Активен', boolean=True, ordering='is_active_flag')
     def is_tour_active(self, obj):
-        return obj.is_active()
+        return obj.is_active_flag
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск через тот же индекс FTS5, что и на сайте, вместо LIKE по связанным таблицам
+        match = fulltext.build_match_query(search_term) if fulltext.fts_available() else None
+        if not match:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=fulltext.matching_ids(match)), False
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(BookingServiceMixin, ExportMixin, LargeTableMixin, admin.ModelAdmin):
     list_display = ('user', 'tour', 'num_people', 'status', 'booking_date', 'get_total_cost')
+    list_select_related = ('user', 'tour')
     list_filter = ('status', 'booking_date')
     search_fields = ('user__username', 'tour__title')
     raw_id_fields = ('user', 'tour')
     date_hierarchy = 'booking_date'
+    actions = ['confirm_bookings', 'cancel_bookings', 'export_csv', 'export_xlsx']
+    export_columns = BOOKING_COLUMNS
+    export_name = 'bookings'
+
+    def get_queryset(self, request):
+        # Подзапрос, а не join: неиспользуемую аннотацию Django убирает из COUNT и date_hierarchy
+        price = Subquery(Tour.objects.filter(pk=OuterRef('tour_id')).values('price'))
+        return super().get_queryset(request).annotate(total_cost=ExpressionWrapper(
+            price * F('num_people'), output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
 
-    @admin.display(description='Общая стоимость')
+    @admin.display(description='Общая стоимость', ordering='total_cost')
     def get_total_cost(self, obj):
-        return obj.tour.price * obj.num_people
+        # SQLite возвращает вычисленное значение без выравнивания до копеек
+        return obj.total_cost.quantize(Decimal('0.01'))
+
+@admin.register(BookingHold)
+class BookingHoldAdmin(BookingServiceMixin, LargeTableMixin, admin.ModelAdmin):
+    list_display = ('user', 'tour', 'num_people', 'booking_date', 'hold_expires_at')
+    list_select_related = ('user', 'tour')
+    raw_id_fields = ('user', 'tour')
+    actions = ['confirm_bookings', 'cancel_bookings']
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableMixin, admin.ModelAdmin):
     list_display = ('user', 'tour', 'hotel', 'rating', 'created_at')
-    list_filter = ('rating', 'tour', 'hotel')
+    list_select_related = ('user', 'tour', 'hotel')
+    # В фильтрах только туры и отели, на которые есть отзывы, а не весь каталог
+    list_filter = ('rating', ('tour', admin.RelatedOnlyFieldListFilter), ('hotel', admin.RelatedOnlyFieldListFilter))
     search_fields = ('user__username', 'tour__title', 'hotel__name', 'text')
     raw_id_fields = ('user', 'tour', 'hotel')
 
 @admin.register(Promotion)
 class PromotionAdmin(admin.ModelAdmin):
-    list_display = ('title', 'start_date', 'end_date', 'get_is_active_display')
+    list_display = ('title', 'discount_percent', 'start_date', 'end_date', 'get_is_active_display')
     list_filter = ('start_date', 'end_date')
     search_fields = ('title', 'description')
     date_hierarchy = 'start_date'
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableMixin, admin.ModelAdmin):
     list_display = ('user', 'tour', 'added_at')
+    list_select_related = ('user', 'tour')
     list_filter = ('added_at',)
     search_fields = ('user__username', 'tour__title')
     raw_id_fields = ('user', 'tour')
@@ -0,0 +1,167 @@
+import hashlib
+import json
+from functools import wraps
+from datetime import date, datetime, time, timezone
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from .availability import month_grid
+from .caching import get_version
+from .favorites import add_favorite, remove_favorite, sync_favorites
+from .models import Tour
+from .pagination import InvalidCursor, get_page_size, page_url
+from .search import filter_tours, get_search_params, tour_paginator
+
+
+def _related(name, *columns):
+    return lambda tour: getattr(tour, name) and {c: getattr(getattr(tour, name), c) for c in columns}
+
+
+def _main_image(tour):
+    return tour.main_image and {'url': tour.main_image.image.url, 'caption': tour.main_image.caption}
+
+
+# Поля API: (колонки для only(), связи для select_related(), сериализатор)
+TOUR_FIELDS = {
+    'id': ((), (), lambda t: t.pk),
+    'title': (('title',), (), lambda t: t.title),
+    'price': (('price',), (), lambda t: str(t.price)),
+    'effective_price': (('effective_price',), (), lambda t: str(t.effective_price)),
+    'start_date': (('start_date',), (), lambda t: t.start_date.isoformat()),
+    'end_date': (('end_date',), (), lambda t: t.end_date.isoformat()),
+    'duration': (('duration',), (), lambda t: t.duration),
+    'available_slots': (('available_slots',), (), lambda t: t.available_slots),
+    'tour_type': (('tour_type',), (), lambda t: t.tour_type),
+    'rating': (('rating_avg', 'review_count'), (), lambda t: {'avg': t.rating_avg, 'count': t.review_count}),
+    'country': (('country__name',), ('country',), _related('country', 'id', 'name')),
+    'city': (('city__name',), ('city',), _related('city', 'id', 'name')),
+    'hotel': (('hotel__name', 'hotel__stars'), ('hotel',), _related('hotel', 'id', 'name', 'stars')),
+    'main_image': (('main_image__image', 'main_image__caption'), ('main_image',), _main_image),
+}
+DEFAULT_TOUR_FIELDS = tuple(TOUR_FIELDS)
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    # Выдача зависит и от даты: вчерашние туры сегодня уже не активны
+    changed = datetime.fromtimestamp(get_version('catalog') / 1e9, tz=timezone.utc)
+    return max(changed, datetime.combine(date.today(), time.min, tzinfo=timezone.utc))
+
+
+def _catalog_etag(request, *args, **kwargs):
+    query = sorted((key, request.GET.getlist(key)) for key in request.GET)
+    raw = f"{get_version('catalog')}|{date.today().isoformat()}|{request.path}|{query}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+@require_GET
+@condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)
+def api_tours(request):
+    """Поиск туров в JSON с теми же фильтрами, что и search_results.
+
+    ETag и Last-Modified строятся по версии каталога без обращения к базе,
+    поэтому повторный запрос неизменившейся выдачи сразу получает 304.
+    Параметр fields=id,title,country ограничивает набор полей.
+    """
+    fields = [f for f in request.GET.get('fields', '').split(',') if f] or DEFAULT_TOUR_FIELDS
+    unknown = [f for f in fields if f not in TOUR_FIELDS]
+    if unknown:
+        return JsonResponse({'error': f"Неизвестные поля: {', '.join(unknown)}"}, status=400)
+
+    # Ключи сортировки нужны пагинатору в любом случае
+    columns = {'start_date', 'rating_avg', 'effective_price'}
+    related = set()
+    for name in fields:
+        field_columns, field_related, _ = TOUR_FIELDS[name]
+        columns.update(field_columns)
+        related.update(field_related)
+    tours = filter_tours(get_search_params(request.GET)).select_related(*related).only(*columns)
+    per_page = get_page_size(request, settings.TOURS_PAGE_SIZE, settings.TOURS_MAX_PAGE_SIZE)
+    paginator = tour_paginator(tours, request.GET.get('sort'), per_page)
+    try:
+        page = paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': "Некорректный курсор"}, status=400)
+
+    return JsonResponse(
+        {
+            'results': [{name: TOUR_FIELDS[name][2](tour) for name in fields} for tour in page],
+            'next': page_url(request, page.next_cursor) if page.has_next else None,
+            'previous': page_url(request, page.previous_cursor) if page.has_previous else None,
+        },
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+# Сколько месяцев календаря можно запросить за раз
+CALENDAR_MAX_MONTHS = 12
+
+
+@require_GET
+@condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)
+def api_calendar(request, country_id):
+    """Сетка месяцев с вылетами в страну: ?month=ГГГГ-ММ&months=N.
+
+    Данные берутся из предрасчитанного календаря одним чтением диапазона
+    по уникальному индексу (country, date).
+    """
+    try:
+        first_month = (datetime.strptime(request.GET['month'], '%Y-%m').date() if 'month' in request.GET
+                       else date.today().replace(day=1))
+        months = int(request.GET.get('months', 3))
+    except ValueError:
+        return JsonResponse({'error': "Ожидается month=ГГГГ-ММ и целое months"}, status=400)
+    if not 1 <= months <= CALENDAR_MAX_MONTHS:
+        return JsonResponse({'error': f"months должно быть от 1 до {CALENDAR_MAX_MONTHS}"}, status=400)
+
+    return JsonResponse(
+        {'country': country_id, 'months': month_grid(country_id, first_month, months)},
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def _favorites_response(ids, status=200):
+    return JsonResponse({'favorites': sorted(ids)}, status=status)
+
+
+def _require_login(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': "Войдите, чтобы добавлять туры в избранное"}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@require_POST
+@_require_login
+def api_favorite_add(request, tour_id):
+    if not Tour.objects.filter(pk=tour_id).exists():
+        return JsonResponse({'error': "Тур не найден"}, status=404)
+    return _favorites_response(add_favorite(request.user, tour_id))
+
+
+@require_POST
+@_require_login
+def api_favorite_remove(request, tour_id):
+    return _favorites_response(remove_favorite(request.user, tour_id))
+
+
+@require_POST
+@_require_login
+def api_favorites_sync(request):
+    """Пачка переключений избранного: {"add": [id, ...], "remove": [id, ...]}.
+
+    Нужна клиенту, который копит клики офлайн или на нескольких карточках
+    и отправляет их одним запросом. Отвечает итоговым списком избранного.
+    """
+    try:
+        payload = json.loads(request.body)
+        add = [int(pk) for pk in payload.get('add', [])]
+        remove = [int(pk) for pk in payload.get('remove', [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': "Ожидается JSON со списками id add и remove"}, status=400)
+    if len(add) + len(remove) > settings.TOURS_FAVORITES_SYNC_MAX:
+        return JsonResponse({'error': f"Не больше {settings.TOURS_FAVORITES_SYNC_MAX} изменений за запрос"}, status=400)
+    return _favorites_response(sync_favorites(request.user, add, remove))
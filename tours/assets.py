@@ -0,0 +1,154 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .renditions import RENDITIONS_DIR
+from .storage import BLOBS_DIR
+
+# Имя с хешем содержимого от ManifestStaticFilesStorage: app.3f2a9c1b7d4e.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# Один год — максимум, который имеет смысл по RFC 9111
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Заранее сжатые варианты в порядке предпочтения: (кодировка, расширение файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _etag(stat, suffix=''):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"'
+
+
+def _accepted(request, encoding):
+    accept = request.headers.get('Accept-Encoding', '')
+    return any(part.split(';')[0].strip() == encoding and not part.replace(' ', '').endswith(';q=0')
+               for part in accept.split(','))
+
+
+def _not_modified(request, etag, stat):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(','))
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and int(stat.st_mtime) <= since
+
+
+def _byte_range(request, etag, size):
+    """(начало, конец включительно) из заголовка Range; None — отдать файл целиком,
+    False — диапазон начинается за концом файла (416).
+
+    Поддерживается один диапазон: несколько диапазонов браузеры для медиа
+    не запрашивают, а multipart-ответ стоит дороже полного файла.
+    """
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # Некорректный диапазон заголовок не отменяет: Range игнорируется (RFC 9110, 14.2)
+        return None
+    if first == '':
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, root, path, cache_control):
+    """Отдает файл из root с ETag, условными запросами, Range и сжатыми вариантами."""
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    content_type, _ = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    # Диапазоны считаются по исходным байтам, поэтому с Range сжатый вариант не выбираем
+    served_path, encoding, suffix = full_path, None, ''
+    if 'Range' not in request.headers:
+        for name, ext in ENCODINGS:
+            if _accepted(request, name) and os.path.isfile(full_path + ext):
+                served_path, encoding, suffix = full_path + ext, name, ext
+                break
+
+    stat = os.stat(served_path)
+    etag = _etag(stat, suffix)
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Last-Modified': http_date(stat.st_mtime),
+               'Accept-Ranges': 'bytes', 'Vary': 'Accept-Encoding'}
+    if _not_modified(request, etag, stat):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = _byte_range(request, etag, stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(served_path, start, end - start + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = end - start + 1
+    elif request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = stat.st_size
+    else:
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type,
+                                filename=os.path.basename(full_path))
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+@require_safe
+def serve_static(request, path):
+    """Собранная статика: файлы с хешем в имени кэшируются навсегда, остальные перепроверяются."""
+    cache_control = IMMUTABLE if HASHED_NAME.search(path) else 'public, no-cache'
+    return serve_file(request, settings.STATIC_ROOT, path, cache_control)
+
+
+@require_safe
+def serve_media(request, path):
+    """Загруженные файлы. Блобы и их копии адресованы хешем и не меняются, остальное — по ETag."""
+    if path.startswith((f'{BLOBS_DIR}/', f'{RENDITIONS_DIR}/{BLOBS_DIR}/')):
+        cache_control = IMMUTABLE
+    else:
+        cache_control = f'public, max-age={settings.TOURS_MEDIA_MAX_AGE}'
+    return serve_file(request, settings.MEDIA_ROOT, path, cache_control)
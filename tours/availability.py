@@ -0,0 +1,86 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+
+from .models import AvailabilityDay, Tour
+
+
+def _aggregate(tours):
+    return (tours.filter(available_slots__gt=0, country__isnull=False).order_by()
+            .values_list('country_id', 'start_date')
+            .annotate(departures=Count('id'), min_price=Min('price'), free_slots=Sum('available_slots')))
+
+
+def refresh_availability(cells):
+    """Пересчитывает ячейки календаря (country_id, date) по текущим турам.
+
+    На страну — один агрегирующий запрос по частичному индексу
+    (country, start_date), одна вставка с обновлением при конфликте
+    и удаление опустевших ячеек.
+    """
+    by_country = defaultdict(set)
+    for country_id, day in cells:
+        if country_id is not None and day is not None:
+            by_country[country_id].add(day)
+
+    with transaction.atomic():
+        for country_id, days in by_country.items():
+            rows = [AvailabilityDay(country_id=c, date=d, departures=n, min_price=p, free_slots=s)
+                    for c, d, n, p, s in _aggregate(Tour.objects.filter(country_id=country_id, start_date__in=days))]
+            if rows:
+                AvailabilityDay.objects.bulk_create(
+                    rows, update_conflicts=True, unique_fields=['country', 'date'],
+                    update_fields=['departures', 'min_price', 'free_slots'],
+                )
+            empty = days - {row.date for row in rows}
+            if empty:
+                AvailabilityDay.objects.filter(country_id=country_id, date__in=empty).delete()
+
+
+def tour_cells(tour_ids):
+    return set(Tour.objects.filter(pk__in=list(tour_ids)).values_list('country_id', 'start_date'))
+
+
+def refresh_tours(tour_ids):
+    """Пересчитывает ячейки, в которые попадают туры (после изменения мест)."""
+    refresh_availability(tour_cells(tour_ids))
+
+
+def rebuild_calendar(batch_size=5000):
+    """Полностью пересобирает календарь. Возвращает число ячеек."""
+    total = 0
+    with transaction.atomic():
+        AvailabilityDay.objects.all().delete()
+        batch = []
+        for c, d, n, p, s in _aggregate(Tour.objects.all()).iterator(chunk_size=batch_size):
+            batch.append(AvailabilityDay(country_id=c, date=d, departures=n, min_price=p, free_slots=s))
+            if len(batch) >= batch_size:
+                AvailabilityDay.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        AvailabilityDay.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def month_grid(country_id, first_month, months):
+    """Дни месяцев подряд начиная с first_month (date первого числа) одним запросом по диапазону."""
+    starts = [first_month]
+    for _ in range(months):
+        last = starts[-1]
+        starts.append(last.replace(year=last.year + last.month // 12, month=last.month % 12 + 1))
+    cells = {day: (departures, min_price, free_slots) for day, departures, min_price, free_slots in
+             AvailabilityDay.objects.filter(country_id=country_id, date__gte=starts[0], date__lt=starts[-1])
+             .values_list('date', 'departures', 'min_price', 'free_slots')}
+
+    grid = []
+    for start, end in zip(starts, starts[1:]):
+        days = []
+        for ordinal in range(start.toordinal(), end.toordinal()):
+            day = start.fromordinal(ordinal)
+            departures, min_price, free_slots = cells.get(day, (0, None, 0))
+            days.append({'date': day.isoformat(), 'departures': departures,
+                         'min_price': None if min_price is None else str(min_price), 'free_slots': free_slots})
+        grid.append({'month': start.strftime('%Y-%m'), 'days': days})
+    return grid
@@ -0,0 +1,194 @@
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .availability import refresh_tours
+from .caching import bump_version
+from .models import Booking, Tour
+
+
+class BookingError(Exception):
+    pass
+
+
+class NotEnoughSlots(BookingError):
+    pass
+
+
+class HoldExpired(BookingError):
+    pass
+
+
+# Повторы при занятой блокировке записи SQLite: число попыток и базовая пауза, секунды
+LOCK_RETRIES = 8
+LOCK_BACKOFF = 0.01
+
+
+def _with_lock_retry(func):
+    """Повторяет короткую транзакцию, если SQLite ответил «database is locked».
+
+    Повтор возможен только вне транзакции: внутри внешнего atomic (действие
+    админки, импорт) ошибка уже испортила всю транзакцию, и она пробрасывается сразу.
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return func()
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == LOCK_RETRIES - 1 or connection.in_atomic_block:
+                raise
+            time.sleep(LOCK_BACKOFF * 2 ** attempt * (1 + random.random()))
+
+
+def _bump_catalog():
+    # Из внешней транзакции (админка) версия каталога меняется только после ее коммита
+    transaction.on_commit(lambda: bump_version('catalog'))
+
+
+def reserve_slots(tour_id, num_people):
+    """Атомарно списывает места условным UPDATE; вызывать внутри транзакции."""
+    updated = (Tour.objects.filter(pk=tour_id, available_slots__gte=num_people)
+               .update(available_slots=F('available_slots') - num_people))
+    if not updated:
+        if not Tour.objects.filter(pk=tour_id).exists():
+            raise Tour.DoesNotExist(f"Тур {tour_id} не найден")
+        raise NotEnoughSlots(f"Недостаточно свободных мест в туре {tour_id}")
+
+
+def book_tour(user, tour_id, num_people, status='pending', **fields):
+    """Бронирует места в туре без гонок.
+
+    Проверка и списание мест — один UPDATE с условием available_slots >= N,
+    поэтому параллельные брони не могут продать места дважды. Транзакция
+    короткая (UPDATE + INSERT), блокировку записи SQLite берет сразу при
+    BEGIN (transaction_mode IMMEDIATE) и при конфликте повторяется с паузой.
+    """
+    if num_people < 1:
+        raise BookingError("Количество человек должно быть положительным")
+    if status == 'cancelled':
+        raise BookingError("Нельзя создать отмененное бронирование")
+
+    def attempt():
+        with transaction.atomic():
+            reserve_slots(tour_id, num_people)
+            booking = Booking.objects.create(user=user, tour_id=tour_id, num_people=num_people, status=status, **fields)
+            refresh_tours([tour_id])
+            return booking
+
+    return _with_lock_retry(attempt)
+
+
+def cancel_booking(booking):
+    """Отменяет бронь и возвращает места. Повторная отмена ничего не делает."""
+    def attempt():
+        with transaction.atomic():
+            cancelled = (Booking.objects.filter(pk=booking.pk).exclude(status='cancelled')
+                         .update(status='cancelled', updated_at=timezone.now()))
+            if cancelled:
+                Tour.objects.filter(pk=booking.tour_id).update(
+                    available_slots=F('available_slots') + booking.num_people,
+                    booking_count=F('booking_count') - 1,
+                )
+                refresh_tours([booking.tour_id])
+            return bool(cancelled)
+
+    cancelled = _with_lock_retry(attempt)
+    if cancelled:
+        booking.status = 'cancelled'
+        booking._counted_tour_id = None
+        _bump_catalog()
+    return cancelled
+
+
+def hold_slots(user, tour_id, num_people, minutes=None):
+    """Удерживает места на время оплаты: неподтвержденная бронь со сроком действия."""
+    minutes = settings.BOOKING_HOLD_MINUTES if minutes is None else minutes
+    return book_tour(user, tour_id, num_people, status='pending',
+                     hold_expires_at=timezone.now() + timedelta(minutes=minutes))
+
+
+def confirm_hold(booking):
+    """Подтверждает удержание, если оно еще не истекло."""
+    confirmed = _with_lock_retry(lambda: Booking.objects.filter(
+        pk=booking.pk, status='pending', hold_expires_at__gt=timezone.now(),
+    ).update(status='confirmed', hold_expires_at=None, updated_at=timezone.now()))
+    if not confirmed:
+        raise HoldExpired(f"Удержание брони {booking.pk} истекло или уже обработано")
+    booking.status, booking.hold_expires_at = 'confirmed', None
+    _bump_catalog()
+
+
+def confirm_booking(booking):
+    """Подтверждает бронь из админки: удержание — только пока оно не истекло."""
+    if booking.hold_expires_at is not None:
+        return confirm_hold(booking)
+    confirmed = _with_lock_retry(lambda: Booking.objects.filter(
+        pk=booking.pk, status='pending', hold_expires_at=None,
+    ).update(status='confirmed', updated_at=timezone.now()))
+    if not confirmed:
+        raise BookingError(f"Бронь {booking.pk} уже подтверждена или отменена")
+    booking.status = 'confirmed'
+    _bump_catalog()
+
+
+def release_hold(booking):
+    """Досрочно снимает удержание и возвращает места."""
+    return cancel_booking(booking)
+
+
+def _by_tour(totals):
+    return Case(*(When(pk=tour_id, then=Value(n)) for tour_id, n in totals.items()),
+                default=Value(0), output_field=IntegerField())
+
+
+def _expire_batch(now, batch_size):
+    """Снимает одну пачку удержаний. Возвращает (выбрано, снято)."""
+    with transaction.atomic():
+        holds = list(Booking.objects.filter(status='pending', hold_expires_at__lte=now)
+                     .order_by('hold_expires_at').values_list('pk', 'tour_id', 'num_people')[:batch_size])
+        if not holds:
+            return 0, 0
+        # UPDATE повторяет условие выборки: между ними бронь могли подтвердить или отменить,
+        # и места за нее возвращать уже нельзя
+        ids = [pk for pk, _, _ in holds]
+        cancelled = (Booking.objects.filter(pk__in=ids, status='pending', hold_expires_at__lte=now)
+                     .update(status='cancelled', hold_expires_at=None, updated_at=timezone.now()))
+        if cancelled < len(holds):
+            holds = Booking.objects.filter(pk__in=ids, status='cancelled', hold_expires_at=None).values_list(
+                'pk', 'tour_id', 'num_people')
+        people, counts = defaultdict(int), defaultdict(int)
+        for _, tour_id, num_people in holds:
+            people[tour_id] += num_people
+            counts[tour_id] += 1
+        if people:
+            Tour.objects.filter(pk__in=people).update(
+                available_slots=F('available_slots') + _by_tour(people),
+                booking_count=F('booking_count') - _by_tour(counts),
+            )
+            refresh_tours(people)
+        return len(ids), cancelled
+
+
+def expire_holds(batch_size=1000, now=None):
+    """Снимает истекшие удержания пачками.
+
+    На пачку — выборка по частичному индексу срока, один UPDATE броней,
+    один UPDATE туров с CASE по id и пересчет затронутых ячеек календаря,
+    без сохранения строк по одной.
+    Возвращает число снятых удержаний.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        selected, cancelled = _with_lock_retry(lambda: _expire_batch(now, batch_size))
+        total += cancelled
+        if selected < batch_size:
+            break
+    if total:
+        _bump_catalog()
+    return total
@@ -0,0 +1,84 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import format_html_join
+
+from .models import City, Country, Tour
+
+# Счетчики попаданий в кэш справочников этого процесса
+stats = Counter()
+
+# Локальная копия справочников процесса: имя -> (версия, данные)
+_local = {}
+
+
+def get_version(name):
+    """Текущая версия набора данных в общем кэше.
+
+    Версии хранятся без срока и поэтому должны лежать в кэше, общем для всех
+    процессов (см. CACHES в настройках); вытесненная версия просто создается заново.
+    """
+    key = f'tours:version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Делает устаревшими все закэшированные копии набора данных."""
+    cache.set(f'tours:version:{name}', time.time_ns(), None)
+    _local.pop(name, None)
+
+
+def build_reference_data():
+    countries = list(Country.objects.order_by('name').values_list('id', 'name'))
+    cities = list(City.objects.order_by('name').values_list('id', 'name', 'country_id'))
+    return {
+        'countries': countries,
+        'cities': cities,
+        'tour_types': list(Tour.TOUR_TYPES),
+        'country_options': format_html_join('', '<option value="{}">{}</option>', countries),
+        'city_options': format_html_join('', '<option value="{}">{}</option>', ((i, n) for i, n, _ in cities)),
+        'tour_type_options': format_html_join('', '<option value="{}">{}</option>', Tour.TOUR_TYPES),
+    }
+
+
+def get_reference_data():
+    """Страны, города и типы туров для выпадающих списков.
+
+    Сначала читается локальная копия процесса, затем общий кэш, и только
+    при промахе обоих — база. Копии сверяются по версии, которую сбрасывают
+    сигналы при изменении Country и City.
+    """
+    version = get_version('reference')
+    local = _local.get('reference')
+    if local is not None and local[0] == version:
+        stats['local_hits'] += 1
+        return local[1]
+
+    key = f'tours:reference:{version}'
+    data = cache.get(key)
+    if data is None:
+        stats['misses'] += 1
+        data = build_reference_data()
+        cache.set(key, data, settings.TOURS_REFERENCE_TIMEOUT)
+    else:
+        stats['shared_hits'] += 1
+    _local['reference'] = (version, data)
+    return data
+
+
+def reference_cache_stats():
+    """Попадания и промахи кэша справочников с долей попаданий."""
+    hits = stats['local_hits'] + stats['shared_hits']
+    total = hits + stats['misses']
+    return {
+        'local_hits': stats['local_hits'],
+        'shared_hits': stats['shared_hits'],
+        'misses': stats['misses'],
+        'hit_ratio': hits / total if total else None,
+    }
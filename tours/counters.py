@@ -0,0 +1,59 @@
+from django.db.models import Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Booking, Review, Tour
+
+
+def actual_booking_count():
+    """Подзапрос: число неотмененных броней тура по таблице Booking."""
+    counts = (Booking.objects.filter(tour=OuterRef('pk')).exclude(status='cancelled')
+              .order_by().values('tour').annotate(n=Count('id')).values('n'))
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def find_booking_count_drift():
+    """Туры, у которых счетчик разошелся с бронированиями: (id, сохранено, фактически)."""
+    return (Tour.objects.annotate(actual=actual_booking_count())
+            .exclude(booking_count=F('actual'))
+            .order_by('pk').values_list('pk', 'booking_count', 'actual'))
+
+
+def reconcile_booking_counts(batch_size=1000, dry_run=False):
+    """Пересчитывает расходящиеся счетчики пачками. Возвращает список расхождений."""
+    drift = list(find_booking_count_drift().iterator(chunk_size=batch_size))
+    if not dry_run:
+        fixed = [Tour(pk=pk, booking_count=actual) for pk, _, actual in drift]
+        Tour.objects.bulk_update(fixed, ['booking_count'], batch_size=batch_size)
+    return drift
+
+
+def actual_ratings(model):
+    """Подзапросы числа и суммы оценок объекта (Tour или Hotel) по таблице Review."""
+    reviews = Review.objects.filter(**{model._meta.model_name: OuterRef('pk')}).order_by().values(model._meta.model_name)
+    count = Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), Value(0))
+    total = Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), Value(0))
+    return count, total
+
+
+def find_rating_drift(model):
+    """Объекты с разошедшимися агрегатами: (id, число, сумма, средняя, факт. число, факт. сумма)."""
+    count, total = actual_ratings(model)
+    # Средняя проверяется по сохраненным числу и сумме, тем же выражением, что в RatedModel.add_ratings
+    expected_avg = Coalesce(Cast(F('rating_sum'), FloatField()) / NullIf(F('review_count'), Value(0)), Value(0.0))
+    return (model.objects.annotate(actual_count=count, actual_sum=total, expected_avg=expected_avg)
+            .filter(~Q(review_count=F('actual_count')) | ~Q(rating_sum=F('actual_sum')) |
+                    ~Q(rating_avg=F('expected_avg')))
+            .order_by('pk')
+            .values_list('pk', 'review_count', 'rating_sum', 'rating_avg', 'actual_count', 'actual_sum'))
+
+
+def recompute_ratings(model, batch_size=1000, dry_run=False):
+    """Пересчитывает агрегаты отзывов пачками. Возвращает список расхождений."""
+    drift = list(find_rating_drift(model).iterator(chunk_size=batch_size))
+    if not dry_run:
+        fixed = [
+            model(pk=pk, review_count=count, rating_sum=total, rating_avg=total / count if count else 0.0)
+            for pk, _, _, _, count, total in drift
+        ]
+        model.objects.bulk_update(fixed, ['review_count', 'rating_sum', 'rating_avg'], batch_size=batch_size)
+    return drift
@@ -0,0 +1,103 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from .caching import bump_version
+from .models import Hotel, Image, Tour
+from .renditions import RENDITIONS_DIR
+from .storage import content_hash
+from .uploads import STAGING_DIR
+
+# Таблицы галерей: (связующая модель, поле владельца)
+GALLERIES = ((Tour.images.through, 'tour_id'), (Hotel.images.through, 'hotel_id'))
+
+
+def _hash_file(path):
+    try:
+        with open(path, 'rb') as file:
+            return content_hash(file), os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+
+def scan_media(media_root=None, workers=8):
+    """{путь относительно MEDIA_ROOT: (хеш, размер)} для всех загруженных файлов.
+
+    Уменьшенные копии пропускаются: они строятся заново. Staging тоже:
+    там лежат загрузки, которые воркер еще не перенес в картинку. Хеширование идет
+    в потоках — hashlib отпускает GIL на больших буферах.
+    """
+    root = media_root or settings.MEDIA_ROOT
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == root:
+            dirnames[:] = [d for d in dirnames if d not in (RENDITIONS_DIR, STAGING_DIR)]
+        paths.extend(os.path.join(dirpath, name) for name in filenames if not name.endswith('.part'))
+    with ThreadPoolExecutor(workers) as pool:
+        hashed = pool.map(_hash_file, paths)
+    return {os.path.relpath(path, root).replace(os.sep, '/'): info for path, info in zip(paths, hashed) if info}
+
+
+def _merge(keeper, duplicates, keeper_name, digest):
+    """Переводит ссылки с дубликатов на keeper и удаляет дубликаты."""
+    Tour.objects.filter(main_image__in=duplicates).update(main_image=keeper)
+    for through, owner in GALLERIES:
+        owners = through.objects.filter(image_id__in=duplicates).values_list(owner, flat=True).distinct()
+        through.objects.bulk_create([through(**{owner: pk, 'image_id': keeper}) for pk in owners],
+                                    ignore_conflicts=True)
+        through.objects.filter(image_id__in=duplicates).delete()
+    # Строки с тем же файлом, что у keeper, делят с ним и копии — их удалять нельзя
+    Image.objects.filter(pk__in=duplicates, image=keeper_name).update(renditions={})
+    Image.objects.filter(pk__in=duplicates).delete()
+    Image.objects.filter(pk=keeper).update(content_hash=digest)
+
+
+def dedupe_images(dry_run=False, workers=8, media_root=None):
+    """Сливает картинки с одинаковым содержимым и удаляет лишние файлы.
+
+    Из каждой группы остается строка с меньшим id; галереи туров и отелей
+    и главные картинки туров переводятся на нее. Файлы, байты которых
+    совпадают с оставшимися картинками, удаляются. Файлы без строк и
+    с уникальным содержимым только попадают в отчет.
+    """
+    root = media_root or settings.MEDIA_ROOT
+    files = scan_media(root, workers)
+    groups, missing = defaultdict(list), []
+    for pk, name in Image.objects.order_by('pk').values_list('pk', 'image').iterator():
+        if name in files:
+            groups[files[name][0]].append((pk, name))
+        else:
+            missing.append(pk)
+
+    report = {'groups': 0, 'rows_removed': 0, 'files_removed': 0, 'bytes_reclaimed': 0,
+              'orphan_files': 0, 'orphan_bytes': 0, 'missing_files': len(missing)}
+    kept_names = set()
+    for digest, members in groups.items():
+        (keeper, keeper_name), duplicates = members[0], [pk for pk, _ in members[1:]]
+        kept_names.add(keeper_name)
+        if duplicates:
+            report['groups'] += 1
+            report['rows_removed'] += len(duplicates)
+            if not dry_run:
+                with transaction.atomic():
+                    _merge(keeper, duplicates, keeper_name, digest)
+        elif not dry_run:
+            Image.objects.filter(pk=keeper, content_hash__isnull=True).update(content_hash=digest)
+
+    for name, (digest, size) in files.items():
+        if name in kept_names:
+            continue
+        if digest in groups:
+            report['files_removed'] += 1
+            report['bytes_reclaimed'] += size
+            if not dry_run:
+                os.remove(os.path.join(root, name))
+        else:
+            report['orphan_files'] += 1
+            report['orphan_bytes'] += size
+    if report['groups'] and not dry_run:
+        bump_version('catalog')
+    return report
@@ -0,0 +1,191 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Строк, которые база отдает за одно обращение курсора
+CHUNK_SIZE = 2000
+
+# Колонки выгрузок: (заголовок, поле или выражение для values_list). Связанные
+# поля разрешаются join-ами в том же запросе, а не обращением к объектам
+BOOKING_COLUMNS = [
+    ('ID', 'id'),
+    ('Пользователь', 'user__username'),
+    ('Email', 'user__email'),
+    ('Тур', 'tour__title'),
+    ('Цена тура', 'tour__price'),
+    ('Количество человек', 'num_people'),
+    ('Общая стоимость', ExpressionWrapper(F('tour__price') * F('num_people'),
+                                          output_field=DecimalField(max_digits=12, decimal_places=2))),
+    ('Статус', 'status'),
+    ('Дата бронирования', 'booking_date'),
+]
+
+TOUR_COLUMNS = [
+    ('ID', 'id'),
+    ('Название', 'title'),
+    ('Страна', 'country__name'),
+    ('Город', 'city__name'),
+    ('Отель', 'hotel__name'),
+    ('Цена', 'price'),
+    ('Дата начала', 'start_date'),
+    ('Дата окончания', 'end_date'),
+    ('Свободных мест', 'available_slots'),
+    ('Тип тура', 'tour_type'),
+    ('Бронирований', 'booking_count'),
+    ('Средняя оценка', 'rating_avg'),
+]
+
+
+def export_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    """Кортежи значений колонок, читаемые из курсора пачками по chunk_size."""
+    return queryset.values_list(*(source for _, source in columns)).iterator(chunk_size=chunk_size)
+
+
+class _Pipe:
+    """Файл только для записи: накопленные байты забирает генератор ответа."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # Вычисленные в SQLite суммы приходят без выравнивания до копеек
+        return value.quantize(Decimal('0.01'))
+    return value
+
+
+def stream_csv(queryset, columns, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    # BOM — чтобы Excel сразу открыл UTF-8 с кириллицей
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow([title for title, _ in columns])
+    for i, row in enumerate(export_rows(queryset, columns, chunk_size), start=1):
+        writer.writerow([_cell_text(value) for value in row])
+        if i % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+# Символы, недопустимые в XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{_cell_text(value)}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(_cell_text(value))))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(queryset, columns, chunk_size=CHUNK_SIZE):
+    """Книга XLSX, собираемая на лету.
+
+    ZIP пишется в несикаемый поток, поэтому размеры записей уходят в
+    дескрипторы после данных, а лист сжимается по мере чтения строк.
+    Строки — inline-строки, без общей таблицы строк, которую пришлось бы
+    держать в памяти целиком.
+    """
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'.encode()
+            )
+            sheet.write(_xlsx_row(title for title, _ in columns).encode())
+            for i, row in enumerate(export_rows(queryset, columns, chunk_size), start=1):
+                sheet.write(_xlsx_row(row).encode())
+                if i % chunk_size == 0:
+                    yield pipe.drain()
+            sheet.write(b'</sheetData></worksheet>')
+        yield pipe.drain()
+    yield pipe.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def export_response(queryset, columns, name, fmt):
+    """Потоковый ответ с выгрузкой: память не зависит от числа строк."""
+    stream, content_type = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(stream(queryset, columns), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}-{date.today():%Y%m%d}.{fmt}"'
+    return response
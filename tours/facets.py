@@ -0,0 +1,100 @@
+import hashlib
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .caching import get_version
+from .search import filter_tours, normalize_params
+
+# Ценовые диапазоны фасета: (нижняя граница включительно, верхняя не включительно)
+PRICE_BUCKETS = [
+    (None, 50000),
+    (50000, 100000),
+    (100000, 150000),
+    (150000, 200000),
+    (200000, None),
+]
+
+FACETS = ('country', 'city', 'tour_type', 'price')
+
+
+def _bucket_expression():
+    whens = [When(effective_price__lt=upper, then=Value(i)) for i, (_, upper) in enumerate(PRICE_BUCKETS) if upper is not None]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def _price_match_expression(params):
+    bounds = {}
+    if params.get('min_price'):
+        bounds['effective_price__gte'] = params['min_price']
+    if params.get('max_price'):
+        bounds['effective_price__lte'] = params['max_price']
+    if not bounds:
+        return Value(1, output_field=IntegerField())
+    return Case(When(then=Value(1), **bounds), default=Value(0), output_field=IntegerField())
+
+
+def compute_facets(params):
+    """Считает все фасеты одним сгруппированным запросом.
+
+    Текст и даты применяются ко всем фасетам, а фильтр каждого фасета — ко всем,
+    кроме него самого. Группы (страна, город, тип, ценовой диапазон,
+    попадание в ценовой фильтр) затем раскладываются за один проход.
+    """
+    params = normalize_params(params)
+    base = filter_tours({name: params.get(name) for name in ('q', 'start_date', 'end_date')})
+    groups = (base.order_by()
+              .annotate(bucket=_bucket_expression(), price_ok=_price_match_expression(params))
+              .values_list('country_id', 'city_id', 'tour_type', 'bucket', 'price_ok')
+              .annotate(n=Count('id')))
+
+    selected_country = params.get('country')
+    selected_city = params.get('city')
+    selected_type = params.get('tour_type')
+    counts = {name: Counter() for name in FACETS}
+    for country_id, city_id, tour_type, bucket, price_ok, n in groups:
+        country_ok = selected_country is None or str(country_id) == selected_country
+        city_ok = selected_city is None or str(city_id) == selected_city
+        type_ok = selected_type is None or tour_type == selected_type
+        if city_ok and type_ok and price_ok:
+            counts['country'][country_id] += n
+        if country_ok and type_ok and price_ok:
+            counts['city'][city_id] += n
+        if country_ok and city_ok and price_ok:
+            counts['tour_type'][tour_type] += n
+        if country_ok and city_ok and type_ok:
+            counts['price'][bucket] += n
+    return {name: dict(counter) for name, counter in counts.items()}
+
+
+def _format_price(value):
+    return f"{value:,}".replace(',', ' ')
+
+
+def price_bucket_choices(counts):
+    """Диапазоны цен для фасета: (подпись, min_price, max_price, количество)."""
+    choices = []
+    for i, (lower, upper) in enumerate(PRICE_BUCKETS):
+        if lower is None:
+            label = f"до {_format_price(upper)}"
+        elif upper is None:
+            label = f"от {_format_price(lower)}"
+        else:
+            label = f"{_format_price(lower)} – {_format_price(upper)}"
+        max_price = str(Decimal(upper) - Decimal('0.01')) if upper is not None else ''
+        choices.append((label, '' if lower is None else str(lower), max_price, counts.get(i, 0)))
+    return choices
+
+
+def facet_cache_key(params):
+    key = repr((get_version('catalog'), date.today().isoformat(), sorted(normalize_params(params).items())))
+    return 'tours:facets:' + hashlib.md5(key.encode()).hexdigest()
+
+
+def get_facets(params):
+    """Фасеты из кэша по нормализованному набору фильтров."""
+    return cache.get_or_set(facet_cache_key(params), lambda: compute_facets(params), settings.TOURS_FACETS_TIMEOUT)
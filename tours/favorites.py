@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, Tour
+
+
+def _key(user_id):
+    return f'tours:favorites:{user_id}'
+
+
+def invalidate_favorites(user_id):
+    # Сбрасываем после коммита, иначе параллельный запрос успеет закэшировать старое состояние
+    transaction.on_commit(lambda: cache.delete(_key(user_id)))
+
+
+def _load(user_id):
+    return frozenset(Favorite.objects.filter(user_id=user_id).values_list('tour_id', flat=True))
+
+
+def get_favorite_ids(user):
+    """Множество id избранных туров пользователя: один запрос на промах кэша, дальше ни одного."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = _key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _load(user.pk)
+        cache.set(key, ids, settings.TOURS_FAVORITES_TIMEOUT)
+    return ids
+
+
+def sync_favorites(user, add=(), remove=()):
+    """Применяет пачку переключений одной транзакцией.
+
+    Добавление — вставка с игнорированием конфликтов по (user, tour), поэтому
+    повтор запроса и гонка двух вкладок безопасны. Несуществующие туры
+    пропускаются. Если тур есть в обоих списках, побеждает удаление.
+    Возвращает итоговое множество id избранных туров.
+    """
+    remove = set(remove)
+    add = set(add) - remove
+    with transaction.atomic():
+        if add:
+            existing = Tour.objects.filter(pk__in=add).values_list('pk', flat=True)
+            Favorite.objects.bulk_create([Favorite(user=user, tour_id=pk) for pk in existing], ignore_conflicts=True)
+        if remove:
+            Favorite.objects.filter(user=user, tour_id__in=remove).delete()
+        invalidate_favorites(user.pk)
+        return _load(user.pk)
+
+
+def add_favorite(user, tour_id):
+    return sync_favorites(user, add=[tour_id])
+
+
+def remove_favorite(user, tour_id):
+    return sync_favorites(user, remove=[tour_id])
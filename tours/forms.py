@@ -1,12 +1,21 @@
 from django import forms
-from .models import Tour, Image, Country, City, Hotel
+from django.conf import settings
+from django.core.validators import FileExtensionValidator
+from django.template.defaultfilters import filesizeformat
+from .models import Tour, Country, City, Hotel
+from .uploads import schedule_upload, stage_upload
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'webp', 'gif']
 
 
 class TourForm(forms.ModelForm):
-    new_main_image = forms.ImageField(required=False, label='Загрузить новое главное изображение')
+    # Обычное FileField: картинку декодирует и проверяет фоновый пул, а не запрос
+    new_main_image = forms.FileField(required=False, label='Загрузить новое главное изображение',
+                                     validators=[FileExtensionValidator(IMAGE_EXTENSIONS)],
+                                     widget=forms.ClearableFileInput(attrs={'accept': 'image/*'}))
 
     country = forms.ModelChoiceField(queryset=Country.objects.all().order_by('name'), label="Страна")
-    city = forms.ModelChoiceField(queryset=City.objects.all().order_by('name'), label="Город")
+    city = forms.ModelChoiceField(queryset=City.objects.select_related('country').order_by('name'), label="Город")
     hotel = forms.ModelChoiceField(queryset=Hotel.objects.all().order_by('name'), label="Отель", required=False)
 
     class Meta:
@@ -35,12 +44,12 @@ class TourForm(forms.ModelForm):
         if 'country' in self.data:
             try:
                 country_id = int(self.data.get('country'))
-                self.fields['city'].queryset = City.objects.filter(country_id=country_id).order_by('name')
+                self.fields['city'].queryset = City.objects.filter(country_id=country_id).select_related('country').order_by('name')
                 self.fields['hotel'].queryset = Hotel.objects.filter(country_id=country_id).order_by('name')
             except (ValueError, TypeError):
                 pass
         elif self.instance.pk:
-            self.fields['city'].queryset = City.objects.filter(country=self.instance.country).order_by('name')
+            self.fields['city'].queryset = City.objects.filter(country=self.instance.country).select_related('country').order_by('name')
             self.fields['hotel'].queryset = Hotel.objects.filter(country=self.instance.country).order_by('name')
         else:
             self.fields['city'].queryset = City.objects.none()
@@ -56,12 +65,32 @@ class TourForm(forms.ModelForm):
         if self.instance and self.instance.main_image:
             self.fields['main_image'].label = f"Текущее главное изображение: {self.instance.main_image.image.name}"
 
-    def clean(self):
-        cleaned_data = super().clean()
-        new_image_file = cleaned_data.get('new_main_image')
+    def clean_new_main_image(self):
+        upload = self.cleaned_data.get('new_main_image')
+        if upload and upload.size > settings.TOURS_UPLOAD_MAX_SIZE:
+            raise forms.ValidationError(
+                f"Файл слишком большой: максимум {filesizeformat(settings.TOURS_UPLOAD_MAX_SIZE)}.")
+        return upload
+
+    def save(self, commit=True):
+        """Сохраняет тур; новая картинка станет главной, когда ее обработает пул.
+
+        Файл переносится в staging сразу, а Image создается только после
+        коммита тура — откат не оставит лишних строк.
+        """
+        tour = super().save(commit=commit)
+        upload = self.cleaned_data.get('new_main_image')
+        if upload:
+            staged = stage_upload(upload)
+            if commit:
+                schedule_upload(staged, tour.pk)
+            else:
+                # Тур сохранит вызывающий код: загрузка встанет в очередь вместе с save_m2m()
+                save_m2m = self.save_m2m
 
-        if new_image_file:
-            image_obj = Image.objects.create(image=new_image_file)
-            cleaned_data['main_image'] = image_obj
+                def save_m2m_and_upload():
+                    save_m2m()
+                    schedule_upload(staged, self.instance.pk)
 
-        return cleaned_data
\ No newline at end of file
+                self.save_m2m = save_m2m_and_upload
+        return tour
\ No newline at end of file
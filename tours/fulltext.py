@@ -0,0 +1,94 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'tours_tour_fts'
+
+# Веса колонок для bm25: title, description, country, city, hotel
+FTS_WEIGHTS = (10.0, 1.0, 3.0, 3.0, 2.0)
+
+_INDEX_SELECT = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, country, city, hotel)
+    SELECT t.id, t.title, t.description, COALESCE(co.name, ''), COALESCE(ci.name, ''), COALESCE(h.name, '')
+    FROM tours_tour t
+    LEFT JOIN tours_country co ON co.id = t.country_id
+    LEFT JOIN tours_city ci ON ci.id = t.city_id
+    LEFT JOIN tours_hotel h ON h.id = t.hotel_id
+"""
+
+# Ограничение на число параметров в одном запросе
+_CHUNK = 500
+
+
+def fts_available():
+    """Полнотекстовый индекс есть только в SQLite (FTS5)."""
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Превращает пользовательский ввод в безопасный запрос FTS5.
+
+    Каждое слово ищется как префикс, все слова обязательны.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), _CHUNK):
+        yield ids[i:i + _CHUNK]
+
+
+def index_tours(tour_ids):
+    """Переиндексирует туры вместе с названиями страны, города и отеля."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(tour_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+            cursor.execute(f"{_INDEX_SELECT} WHERE t.id IN ({placeholders})", chunk)
+
+
+def remove_tours(tour_ids):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(tour_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+
+
+def rebuild_index(batch_size=10000):
+    """Полностью перестраивает индекс диапазонами id. Возвращает число туров."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute("SELECT MIN(id), MAX(id) FROM tours_tour")
+        low, high = cursor.fetchone()
+        if low is not None:
+            for start in range(low, high + 1, batch_size):
+                cursor.execute(f"{_INDEX_SELECT} WHERE t.id >= %s AND t.id < %s", [start, start + batch_size])
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def matching_ids(match):
+    """Подзапрос id туров, подходящих под запрос FTS5."""
+    return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+
+
+def rank_expression(match):
+    """Релевантность bm25: чем меньше значение, тем выше тур в выдаче."""
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    return RawSQL(
+        f"(SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = tours_tour.id)",
+        [match],
+        output_field=FloatField(),
+    )
@@ -0,0 +1,484 @@
+import io
+import random
+from contextlib import contextmanager
+from array import array
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.constants import OnConflict
+from PIL import Image as PILImage
+
+from . import fulltext
+from .availability import rebuild_calendar
+from .caching import bump_version
+from .models import (AvailabilityDay, Booking, City, Country, DailyOccupancy, DailySales, Favorite, Hotel, Image,
+                     Promotion, Review, RollupDirtyDay, Tour, User)
+from .pricing import reprice_tours
+from .rollups import rebuild_rollups
+
+# Направления в порядке популярности: первые получают заметно больше туров и отелей
+DESTINATIONS = {
+    "Турция": ["Анталия", "Стамбул", "Кемер", "Аланья", "Бодрум"],
+    "Египет": ["Шарм-эль-Шейх", "Хургада", "Каир", "Луксор", "Марса-Алам"],
+    "Таиланд": ["Бангкок", "Пхукет", "Самуи", "Чиангмай", "Паттайя"],
+    "ОАЭ": ["Дубай", "Абу-Даби"],
+    "Италия": ["Рим", "Венеция", "Флоренция", "Милан", "Неаполь"],
+    "Греция": ["Афины", "Салоники", "Родос", "Крит", "Корфу"],
+    "Испания": ["Барселона", "Мадрид", "Валенсия", "Севилья", "Малага"],
+    "Франция": ["Париж", "Ницца", "Марсель", "Лион", "Бордо"],
+    "Мальдивы": ["Мале"],
+    "Доминикана": ["Пунта-Кана"],
+}
+
+# Префикс имен сгенерированных пользователей: по нему их находит --flush
+USERNAME_PREFIX = 'gen_'
+
+FIRST_NAMES = ["Анна", "Сергей", "Елена", "Максим", "Дарья", "Николай", "Юлия", "Иван", "Ольга", "Павел",
+               "Мария", "Алексей", "Татьяна", "Дмитрий", "Наталья", "Андрей"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+              "Новиков", "Федоров", "Морозов", "Волков"]
+HOTEL_NAMES = ["Гранд", "Палас", "Ривьера", "Лагуна", "Марина", "Панорама", "Оазис", "Корал", "Империал", "Бриз"]
+SIGHTS = ["старый город", "набережную", "музеи", "рынки", "пляжи", "горы", "виноградники", "острова"]
+REVIEW_TEXTS = ["Все понравилось, обязательно вернемся.", "Хороший отель, но далеко от моря.",
+                "Отличная программа, гид все интересно рассказывал.", "Ожидали большего за эти деньги.",
+                "Чисто, уютно, вкусные завтраки.", "Перелет задержали, в остальном без нареканий."]
+
+TOUR_TYPE_WEIGHTS = {'beach': 30, 'excursion': 20, 'adventure': 8, 'ski': 6, 'cruise': 6, 'medical': 5,
+                     'business': 5, 'other': 3}
+STATUSES = ('pending', 'confirmed', 'cancelled', 'completed')
+PENDING, CONFIRMED, CANCELLED, COMPLETED = range(len(STATUSES))
+RATING_WEIGHTS = (3, 4, 10, 30, 53)
+
+# Вылеты: от DAYS_BEFORE дней назад до DAYS_AFTER дней вперед
+DAYS_BEFORE, DAYS_AFTER = 180, 365
+
+CHUNK_SIZE = 20000
+
+# Таблицы, которые заполняются вставками в обход ORM
+LOADED_MODELS = (User, Hotel, Tour, Tour.images.through, Booking, Review, Favorite, Promotion,
+                 Promotion.tours.through, Promotion.countries.through)
+
+# Таблицы в порядке очистки: сначала зависимые
+FLUSH_MODELS = (Favorite, Review, Booking, Promotion.tours.through, Promotion.countries.through, Promotion,
+                Tour.images.through, Tour, Hotel.images.through, Hotel, AvailabilityDay, DailySales,
+                DailyOccupancy, RollupDirtyDay)
+
+
+def skewed(rng, n, skew):
+    """Индекс от 0 до n - 1 с тяжелым хвостом: при skew > 1 малые индексы выпадают намного чаще."""
+    return int(n * rng.random() ** skew)
+
+
+def zipf_weights(n, exponent=1.0):
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def insert_rows(model, fields, rows, chunk_size=CHUNK_SIZE, ignore_conflicts=False):
+    """Вставляет кортежи executemany пачками по chunk_size, в обход ORM и сигналов.
+
+    Значения должны быть уже приведены к виду, который принимает драйвер.
+    Возвращает число вставленных строк.
+    """
+    ops = connection.ops
+    on_conflict = OnConflict.IGNORE if ignore_conflicts else None
+    columns = ', '.join(ops.quote_name(model._meta.get_field(name).column) for name in fields)
+    sql = (f"{ops.insert_statement(on_conflict=on_conflict)} {ops.quote_name(model._meta.db_table)} "
+           f"({columns}) VALUES ({', '.join(['%s'] * len(fields))}) "
+           f"{ops.on_conflict_suffix_sql([], on_conflict, [], [])}")
+    rows = iter(rows)
+    inserted = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return inserted
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, chunk)
+            inserted += len(chunk) if not ignore_conflicts else cursor.rowcount
+        if len(chunk) < chunk_size:
+            return inserted
+
+
+@contextmanager
+def bulk_load(models):
+    """Загрузка в SQLite без вторичных индексов и проверок внешних ключей на каждой строке.
+
+    Неуникальные индексы удаляются и создаются заново в конце: построить индекс одной
+    сортировкой в разы быстрее, чем обновлять его при каждой вставке.
+    Внешние ключи проверяются разом после загрузки, как в loaddata.
+    В других базах ничего не меняется.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                       f"AND tbl_name IN ({', '.join(['%s'] * len(tables))})", tables)
+        # Уникальные индексы остаются: на них держатся ON CONFLICT и проверка данных
+        indexes = [(name, sql) for name, sql in cursor.fetchall() if not sql.upper().startswith('CREATE UNIQUE')]
+        cursor.execute("PRAGMA cache_size")
+        cache_size = cursor.fetchone()[0]
+        # Кэш страниц побольше — на время загрузки и построения индексов
+        cursor.execute("PRAGMA cache_size = -262144")
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+    try:
+        with connection.constraint_checks_disabled():
+            yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+            cursor.execute(f"PRAGMA cache_size = {int(cache_size)}")
+    connection.check_constraints(table_names=tables)
+
+
+def flush():
+    """Удаляет каталог, брони, отзывы, избранное и сгенерированных пользователей.
+
+    Справочники стран и городов, картинки и остальные пользователи остаются.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in FLUSH_MODELS:
+            cursor.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+        # Диапазон вместо LIKE: '_' в LIKE — любой символ; '`' идет в ASCII сразу после '_'
+        username = connection.ops.quote_name(User._meta.get_field('username').column)
+        cursor.execute(f"DELETE FROM {connection.ops.quote_name(User._meta.db_table)} "
+                       f"WHERE {username} >= %s AND {username} < %s",
+                       [USERNAME_PREFIX, USERNAME_PREFIX[:-1] + '`'])
+    if fulltext.fts_available():
+        fulltext.rebuild_index()
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _picture(rng, index):
+    """Градиент в случайных цветах — достаточно, чтобы у картинок были разные байты."""
+    top = tuple(rng.randrange(256) for _ in range(3))
+    bottom = tuple(rng.randrange(256) for _ in range(3))
+    gradient = PILImage.linear_gradient('L').resize((800, 600))
+    picture = PILImage.composite(PILImage.new('RGB', (800, 600), top), PILImage.new('RGB', (800, 600), bottom),
+                                 gradient)
+    buffer = io.BytesIO()
+    picture.save(buffer, 'JPEG', quality=80)
+    return SimpleUploadedFile(f'generated_{index}.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class Generator:
+    """Синтетический каталог заданного размера, детерминированный по seed.
+
+    Сначала в компактных массивах разыгрываются места, брони и отзывы:
+    так счетчики туров и отелей известны до вставки и пишутся сразу.
+    Затем строки потоком уходят в insert_rows, а производные данные
+    (цены, полнотекстовый индекс, календарь, сводки) пересобираются
+    одним проходом каждая.
+    """
+
+    def __init__(self, tours, hotels=None, users=None, bookings=None, reviews=None, favorites=None,
+                 promotions=10, images=12, seed=0, skew=3.0, today=None, chunk_size=CHUNK_SIZE):
+        self.counts = {
+            'tours': tours,
+            'hotels': hotels if hotels is not None else max(1, tours // 20),
+            'users': users if users is not None else max(10, tours // 2),
+            'bookings': bookings if bookings is not None else tours * 5,
+            'reviews': reviews if reviews is not None else tours * 2,
+            'favorites': favorites if favorites is not None else tours * 2,
+            'promotions': promotions,
+            'images': max(1, images),
+        }
+        self.seed = seed
+        self.skew = skew
+        self.today = today or date.today()
+        self.chunk_size = chunk_size
+        # Время — наивное UTC: так его принимают и SQLite, и PostgreSQL, а от часов запуска данные не зависят
+        self.now = datetime.combine(self.today, time(12))
+        offsets = range(-DAYS_BEFORE, DAYS_AFTER + 60)
+        self.days = [connection.ops.adapt_datefield_value(self.today + timedelta(days=offset)) for offset in offsets]
+        self.midnights = [datetime.combine(self.today, time()) + timedelta(days=offset) for offset in offsets]
+        self.datetime = connection.ops.adapt_datetimefield_value
+
+    def rng(self, name):
+        # Свой генератор на каждую таблицу: изменение одного размера не меняет остальные данные
+        return random.Random(f'{self.seed}:{name}')
+
+    def day(self, offset):
+        return self.days[offset + DAYS_BEFORE]
+
+    def departure(self, offset):
+        return self.midnights[offset + DAYS_BEFORE]
+
+    def run(self, progress=None):
+        """Генерирует все таблицы. progress(таблица, строк) вызывается после каждой. Возвращает {таблица: строк}."""
+        progress = progress or (lambda name, rows: None)
+        # Справочники и пул картинок маленькие и идут через ORM, в отчет о вставке не входят
+        for name, step in [('countries/cities', self.reference), ('images', self.image_pool), ('plan', self.plan)]:
+            step()
+            progress(name, None)
+        report = {}
+        with bulk_load(LOADED_MODELS):
+            for name, step in [('users', self.users), ('hotels', self.hotels), ('tours', self.tours),
+                               ('tour_images', self.galleries), ('bookings', self.bookings),
+                               ('reviews', self.reviews), ('favorites', self.favorites),
+                               ('promotions', self.promotions)]:
+                report[name] = step()
+                progress(name, report[name])
+        progress('indexes', None)
+        return report
+
+    def reference(self):
+        countries, cities = [], []
+        for country_name, city_names in DESTINATIONS.items():
+            country, _ = Country.objects.get_or_create(name=country_name)
+            countries.append(country)
+            for city_name in city_names:
+                cities.append(City.objects.get_or_create(name=city_name, country=country)[0])
+        self.countries = countries
+        self.cities = [(city.pk, city.name, city.country_id) for city in cities]
+        self.city_weights = zipf_weights(len(cities), 0.8)
+
+    def image_pool(self):
+        rng = self.rng('images')
+        # Одинаковые байты дают ту же строку Image: повторный запуск картинки не плодит
+        self.images = [Image.from_upload(_picture(rng, i), caption=f"Фото {i + 1}").pk
+                       for i in range(self.counts['images'])]
+
+    def plan(self):
+        """Разыгрывает вылеты, вместимость, брони и отзывы; считает денормализованные поля."""
+        n_tours, n_hotels = self.counts['tours'], self.counts['hotels']
+        rng = self.rng('plan')
+        city_indexes = range(len(self.cities))
+        self.hotel_city = array('i', rng.choices(city_indexes, cum_weights=self.city_weights, k=n_hotels))
+        hotels_by_city = {}
+        for index, city in enumerate(self.hotel_city):
+            hotels_by_city.setdefault(city, []).append(index)
+        self.tour_city = array('i', rng.choices(city_indexes, cum_weights=self.city_weights, k=n_tours))
+        self.tour_hotel = array('i', [rng.choice(hotels_by_city[city]) if city in hotels_by_city else -1
+                                      for city in self.tour_city])
+        self.tour_start = array('h', [rng.randint(-DAYS_BEFORE, DAYS_AFTER) for _ in range(n_tours)])
+        self.tour_slots = array('i', [rng.choice((10, 12, 16, 20, 24, 30, 40)) for _ in range(n_tours)])
+
+        # Популярность не зависит от id и даты: ранг -> номер тура в случайной перестановке
+        self.popular_tours = array('i', range(n_tours))
+        rng.shuffle(self.popular_tours)
+        self.popular_hotels = array('i', range(n_hotels))
+        rng.shuffle(self.popular_hotels)
+
+        self.booking_count = array('i', [0]) * n_tours
+        people_weights = (40, 35, 15, 10)
+        n_bookings = self.counts['bookings']
+        self.booking_tour = array('i', [0]) * n_bookings
+        self.booking_people = array('b', rng.choices((1, 2, 3, 4), weights=people_weights, k=n_bookings))
+        self.booking_status = array('b', [0]) * n_bookings
+        slots = self.tour_slots
+        for i in range(n_bookings):
+            tour = self.popular_tours[skewed(rng, n_tours, self.skew)]
+            self.booking_tour[i] = tour
+            people = min(self.booking_people[i], slots[tour])
+            if not people or rng.random() < 0.08:
+                # Отказались сами или не хватило мест: бронь отменена и места не занимает
+                self.booking_status[i] = CANCELLED
+                continue
+            self.booking_people[i] = people
+            slots[tour] -= people
+            self.booking_count[tour] += 1
+            if self.tour_start[tour] < 0:
+                self.booking_status[i] = COMPLETED
+            else:
+                self.booking_status[i] = CONFIRMED if rng.random() < 0.7 else PENDING
+
+        # Отзывы: у популярных туров их на порядки больше, чем у остальных
+        n_reviews = self.counts['reviews']
+        self.review_target = array('i', [0]) * n_reviews
+        self.review_rating = array('b', rng.choices(range(1, 6), weights=RATING_WEIGHTS, k=n_reviews))
+        self.tour_reviews, self.tour_rating = array('i', [0]) * n_tours, array('i', [0]) * n_tours
+        self.hotel_reviews, self.hotel_rating = array('i', [0]) * n_hotels, array('i', [0]) * n_hotels
+        for i in range(n_reviews):
+            rating = self.review_rating[i]
+            if n_hotels and rng.random() < 0.2:
+                hotel = self.popular_hotels[skewed(rng, n_hotels, self.skew)]
+                # Отели кодируются отрицательными числами, чтобы хватило одного массива
+                self.review_target[i] = -1 - hotel
+                self.hotel_reviews[hotel] += 1
+                self.hotel_rating[hotel] += rating
+            else:
+                tour = self.popular_tours[skewed(rng, n_tours, self.skew + 1)]
+                self.review_target[i] = tour
+                self.tour_reviews[tour] += 1
+                self.tour_rating[tour] += rating
+
+    def users(self):
+        rng = self.rng('users')
+        self.first_user = _next_id(User)
+        joined = self.datetime(self.now - timedelta(days=DAYS_BEFORE))
+        password = f'{UNUSABLE_PASSWORD_PREFIX}generated'
+        rows = (
+            (self.first_user + i, password, False, f'{USERNAME_PREFIX}{self.first_user + i}',
+             rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f'{USERNAME_PREFIX}{self.first_user + i}@example.com',
+             False, True, joined, User.ROLE_CLIENT, joined)
+            for i in range(self.counts['users'])
+        )
+        return insert_rows(User, ['id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+                                  'is_staff', 'is_active', 'date_joined', 'role', 'date_registered'],
+                           rows, self.chunk_size)
+
+    def hotels(self):
+        rng = self.rng('hotels')
+        self.first_hotel = _next_id(Hotel)
+        self.hotel_names = []
+
+        def rows():
+            for i, city in enumerate(self.hotel_city):
+                city_id, city_name, country_id = self.cities[city]
+                name = f"{rng.choice(HOTEL_NAMES)} {city_name} {i + 1}"
+                self.hotel_names.append(name)
+                stars = rng.choices((2, 3, 4, 5), weights=(5, 30, 45, 20))[0]
+                count, total = self.hotel_reviews[i], self.hotel_rating[i]
+                yield (self.first_hotel + i, name, stars, f"ул. Приморская, {rng.randint(1, 200)}",
+                       f"Отель {stars}* в городе {city_name}.", country_id, city_id,
+                       count, total, total / count if count else 0.0)
+
+        return insert_rows(Hotel, ['id', 'name', 'stars', 'address', 'description', 'country', 'city',
+                                   'review_count', 'rating_sum', 'rating_avg'], rows(), self.chunk_size)
+
+    def tours(self):
+        rng = self.rng('tours')
+        self.first_tour = _next_id(Tour)
+        types = list(TOUR_TYPE_WEIGHTS)
+        type_weights = list(accumulate(TOUR_TYPE_WEIGHTS.values()))
+        labels = dict(Tour.TOUR_TYPES)
+        base_price = {country.pk: rng.randrange(40000, 150000, 1000) for country in self.countries}
+
+        def rows():
+            # Случайные столбцы разыгрываются пачкой: choices(k=...) в разы быстрее вызова на строку
+            for offset in range(0, self.counts['tours'], self.chunk_size):
+                size = min(self.chunk_size, self.counts['tours'] - offset)
+                tour_types = rng.choices(types, cum_weights=type_weights, k=size)
+                durations = rng.choices(range(3, 22), k=size)
+                sights = rng.choices(SIGHTS, k=2 * size)
+                images = rng.choices(self.images, k=size)
+                for j in range(size):
+                    i = offset + j
+                    city_id, city_name, country_id = self.cities[self.tour_city[i]]
+                    hotel, tour_type, duration, start = self.tour_hotel[i], tour_types[j], durations[j], self.tour_start[i]
+                    price = Decimal(int(base_price[country_id] * duration / 7 * rng.lognormvariate(0, 0.3)) // 100 * 100)
+                    stay = f", проживание в отеле {self.hotel_names[hotel]}" if hotel >= 0 else ""
+                    description = (f"{labels[tour_type]} в городе {city_name}: {duration} ночей{stay}. "
+                                   f"В программе {sights[2 * j]} и {sights[2 * j + 1]}.")
+                    count, total = self.tour_reviews[i], self.tour_rating[i]
+                    yield (self.first_tour + i, f"{labels[tour_type]}: {city_name}, {duration} ночей", country_id,
+                           city_id, self.first_hotel + hotel if hotel >= 0 else None, price, price,
+                           self.day(start), self.day(start + duration), duration, self.tour_slots[i], tour_type,
+                           description, images[j], self.booking_count[i], count, total,
+                           total / count if count else 0.0)
+
+        return insert_rows(Tour, ['id', 'title', 'country', 'city', 'hotel', 'price', 'effective_price',
+                                  'start_date', 'end_date', 'duration', 'available_slots', 'tour_type',
+                                  'description', 'main_image', 'booking_count', 'review_count', 'rating_sum',
+                                  'rating_avg'], rows(), self.chunk_size)
+
+    def galleries(self):
+        rng = self.rng('galleries')
+        pool = self.images
+
+        def rows():
+            for i in range(self.counts['tours']):
+                for image in rng.sample(pool, min(len(pool), rng.choice((0, 1, 2, 3)))):
+                    yield self.first_tour + i, image
+
+        return insert_rows(Tour.images.through, ['tour', 'image'], rows(), self.chunk_size)
+
+    def bookings(self):
+        rng = self.rng('bookings')
+        first_id, n_users = _next_id(Booking), self.counts['users']
+        now = self.now
+
+        def rows():
+            for i in range(self.counts['bookings']):
+                tour = self.booking_tour[i]
+                booked = self.departure(self.tour_start[tour]) - timedelta(seconds=int(86400 + rng.random() * 119 * 86400))
+                if booked > now:
+                    # Дальние вылеты бронируют заранее: бронь сделана за последние два месяца
+                    booked = now - timedelta(seconds=int(rng.random() * 60 * 86400))
+                booked = self.datetime(booked)
+                yield (first_id + i, self.first_user + int(rng.random() * n_users), self.first_tour + tour,
+                       self.booking_people[i], STATUSES[self.booking_status[i]], booked, booked)
+
+        return insert_rows(Booking, ['id', 'user', 'tour', 'num_people', 'status', 'booking_date', 'updated_at'],
+                           rows(), self.chunk_size)
+
+    def reviews(self):
+        rng = self.rng('reviews')
+        first_id, n_users = _next_id(Review), self.counts['users']
+
+        def rows():
+            for i in range(self.counts['reviews']):
+                target = self.review_target[i]
+                tour, hotel = (None, self.first_hotel - 1 - target) if target < 0 else (self.first_tour + target, None)
+                created = self.datetime(self.now - timedelta(seconds=int(rng.random() * DAYS_BEFORE * 86400)))
+                yield (first_id + i, self.first_user + int(rng.random() * n_users), tour, hotel,
+                       self.review_rating[i], rng.choice(REVIEW_TEXTS), created)
+
+        return insert_rows(Review, ['id', 'user', 'tour', 'hotel', 'rating', 'text', 'created_at'], rows(),
+                           self.chunk_size)
+
+    def favorites(self):
+        rng = self.rng('favorites')
+        n_tours, n_users = self.counts['tours'], self.counts['users']
+
+        def rows():
+            for _ in range(self.counts['favorites']):
+                added = self.datetime(self.now - timedelta(seconds=int(rng.random() * DAYS_BEFORE * 86400)))
+                # У активных пользователей избранного больше; повторы отбрасывает уникальный индекс
+                yield (self.first_user + skewed(rng, n_users, 2.0),
+                       self.first_tour + self.popular_tours[skewed(rng, n_tours, self.skew)], added)
+
+        return insert_rows(Favorite, ['user', 'tour', 'added_at'], rows(), self.chunk_size, ignore_conflicts=True)
+
+    def promotions(self):
+        rng = self.rng('promotions')
+        first_id, n_tours = _next_id(Promotion), self.counts['tours']
+        promotions, tour_links, country_links = [], set(), set()
+        for i in range(self.counts['promotions']):
+            # Большинство акций действует сейчас, остальные уже прошли или еще не начались
+            start = rng.choice((-rng.randint(0, 30), -rng.randint(60, 90), rng.randint(30, 90)))
+            end = start + rng.randint(10, 60) if start < -59 else max(start + 10, rng.randint(10, 60))
+            discount = rng.choice((5, 10, 15, 20, 25, 30))
+            promotions.append((first_id + i, f"Акция {i + 1}: скидка {discount}%",
+                               f"Скидка {discount}% на избранные направления.", self.day(start), self.day(end),
+                               discount))
+            for _ in range(rng.randint(1, 20)):
+                tour_links.add((first_id + i, self.first_tour + self.popular_tours[skewed(rng, n_tours, self.skew)]))
+            if rng.random() < 0.3:
+                country_links.add((first_id + i, rng.choice(self.countries).pk))
+        inserted = insert_rows(Promotion, ['id', 'title', 'description', 'start_date', 'end_date',
+                                           'discount_percent'], promotions, self.chunk_size)
+        insert_rows(Promotion.tours.through, ['promotion', 'tour'], sorted(tour_links), self.chunk_size)
+        insert_rows(Promotion.countries.through, ['promotion', 'country'], sorted(country_links), self.chunk_size)
+        return inserted
+
+
+def finish_generation(progress=None):
+    """Пересобирает то, что строки, вставленные в обход сигналов, не обновили сами."""
+    steps = [('prices', reprice_tours), ('calendar', rebuild_calendar), ('rollups', rebuild_rollups)]
+    if fulltext.fts_available():
+        steps.insert(1, ('search index', fulltext.rebuild_index))
+    for name, step in steps:
+        step()
+        if progress:
+            progress(name, None)
+    # Явные id в PostgreSQL не двигают последовательности — выравниваем их по данным
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), [User, Hotel, Tour, Booking, Review, Promotion])
+    if sequence_sql:
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    for name in ('catalog', 'reference', 'promotions'):
+        bump_version(name)
@@ -0,0 +1,295 @@
+import csv
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from . import fulltext
+from .availability import refresh_availability, refresh_tours, tour_cells
+from .booking import _by_tour
+from .caching import bump_version
+from .pricing import reprice_tours
+from .rollups import mark_tours_dirty
+from .models import Booking, City, Country, Hotel, Tour, User
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """Построчно читает CSV или JSONL, не загружая файл целиком: (номер строки, dict).
+
+    Битая строка JSONL не прерывает чтение: вместо dict приходит RowError,
+    и import_chunk отчитывается о ней как об обычной ошибочной строке.
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield line_no, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_no, _json_row(line)
+
+
+def _json_row(line):
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        return RowError(f"некорректный JSON: {e}")
+    if not isinstance(row, dict):
+        return RowError(f"ожидается JSON-объект, получено {type(row).__name__}")
+    return row
+
+
+def _required(row, name):
+    value = str(row.get(name) or '').strip()
+    if not value:
+        raise RowError(f"не заполнено поле {name}")
+    return value
+
+
+def _int(row, name, default=None):
+    value = str(row.get(name) or '').strip()
+    if not value and default is not None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RowError(f"{name}: ожидается целое число, получено {value!r}")
+
+
+def _decimal(row, name):
+    value = _required(row, name)
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise RowError(f"{name}: ожидается число, получено {value!r}")
+
+
+def _datetime(row, name):
+    """Момент времени ГГГГ-ММ-ДД[ ЧЧ:ММ[:СС]]; без пояса — в часовом поясе проекта, не в будущем."""
+    value = _required(row, name)
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"{name}: ожидается дата ГГГГ-ММ-ДД или ГГГГ-ММ-ДД ЧЧ:ММ, получено {value!r}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    if moment > timezone.now():
+        raise RowError(f"{name}: дата в будущем {value!r}")
+    return moment
+
+
+def _date(row, name):
+    value = _required(row, name)
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"{name}: ожидается дата ГГГГ-ММ-ДД, получено {value!r}")
+
+
+class Importer:
+    """Импорт одной модели пачками: проверка строк, затем запись в одной транзакции."""
+
+    model = None
+
+    def __init__(self):
+        self.countries = {name.lower(): pk for pk, name in Country.objects.values_list('pk', 'name')}
+        self.cities = {(country_id, name.lower()): pk
+                       for pk, name, country_id in City.objects.values_list('pk', 'name', 'country_id')}
+
+    def resolve_place(self, row):
+        country_name = _required(row, 'country')
+        country_id = self.countries.get(country_name.lower())
+        if country_id is None:
+            raise RowError(f"неизвестная страна {country_name!r}")
+        city_name = _required(row, 'city')
+        city_id = self.cities.get((country_id, city_name.lower()))
+        if city_id is None:
+            raise RowError(f"неизвестный город {city_name!r} в стране {country_name!r}")
+        return country_id, city_id
+
+    def import_chunk(self, rows):
+        """Проверяет и записывает пачку строк. Возвращает (записано, [(номер строки, ошибка)])."""
+        errors = [(line_no, str(row)) for line_no, row in rows if isinstance(row, RowError)]
+        rows = [(line_no, row) for line_no, row in rows if not isinstance(row, RowError)]
+        with transaction.atomic():
+            objects = []
+            for line_no, row in self.prepare(rows):
+                try:
+                    objects.append(self.build(row))
+                except RowError as e:
+                    errors.append((line_no, str(e)))
+            written = self.write(objects, errors) if objects else 0
+        return written, errors
+
+    def prepare(self, rows):
+        return rows
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def write(self, objects, errors):
+        raise NotImplementedError
+
+
+class HotelImporter(Importer):
+    model = Hotel
+    update_fields = ['name', 'stars', 'address', 'description', 'country', 'city']
+
+    def build(self, row):
+        country_id, city_id = self.resolve_place(row)
+        stars = _int(row, 'stars')
+        if not 1 <= stars <= 5:
+            raise RowError(f"stars: ожидается от 1 до 5, получено {stars}")
+        return Hotel(external_id=_required(row, 'external_id'), name=_required(row, 'name'), stars=stars,
+                     address=row.get('address') or '', description=row.get('description') or '',
+                     country_id=country_id, city_id=city_id)
+
+    def write(self, objects, errors):
+        Hotel.objects.bulk_create(objects, update_conflicts=True, unique_fields=['external_id'],
+                                  update_fields=self.update_fields)
+        # Название отеля хранится в индексе у каждого его тура
+        fulltext.index_tours(Tour.objects.filter(hotel__external_id__in=[h.external_id for h in objects])
+                             .values_list('id', flat=True))
+        return len(objects)
+
+
+class TourImporter(Importer):
+    model = Tour
+    # Свободные места задаются при создании; дальше их меняют только бронирования
+    update_fields = ['title', 'country', 'city', 'hotel', 'price', 'start_date', 'end_date', 'duration',
+                     'tour_type', 'description']
+    tour_types = {code for code, _ in Tour.TOUR_TYPES}
+
+    def __init__(self):
+        super().__init__()
+        self.hotels = {(city_id, name.lower()): pk
+                       for pk, name, city_id in Hotel.objects.values_list('pk', 'name', 'city_id')}
+
+    def build(self, row):
+        country_id, city_id = self.resolve_place(row)
+        hotel_id = None
+        if row.get('hotel'):
+            hotel_id = self.hotels.get((city_id, row['hotel'].strip().lower()))
+            if hotel_id is None:
+                raise RowError(f"неизвестный отель {row['hotel']!r} в городе {row['city']!r}")
+        start_date, end_date = _date(row, 'start_date'), _date(row, 'end_date')
+        if end_date < start_date:
+            raise RowError("end_date раньше start_date")
+        tour_type = (row.get('tour_type') or 'other').strip()
+        if tour_type not in self.tour_types:
+            raise RowError(f"неизвестный тип тура {tour_type!r}")
+        price = _decimal(row, 'price')
+        return Tour(
+            external_id=_required(row, 'external_id'), title=_required(row, 'title'),
+            country_id=country_id, city_id=city_id, hotel_id=hotel_id, price=price, effective_price=price,
+            start_date=start_date, end_date=end_date,
+            duration=_int(row, 'duration', default=(end_date - start_date).days),
+            available_slots=_int(row, 'available_slots'), tour_type=tour_type,
+            description=row.get('description') or '',
+        )
+
+    def write(self, objects, errors):
+        external_ids = [t.external_id for t in objects]
+        # Обновленные туры могли сменить страну или дату — старые ячейки календаря тоже пересчитываем
+        old_cells = set(Tour.objects.filter(external_id__in=external_ids).values_list('country_id', 'start_date'))
+        Tour.objects.bulk_create(objects, update_conflicts=True, unique_fields=['external_id'],
+                                 update_fields=self.update_fields)
+        ids = list(Tour.objects.filter(external_id__in=external_ids).values_list('pk', flat=True))
+        fulltext.index_tours(ids)
+        reprice_tours(ids)
+        refresh_availability(old_cells | tour_cells(ids))
+        mark_tours_dirty(ids, [day for _, day in old_cells])
+        return len(objects)
+
+
+class BookingImporter(Importer):
+    """Групповые брони: новые записи вставляются, уже загруженные пропускаются.
+
+    Места списываются одним UPDATE с CASE по турам; бронь, на которую
+    не хватает мест, отклоняется как ошибочная строка. Необязательная
+    колонка booking_date переносит дату исходной брони.
+    """
+
+    model = Booking
+    statuses = {code for code, _ in Booking.STATUS_CHOICES}
+
+    def prepare(self, rows):
+        refs = {str(row.get('tour') or '').strip() for _, row in rows}
+        usernames = {str(row.get('user') or '').strip() for _, row in rows}
+        external_ids = {str(row.get('external_id') or '').strip() for _, row in rows}
+        self.tours = {ref: [pk, slots] for pk, ref, slots in
+                      Tour.objects.filter(external_id__in=refs).values_list('pk', 'external_id', 'available_slots')}
+        self.users = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        self.existing = set(Booking.objects.filter(external_id__in=external_ids).values_list('external_id', flat=True))
+        return rows
+
+    def build(self, row):
+        external_id = _required(row, 'external_id')
+        if external_id in self.existing:
+            return None
+        tour = self.tours.get(_required(row, 'tour'))
+        if tour is None:
+            raise RowError(f"неизвестный тур {row['tour']!r}")
+        user_id = self.users.get(_required(row, 'user'))
+        if user_id is None:
+            raise RowError(f"неизвестный пользователь {row['user']!r}")
+        num_people = _int(row, 'num_people')
+        if num_people < 1:
+            raise RowError("num_people должно быть положительным")
+        status = (row.get('status') or 'pending').strip()
+        if status not in self.statuses:
+            raise RowError(f"неизвестный статус {status!r}")
+        if status != 'cancelled':
+            if tour[1] < num_people:
+                raise RowError(f"в туре {row['tour']!r} осталось мест: {tour[1]}")
+            tour[1] -= num_people
+        booking_date = _datetime(row, 'booking_date') if str(row.get('booking_date') or '').strip() else None
+        self.existing.add(external_id)
+        booking = Booking(external_id=external_id, tour_id=tour[0], user_id=user_id, num_people=num_people,
+                          status=status)
+        booking._imported_date = booking_date
+        return booking
+
+    def write(self, objects, errors):
+        objects = [b for b in objects if b is not None]
+        people, counts = defaultdict(int), defaultdict(int)
+        for booking in objects:
+            if booking.status != 'cancelled':
+                people[booking.tour_id] += booking.num_people
+                counts[booking.tour_id] += 1
+        dates = {b.external_id: b._imported_date for b in objects if b._imported_date}
+        Booking.objects.bulk_create(objects)
+        if dates:
+            # auto_now_add перезаписывает booking_date при вставке, исходные даты ставим отдельным UPDATE
+            Booking.objects.filter(external_id__in=dates).update(booking_date=Case(
+                *(When(external_id=ref, then=Value(moment)) for ref, moment in dates.items()),
+                output_field=DateTimeField(),
+            ))
+        if people:
+            Tour.objects.filter(pk__in=people).update(
+                available_slots=F('available_slots') - _by_tour(people),
+                booking_count=F('booking_count') + _by_tour(counts),
+            )
+            refresh_tours(people)
+        return len(objects)
+
+
+IMPORTERS = {
+    'hotel': HotelImporter,
+    'tour': TourImporter,
+    'booking': BookingImporter,
+}
+
+
+def finish_import():
+    """Сбрасывает кэши после записи в обход сигналов."""
+    bump_version('catalog')
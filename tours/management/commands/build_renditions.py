@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from tours.models import Image
+from tours.renditions import render_many
+
+
+class Command(BaseCommand):
+    help = "Строит уменьшенные WebP/JPEG копии картинок, у которых их еще нет, в пуле процессов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Число процессов")
+        parser.add_argument('--force', action='store_true', help="Перестроить и уже готовые копии")
+        parser.add_argument('--batch-size', type=int, default=500, help="Картинок в одном bulk_update")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        pending = [
+            (pk, name) for pk, name, renditions in
+            Image.objects.exclude(image='').order_by('pk').values_list('pk', 'image', 'renditions').iterator()
+            if options['force'] or renditions.get('source') != name
+        ]
+        done, failed, batch = 0, 0, []
+        for pk, name, result in render_many(pending, options['workers']):
+            if isinstance(result, Exception):
+                failed += 1
+                self.stderr.write(f"  #{pk} {name}: {result}")
+                continue
+            batch.append(Image(pk=pk, renditions=result))
+            if len(batch) >= options['batch_size']:
+                done += Image.objects.bulk_update(batch, ['renditions'])
+                batch = []
+        if batch:
+            done += Image.objects.bulk_update(batch, ['renditions'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Готово картинок: {done}, с ошибками: {failed} за {elapsed:.1f} с"))
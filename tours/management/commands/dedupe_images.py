@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from tours.dedupe import dedupe_images
+
+
+class Command(BaseCommand):
+    help = ("Находит в MEDIA_ROOT картинки с одинаковым содержимым, сливает их строки Image "
+            "вместе со ссылками туров и отелей и удаляет лишние файлы.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет сделано")
+        parser.add_argument('--workers', type=int, default=8, help="Потоков для хеширования файлов")
+
+    def handle(self, *args, **options):
+        report = dedupe_images(dry_run=options['dry_run'], workers=options['workers'])
+        action = "будет" if options['dry_run'] else "было"
+        self.stdout.write(f"Групп дубликатов: {report['groups']}, лишних строк Image: {report['rows_removed']}")
+        self.stdout.write(f"Файлов-дубликатов: {report['files_removed']} "
+                          f"({filesizeformat(report['bytes_reclaimed'])} {action} освобождено)")
+        if report['orphan_files']:
+            self.stdout.write(self.style.WARNING(
+                f"Файлов без строк Image: {report['orphan_files']} ({filesizeformat(report['orphan_bytes'])}), не тронуты"))
+        if report['missing_files']:
+            self.stdout.write(self.style.WARNING(f"Строк Image без файла: {report['missing_files']}"))
+        self.stdout.write(self.style.SUCCESS("Готово."))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from tours.uploads import collect_garbage
+
+
+class Command(BaseCommand):
+    help = ("Удаляет забытые файлы из staging и изображения, на которые не ссылаются "
+            "ни туры, ни отели. Запускайте по расписанию (например, раз в час).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет удалено")
+        parser.add_argument('--batch-size', type=int, default=500, help="Строк Image за одно удаление")
+        parser.add_argument('--max-age-hours', type=float,
+                            help="Не трогать то, что моложе (по умолчанию TOURS_UPLOAD_GRACE)")
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['max_age_hours']) if options['max_age_hours'] else None
+        report = collect_garbage(max_age=max_age, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        action = "будет удалено" if options['dry_run'] else "удалено"
+        self.stdout.write(f"Файлов staging {action}: {report['staged_files']} "
+                          f"({filesizeformat(report['staged_bytes'])})")
+        self.stdout.write(f"Изображений без ссылок {action}: {report['images']}, файлов: {report['image_files']}")
+        self.stdout.write(self.style.SUCCESS("Готово."))
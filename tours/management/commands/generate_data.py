@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tours.generate import Generator, finish_generation, flush
+
+
+class Command(BaseCommand):
+    help = ("Генерирует синтетический каталог для нагрузочных тестов: туры, отели, пользователей, "
+            "брони, отзывы, избранное и акции. Один и тот же --seed дает одни и те же данные.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tours', type=int, default=1000)
+        parser.add_argument('--hotels', type=int, help="По умолчанию — туров / 20")
+        parser.add_argument('--users', type=int, help="По умолчанию — туров / 2")
+        parser.add_argument('--bookings', type=int, help="По умолчанию — туров * 5")
+        parser.add_argument('--reviews', type=int, help="По умолчанию — туров * 2")
+        parser.add_argument('--favorites', type=int, help="По умолчанию — туров * 2 (повторы отбрасываются)")
+        parser.add_argument('--promotions', type=int, default=10)
+        parser.add_argument('--images', type=int, default=12, help="Картинок в пуле, общем для всех туров и отелей")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skew', type=float, default=3.0,
+                            help="Перекос популярности: чем больше, тем сильнее брони и отзывы "
+                                 "сосредоточены на немногих турах")
+        parser.add_argument('--chunk-size', type=int, default=20000, help="Строк в одной вставке")
+        parser.add_argument('--flush', action='store_true',
+                            help="Сначала удалить туры, отели, брони, отзывы, избранное, акции "
+                                 "и ранее сгенерированных пользователей")
+
+    def handle(self, *args, **options):
+        if options['tours'] < 1:
+            raise CommandError("--tours должно быть положительным")
+        if options['flush']:
+            flush()
+            self.stdout.write("Старые данные удалены.")
+
+        started = step_started = time.monotonic()
+        load_started = None
+
+        def progress(name, rows):
+            nonlocal step_started, load_started
+            now = time.monotonic()
+            elapsed = now - step_started
+            speed = f", {rows / elapsed:.0f} строк/с" if rows and elapsed else ""
+            self.stdout.write(f"  {name}: {rows if rows is not None else 'готово'} за {elapsed:.1f} с{speed}")
+            if name == 'plan':
+                load_started = now
+            step_started = now
+
+        generator = Generator(
+            options['tours'], hotels=options['hotels'], users=options['users'], bookings=options['bookings'],
+            reviews=options['reviews'], favorites=options['favorites'], promotions=options['promotions'],
+            images=options['images'], seed=options['seed'], skew=options['skew'], chunk_size=options['chunk_size'],
+        )
+        report = generator.run(progress)
+        # Скорость считается по самой загрузке вместе с построением индексов
+        loaded = time.monotonic() - load_started
+        rows = sum(report.values())
+        self.stdout.write(f"Вставлено строк: {rows} за {loaded:.1f} с, {rows / loaded:.0f} строк/с")
+        finish_generation(progress)
+        self.stdout.write(self.style.SUCCESS(f"Готово за {time.monotonic() - started:.1f} с."))
@@ -0,0 +1,64 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tours.importing import IMPORTERS, finish_import, read_rows
+
+
+class Command(BaseCommand):
+    help = ("Загружает отели, туры или бронирования из CSV/JSONL пачками. "
+            "Прогресс сохраняется в <файл>.progress, прерванный импорт продолжается с --resume.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="По умолчанию — по расширению файла")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true', help="Пропустить строки, уже записанные ранее")
+        parser.add_argument('--max-errors', type=int, default=100, help="Остановиться после стольких ошибок")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"Файл {path} не найден")
+        progress_path = f"{path}.progress"
+        done = 0
+        if options['resume'] and os.path.exists(progress_path):
+            with open(progress_path) as f:
+                done = int(f.read() or 0)
+            self.stdout.write(f"Продолжение с записи {done + 1}")
+
+        importer = IMPORTERS[options['model']]()
+        rows = islice(read_rows(path, options['format']), done, None)
+        written = failed = 0
+        started = time.monotonic()
+        try:
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                count, errors = importer.import_chunk(chunk)
+                written += count
+                done += len(chunk)
+                # Контрольная точка пишется только после коммита пачки
+                with open(progress_path, 'w') as f:
+                    f.write(str(done))
+                for line_no, message in errors:
+                    self.stderr.write(f"  строка {line_no}: {message}")
+                failed += len(errors)
+                if failed >= options['max_errors']:
+                    raise CommandError(f"Слишком много ошибок ({failed}), импорт остановлен. "
+                                       f"Обработано записей: {done}")
+        finally:
+            if written:
+                finish_import()
+
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Записано: {written}, с ошибками: {failed}, "
+            f"{done / elapsed if elapsed else 0:.0f} записей/с"
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tours.availability import rebuild_calendar
+from tours.caching import bump_version
+
+
+class Command(BaseCommand):
+    help = "Полностью пересобирает календарь вылетов по странам и датам."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Ячеек в одном INSERT")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = rebuild_calendar(batch_size=options['batch_size'])
+        bump_version('catalog')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Ячеек календаря: {total} за {elapsed:.1f} с"))
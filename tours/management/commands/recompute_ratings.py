@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from tours.counters import recompute_ratings
+from tours.models import Hotel, Tour
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает число отзывов и средние оценки туров и отелей по таблице Review."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Только показать расхождения")
+        parser.add_argument('--show', type=int, default=20, help="Сколько расхождений вывести")
+
+    def handle(self, *args, **options):
+        for model in (Tour, Hotel):
+            name = model._meta.verbose_name_plural
+            drift = recompute_ratings(model, batch_size=options['batch_size'], dry_run=options['dry_run'])
+            if not drift:
+                self.stdout.write(self.style.SUCCESS(f"{name}: расхождений нет."))
+                continue
+            for pk, count, total, avg, actual_count, actual_sum in drift[:options['show']]:
+                actual_avg = actual_sum / actual_count if actual_count else 0.0
+                self.stdout.write(f"  #{pk}: отзывов {count} -> {actual_count}, сумма оценок {total} -> {actual_sum}, "
+                                  f"средняя {avg:.2f} -> {actual_avg:.2f}")
+            action = "найдено" if options['dry_run'] else "исправлено"
+            self.stdout.write(self.style.WARNING(f"{name}: расхождений {action}: {len(drift)}"))
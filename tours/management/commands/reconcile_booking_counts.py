@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from tours.counters import reconcile_booking_counts
+
+
+class Command(BaseCommand):
+    help = "Сверяет Tour.booking_count с таблицей бронирований и исправляет расхождения."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Только показать расхождения")
+        parser.add_argument('--show', type=int, default=20, help="Сколько расхождений вывести")
+
+    def handle(self, *args, **options):
+        drift = reconcile_booking_counts(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Расхождений нет."))
+            return
+
+        for pk, stored, actual in drift[:options['show']]:
+            self.stdout.write(f"  Тур #{pk}: сохранено {stored}, фактически {actual}")
+        total = sum(abs(actual - stored) for _, stored, actual in drift)
+        action = "найдено" if options['dry_run'] else "исправлено"
+        self.stdout.write(self.style.WARNING(f"Туров с расхождением {action}: {len(drift)}, суммарный дрейф: {total}"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tours.caching import bump_version
+from tours.pricing import BATCH_SIZE, boundary_tour_ids, reprice_tours
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает цены туров со скидкой. Акции начинаются и заканчиваются по датам без правки "
+            "данных, поэтому команду запускают раз в сутки после полуночи с --boundaries.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boundaries', action='store_true',
+                            help="Только туры акций, которые начались сегодня или закончились вчера")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Туров в одном UPDATE")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        tour_ids = boundary_tour_ids() if options['boundaries'] else None
+        total = reprice_tours(tour_ids, batch_size=options['batch_size'])
+        if total:
+            bump_version('catalog')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано цен: {total} за {elapsed:.1f} с"))
@@ -0,0 +1,75 @@
+import multiprocessing
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from tours.booking import NotEnoughSlots, book_tour
+from tours.models import Booking, Tour, User
+
+
+def _worker(args):
+    tour_id, user_id, attempts, num_people = args
+    connections.close_all()  # у каждого процесса свое соединение с базой
+    user = User.objects.get(pk=user_id)
+    booked = rejected = 0
+    for _ in range(attempts):
+        try:
+            book_tour(user, tour_id, num_people)
+            booked += 1
+        except NotEnoughSlots:
+            rejected += 1
+    connections.close_all()
+    return booked, rejected
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест бронирования: несколько процессов одновременно бронируют "
+            "один тур, после чего проверяется, что места не ушли в минус и не потерялись.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--bookings', type=int, default=2000, help="Всего попыток брони")
+        parser.add_argument('--slots', type=int, default=500, help="Мест в тестовом туре")
+        parser.add_argument('--people', type=int, default=1, help="Человек в одной брони")
+        parser.add_argument('--keep', action='store_true', help="Не удалять тестовый тур")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError("Нужна файловая база: процессы не видят общую базу в памяти.")
+
+        slots, processes = options['slots'], options['processes']
+        user, _ = User.objects.get_or_create(username='stress_test_user')
+        tour = Tour.objects.create(
+            title='Нагрузочный тест бронирования', price=1, start_date=date.today() + timedelta(days=30),
+            end_date=date.today() + timedelta(days=37), duration=7, available_slots=slots, description='',
+        )
+        per_process, extra = divmod(options['bookings'], processes)
+        jobs = [(tour.pk, user.pk, per_process + (i < extra), options['people']) for i in range(processes)]
+
+        connections.close_all()
+        started = time.monotonic()
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            results = pool.map(_worker, jobs)
+        elapsed = time.monotonic() - started
+
+        booked = sum(b for b, _ in results)
+        rejected = sum(r for _, r in results)
+        tour.refresh_from_db()
+        sold = sum(Booking.objects.filter(tour=tour).values_list('num_people', flat=True))
+        self.stdout.write(f"Попыток: {booked + rejected}, забронировано: {booked}, отказов: {rejected}, "
+                          f"{(booked + rejected) / elapsed:.0f} попыток/с")
+        self.stdout.write(f"Мест: {slots}, продано: {sold}, осталось: {tour.available_slots}")
+
+        try:
+            if tour.available_slots < 0:
+                raise CommandError(f"Перебронирование: осталось {tour.available_slots} мест")
+            if sold != slots - tour.available_slots or sold != booked * options['people']:
+                raise CommandError("Потерянное обновление: проданные места не сходятся с остатком")
+            if tour.booking_count != booked:
+                raise CommandError(f"Счетчик бронирований {tour.booking_count} не равен {booked}")
+        finally:
+            if not options['keep']:
+                tour.delete()
+        self.stdout.write(self.style.SUCCESS("Перебронирования нет, места сходятся."))
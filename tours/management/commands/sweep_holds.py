@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tours.booking import expire_holds
+
+
+class Command(BaseCommand):
+    help = "Снимает истекшие удержания мест и возвращает места в туры."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Удержаний в одном UPDATE")
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно")
+        parser.add_argument('--interval', type=float, default=30, help="Пауза между проходами в режиме --loop, секунды")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            expired = expire_holds(batch_size=options['batch_size'])
+            if expired or not options['loop']:
+                self.stdout.write(f"Снято удержаний: {expired} за {time.monotonic() - started:.2f} с")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
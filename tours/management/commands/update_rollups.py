@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tours.rollups import CHUNK_DAYS, rebuild_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = ("Обновляет сводки продаж и загрузки по броням, измененным с прошлого запуска. "
+            "С --rebuild пересобирает их по всей истории диапазонами дат.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Полная пересборка вместо инкрементальной")
+        parser.add_argument('--chunk-days', type=int, default=CHUNK_DAYS, help="Дней в одной транзакции пересборки")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['rebuild']:
+            totals = rebuild_rollups(chunk_days=options['chunk_days'])
+            summary = f"строк продаж: {totals['sales']}, строк загрузки: {totals['occupancy']}"
+        else:
+            days = update_rollups()
+            if days['sales'] is None:
+                summary = "водяного знака не было, выполнена полная пересборка"
+            else:
+                summary = f"пересчитано дней продаж: {days['sales']}, дней загрузки: {days['occupancy']}"
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Сводки обновлены: {summary} за {elapsed:.1f} с"))
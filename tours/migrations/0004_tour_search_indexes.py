@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0003_alter_promotion_options_alter_tour_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['start_date', 'id'], name='tour_search_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['country', 'start_date'], name='tour_search_country_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['city', 'start_date'], name='tour_search_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['tour_type', 'start_date'], name='tour_search_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['price', 'start_date'], name='tour_search_price_idx'),
+        ),
+    ]
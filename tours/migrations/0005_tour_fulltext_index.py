@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:30
+
+from django.db import migrations
+
+CREATE_FTS = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tours_tour_fts USING fts5(
+        title, description, country, city, hotel,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+POPULATE_FTS = """
+    INSERT INTO tours_tour_fts (rowid, title, description, country, city, hotel)
+    SELECT t.id, t.title, t.description, COALESCE(co.name, ''), COALESCE(ci.name, ''), COALESCE(h.name, '')
+    FROM tours_tour t
+    LEFT JOIN tours_country co ON co.id = t.country_id
+    LEFT JOIN tours_city ci ON ci.id = t.city_id
+    LEFT JOIN tours_hotel h ON h.id = t.hotel_id
+"""
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_FTS)
+    schema_editor.execute(POPULATE_FTS)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS tours_tour_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0004_tour_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_bookings(apps, schema_editor):
+    Tour = apps.get_model('tours', 'Tour')
+    Booking = apps.get_model('tours', 'Booking')
+    counts = (Booking.objects.filter(tour=OuterRef('pk')).exclude(status='cancelled')
+              .order_by().values('tour').annotate(n=Count('id')).values('n'))
+    Tour.objects.update(booking_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0005_tour_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='booking_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число бронирований'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['-booking_count', '-start_date'], name='tour_popular_idx'),
+        ),
+        migrations.RunPython(count_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:40
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def aggregate_reviews(apps, schema_editor):
+    Review = apps.get_model('tours', 'Review')
+    for model_name in ('tour', 'hotel'):
+        model = apps.get_model('tours', model_name)
+        reviews = Review.objects.filter(**{model_name: OuterRef('pk')}).order_by().values(model_name)
+        model.objects.update(
+            review_count=Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), Value(0)),
+            rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), Value(0)),
+            rating_avg=Coalesce(Subquery(reviews.annotate(a=Avg('rating')).values('a')), Value(0.0),
+                                output_field=FloatField()),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0006_tour_booking_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число отзывов'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число отзывов'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['-rating_avg', '-id'], name='tour_rating_idx'),
+        ),
+        migrations.RunPython(aggregate_reviews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0007_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['tour', '-booking_date'], name='booking_tour_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['tour', '-created_at', '-id'], name='review_tour_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0008_recent_reviews_bookings_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingHold',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Удержание мест',
+                'verbose_name_plural': 'Удержания мест',
+                'ordering': ['hold_expires_at'],
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('tours.booking',),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Удерживается до'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('hold_expires_at__isnull', False), ('status', 'pending')), fields=['hold_expires_at'], name='booking_hold_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0009_booking_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Внешний идентификатор'),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Внешний идентификатор'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Внешний идентификатор'),
+        ),
+    ]
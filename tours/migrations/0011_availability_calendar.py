@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fill_calendar(apps, schema_editor):
+    Tour = apps.get_model('tours', 'Tour')
+    AvailabilityDay = apps.get_model('tours', 'AvailabilityDay')
+    cells = (Tour.objects.filter(available_slots__gt=0, country__isnull=False).order_by()
+             .values_list('country_id', 'start_date')
+             .annotate(departures=Count('id'), min_price=Min('price'), free_slots=Sum('available_slots')))
+    AvailabilityDay.objects.bulk_create(
+        (AvailabilityDay(country_id=c, date=d, departures=n, min_price=p, free_slots=s) for c, d, n, p, s in cells),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0010_external_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата вылета')),
+                ('departures', models.PositiveIntegerField(verbose_name='Число вылетов')),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Минимальная цена')),
+                ('free_slots', models.PositiveIntegerField(verbose_name='Свободных мест')),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='tours.country', verbose_name='Страна')),
+            ],
+            options={
+                'verbose_name': 'День календаря',
+                'verbose_name_plural': 'Календарь вылетов',
+                'ordering': ['country', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('country', 'date'), name='availability_country_date_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_calendar, migrations.RunPython.noop),
+    ]
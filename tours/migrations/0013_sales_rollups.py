@@ -0,0 +1,74 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0012_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменено'),
+        ),
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sales', 'Продажи'), ('occupancy', 'Загрузка')], max_length=20)),
+                ('day', models.DateField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'day'), name='rollup_dirty_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Дата вылета')),
+                ('tour_type', models.CharField(choices=[('beach', 'Пляжный отдых'), ('excursion', 'Экскурсионный'), ('adventure', 'Приключения'), ('ski', 'Горнолыжный'), ('cruise', 'Круиз'), ('medical', 'Оздоровительный'), ('business', 'Деловой'), ('other', 'Другое')], max_length=50, verbose_name='Тип тура')),
+                ('departures', models.PositiveIntegerField(verbose_name='Туров')),
+                ('seats_booked', models.PositiveIntegerField(verbose_name='Мест продано')),
+                ('seats_free', models.PositiveIntegerField(verbose_name='Мест свободно')),
+                ('country', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tours.country', verbose_name='Страна')),
+            ],
+            options={
+                'verbose_name': 'Загрузка за день',
+                'verbose_name_plural': 'Загрузка по дням',
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day', 'country', 'tour_type'], name='daily_occupancy_day_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('tour_type', models.CharField(choices=[('beach', 'Пляжный отдых'), ('excursion', 'Экскурсионный'), ('adventure', 'Приключения'), ('ski', 'Горнолыжный'), ('cruise', 'Круиз'), ('medical', 'Оздоровительный'), ('business', 'Деловой'), ('other', 'Другое')], max_length=50, verbose_name='Тип тура')),
+                ('bookings', models.PositiveIntegerField(verbose_name='Бронирований')),
+                ('people', models.PositiveIntegerField(verbose_name='Туристов')),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Выручка')),
+                ('country', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tours.country', verbose_name='Страна')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day', 'country', 'tour_type'], name='daily_sales_day_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:30
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_effective_prices(apps, schema_editor):
+    # Существующие акции без скидки, поэтому цена со скидкой равна базовой
+    Tour = apps.get_model('tours', 'Tour')
+    Tour.objects.update(effective_price=F('price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0014_promotion_window_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotion',
+            name='discount_percent',
+            field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(100)], verbose_name='Скидка, %'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Цена со скидкой'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_effective_prices, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='tour',
+            name='tour_search_price_idx',
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['effective_price', 'id'], name='tour_search_price_idx'),
+        ),
+    ]
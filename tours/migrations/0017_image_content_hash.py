@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:30
+
+import tours.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tours', '0016_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Хеш содержимого'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(storage=tours.storage.ContentAddressedStorage(), upload_to='tour_images/', verbose_name='Файл изображения'),
+        ),
+    ]
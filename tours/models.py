@@ -2,7 +2,13 @@ from datetime import date
 
 from django.contrib import admin
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .storage import ContentAddressedStorage, content_hash
 
 
 class User(AbstractUser):
@@ -60,7 +66,50 @@ class City(models.Model):
         return f"{self.name}, {self.country.name}"
 
 
-class Hotel(models.Model):
+class DenormalizedModel(models.Model):
+    """Модель с денормализованными полями, которые меняются только атомарными UPDATE."""
+
+    DENORMALIZED_FIELDS = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # Обычное сохранение не должно затирать счетчики устаревшими значениями из памяти
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class RatedModel(DenormalizedModel):
+    """Агрегаты отзывов, которые поддерживает Review при каждом изменении."""
+
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Число отзывов")
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Сумма оценок")
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name="Средняя оценка")
+
+    DENORMALIZED_FIELDS = ('review_count', 'rating_sum', 'rating_avg')
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def add_ratings(cls, pk, count, total):
+        """Добавляет count оценок с суммой total (отрицательные значения — удаление)."""
+        # Правые части UPDATE вычисляются по старым значениям строки
+        new_count = F('review_count') + count
+        new_sum = F('rating_sum') + total
+        cls.objects.filter(pk=pk).update(
+            review_count=new_count,
+            rating_sum=new_sum,
+            rating_avg=Coalesce(Cast(new_sum, models.FloatField()) / NullIf(new_count, Value(0)), Value(0.0)),
+        )
+
+
+class Hotel(RatedModel):
     name = models.CharField(max_length=200, verbose_name="Название отеля")
     stars = models.IntegerField(choices=[(i, str(i)) for i in range(1, 6)], verbose_name="Количество звёзд")
     address = models.CharField(max_length=255, verbose_name="Адрес")
@@ -69,6 +118,8 @@ class Hotel(models.Model):
     city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Город")
     images = models.ManyToManyField('Image', blank=True,
                                     verbose_name="Изображения отеля")  # <-- ЭТУ СТРОКУ НУЖНО ДОБАВИТЬ ОБРАТНО
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True,
+                                   verbose_name="Внешний идентификатор")
 
     class Meta:
         verbose_name = "Отель"
@@ -80,8 +131,15 @@ class Hotel(models.Model):
 
 
 class Image(models.Model):
-    image = models.ImageField(upload_to='tour_images/', verbose_name="Файл изображения")
+    image = models.ImageField(upload_to='tour_images/', storage=ContentAddressedStorage(),
+                              verbose_name="Файл изображения")
     caption = models.CharField(max_length=255, blank=True, verbose_name="Подпись")
+    # SHA-256 содержимого: одинаковые загрузки разрешаются в одну строку и один файл
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False,
+                                    verbose_name="Хеш содержимого")
+    # Уменьшенные копии: {'source': имя оригинала, 'webp': {ширина: имя файла}, 'jpeg': {...}}
+    renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Уменьшенные копии")
+    uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name="Загружено")
 
     class Meta:
         verbose_name = "Изображение"
@@ -90,8 +148,41 @@ class Image(models.Model):
     def __str__(self):
         return self.caption or self.image.name
 
-
-class Tour(models.Model):
+    def _new_file_hash(self):
+        # Хеш нужен только для только что загруженного, еще не записанного файла
+        if self.image and not self.image._committed:
+            return content_hash(self.image)
+        return None
+
+    def clean(self):
+        digest = self._new_file_hash()
+        if digest:
+            duplicate = Image.objects.filter(content_hash=digest).exclude(pk=self.pk).first()
+            if duplicate:
+                raise ValidationError({'image': f"Такое изображение уже загружено: #{duplicate.pk}"})
+
+    def save(self, *args, **kwargs):
+        digest = self._new_file_hash()
+        if digest:
+            self.content_hash = digest
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_upload(cls, upload, caption=''):
+        """Картинка с таким же содержимым, если она уже есть, иначе новая."""
+        digest = content_hash(upload)
+        existing = cls.objects.filter(content_hash=digest).first()
+        if existing is not None:
+            return existing
+        try:
+            with transaction.atomic():
+                return cls.objects.create(image=upload, caption=caption, content_hash=digest)
+        except IntegrityError:
+            # Такую же картинку параллельно загрузил кто-то еще; файл у нас общий
+            return cls.objects.get(content_hash=digest)
+
+
+class Tour(RatedModel):
     TOUR_TYPES = [
         ('beach', 'Пляжный отдых'),
         ('excursion', 'Экскурсионный'),
@@ -117,19 +208,95 @@ class Tour(models.Model):
     main_image = models.ForeignKey(Image, on_delete=models.SET_NULL, null=True, blank=True,
                                    related_name='tours_main_image', verbose_name="Главное изображение")
     images = models.ManyToManyField(Image, blank=True, related_name='tours_gallery', verbose_name="Галерея изображений")
+    booking_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Число бронирований")
+    # Цена с учетом лучшей действующей скидки; пересчитывает tours.pricing
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, editable=False,
+                                          verbose_name="Цена со скидкой")
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True,
+                                   verbose_name="Внешний идентификатор")
+
+    DENORMALIZED_FIELDS = RatedModel.DENORMALIZED_FIELDS + ('booking_count', 'effective_price')
 
     class Meta:
         verbose_name = "Тур"
         verbose_name_plural = "Туры"
         ordering = ['start_date']
+        # Частичные индексы под фильтры поиска: в выдачу попадают только туры со свободными местами
+        indexes = [
+            models.Index(fields=['start_date', 'id'], name='tour_search_start_idx',
+                         condition=models.Q(available_slots__gt=0)),
+            models.Index(fields=['country', 'start_date'], name='tour_search_country_idx',
+                         condition=models.Q(available_slots__gt=0)),
+            models.Index(fields=['city', 'start_date'], name='tour_search_city_idx',
+                         condition=models.Q(available_slots__gt=0)),
+            models.Index(fields=['tour_type', 'start_date'], name='tour_search_type_idx',
+                         condition=models.Q(available_slots__gt=0)),
+            models.Index(fields=['effective_price', 'id'], name='tour_search_price_idx',
+                         condition=models.Q(available_slots__gt=0)),
+            models.Index(fields=['-booking_count', '-start_date'], name='tour_popular_idx',
+                         condition=models.Q(available_slots__gt=0)),
+            models.Index(fields=['-rating_avg', '-id'], name='tour_rating_idx',
+                         condition=models.Q(available_slots__gt=0)),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # До пересчета скидок новый тур продается по базовой цене
+        if self.effective_price is None:
+            self.effective_price = self.price
+        super().save(*args, **kwargs)
+
+    @property
+    def has_discount(self):
+        return self.effective_price is not None and self.effective_price < self.price
+
+    # Ячейка календаря (страна, дата вылета), в которой тур учтен в базе
+    _calendar_cell = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._calendar_cell = instance.calendar_cell()
+        return instance
+
+    def calendar_cell(self):
+        # При выборке через only() дата может быть отложена — не дочитываем ее ради календаря
+        if 'start_date' not in self.__dict__:
+            return None
+        return self.country_id, self.start_date
+
     def is_active(self):
         return self.available_slots > 0 and self.end_date >= date.today()
 
 
+class AvailabilityDay(models.Model):
+    """Предрасчитанная ячейка календаря: вылеты в страну в конкретный день.
+
+    Учитываются только туры со свободными местами. Ячейки пересчитывает
+    tours.availability при изменении туров и бронирований; пустых строк не хранится.
+    """
+
+    country = models.ForeignKey(Country, on_delete=models.CASCADE, related_name='availability',
+                                verbose_name="Страна")
+    date = models.DateField(verbose_name="Дата вылета")
+    departures = models.PositiveIntegerField(verbose_name="Число вылетов")
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Минимальная цена")
+    free_slots = models.PositiveIntegerField(verbose_name="Свободных мест")
+
+    class Meta:
+        verbose_name = "День календаря"
+        verbose_name_plural = "Календарь вылетов"
+        ordering = ['country', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['country', 'date'], name='availability_country_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: вылетов {self.departures}, мест {self.free_slots}"
+
+
 class Booking(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings', verbose_name="Пользователь")
     tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='bookings', verbose_name="Тур")
@@ -142,15 +309,131 @@ class Booking(models.Model):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
     booking_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата бронирования")
+    hold_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Удерживается до")
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True,
+                                   verbose_name="Внешний идентификатор")
+    # Массовые UPDATE в tours.booking выставляют его явно: auto_now работает только в save()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Изменено")
 
     class Meta:
         verbose_name = "Бронирование"
         verbose_name_plural = "Бронирования"
         ordering = ['-booking_date']
+        indexes = [
+            models.Index(fields=['tour', '-booking_date'], name='booking_tour_recent_idx'),
+            models.Index(fields=['-booking_date'], name='booking_date_idx'),
+            models.Index(fields=['hold_expires_at'], name='booking_hold_expiry_idx',
+                         condition=models.Q(status='pending', hold_expires_at__isnull=False)),
+        ]
 
     def __str__(self):
         return f"Бронирование {self.id} на тур '{self.tour.title}' от {self.user.username}"
 
+    # Тур, в счетчике booking_count которого учтена бронь в базе
+    _counted_tour_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted_tour_id = instance.counted_tour_id()
+        return instance
+
+    def counted_tour_id(self):
+        """Отмененные брони не входят в популярность тура."""
+        return None if self.status == 'cancelled' else self.tour_id
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            counted = self.counted_tour_id()
+            if counted != self._counted_tour_id:
+                if self._counted_tour_id is not None:
+                    Tour.objects.filter(pk=self._counted_tour_id).update(booking_count=F('booking_count') - 1)
+                if counted is not None:
+                    Tour.objects.filter(pk=counted).update(booking_count=F('booking_count') + 1)
+            self._counted_tour_id = counted
+
+
+class HoldManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(status='pending', hold_expires_at__isnull=False)
+
+
+class BookingHold(Booking):
+    """Временное удержание мест: неподтвержденная бронь со сроком действия."""
+
+    objects = HoldManager()
+
+    class Meta:
+        proxy = True
+        verbose_name = "Удержание мест"
+        verbose_name_plural = "Удержания мест"
+        ordering = ['hold_expires_at']
+
+
+class DailySales(models.Model):
+    """Продажи за день бронирования по стране и типу тура (без отмененных броней)."""
+
+    day = models.DateField(verbose_name="День")
+    country = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name="Страна")
+    tour_type = models.CharField(max_length=50, choices=Tour.TOUR_TYPES, verbose_name="Тип тура")
+    bookings = models.PositiveIntegerField(verbose_name="Бронирований")
+    people = models.PositiveIntegerField(verbose_name="Туристов")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Выручка")
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        ordering = ['day']
+        indexes = [
+            models.Index(fields=['day', 'country', 'tour_type'], name='daily_sales_day_idx'),
+        ]
+
+
+class DailyOccupancy(models.Model):
+    """Загрузка туров по дате вылета: проданные и свободные места."""
+
+    day = models.DateField(verbose_name="Дата вылета")
+    country = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name="Страна")
+    tour_type = models.CharField(max_length=50, choices=Tour.TOUR_TYPES, verbose_name="Тип тура")
+    departures = models.PositiveIntegerField(verbose_name="Туров")
+    seats_booked = models.PositiveIntegerField(verbose_name="Мест продано")
+    seats_free = models.PositiveIntegerField(verbose_name="Мест свободно")
+
+    class Meta:
+        verbose_name = "Загрузка за день"
+        verbose_name_plural = "Загрузка по дням"
+        ordering = ['day']
+        indexes = [
+            models.Index(fields=['day', 'country', 'tour_type'], name='daily_occupancy_day_idx'),
+        ]
+
+
+class RollupDirtyDay(models.Model):
+    """День, который нужно пересчитать: изменения, не видные по Booking.updated_at."""
+
+    SALES = 'sales'
+    OCCUPANCY = 'occupancy'
+    KIND_CHOICES = [(SALES, 'Продажи'), (OCCUPANCY, 'Загрузка')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'day'], name='rollup_dirty_day_uniq'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Момент, до которого изменения броней уже учтены в сводных таблицах."""
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
 
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews', verbose_name="Пользователь")
@@ -166,16 +449,47 @@ class Review(models.Model):
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tour', '-created_at', '-id'], name='review_tour_recent_idx'),
+            models.Index(fields=['-created_at'], name='review_created_idx'),
+        ]
 
     def __str__(self):
         return f"Отзыв на {self.tour.title if self.tour else self.hotel.name if self.hotel else 'неизвестно'}"
 
+    # Оценка, учтенная в агрегатах тура и отеля: (tour_id, hotel_id, rating)
+    _counted = (None, None, 0)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted = (instance.tour_id, instance.hotel_id, instance.rating)
+        return instance
+
+    def _apply_counted(self, counted, sign):
+        tour_id, hotel_id, rating = counted
+        if tour_id is not None:
+            Tour.add_ratings(tour_id, sign, sign * rating)
+        if hotel_id is not None:
+            Hotel.add_ratings(hotel_id, sign, sign * rating)
+
+    def save(self, *args, **kwargs):
+        counted = (self.tour_id, self.hotel_id, self.rating)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if counted != self._counted:
+                self._apply_counted(self._counted, -1)
+                self._apply_counted(counted, 1)
+        self._counted = counted
+
 
 class Promotion(models.Model):
     title = models.CharField(max_length=200, verbose_name="Название акции")
     description = models.TextField(verbose_name="Описание акции")
     start_date = models.DateField(verbose_name="Дата начала")
     end_date = models.DateField(verbose_name="Дата окончания")
+    discount_percent = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(100)],
+                                                        verbose_name="Скидка, %")
     tours = models.ManyToManyField(Tour, blank=True, related_name='promotions', verbose_name="Туры по акции")
     countries = models.ManyToManyField(Country, blank=True, related_name='promotions', verbose_name="Страны по акции")
 
@@ -183,6 +497,9 @@ class Promotion(models.Model):
         verbose_name = "Акция"
         verbose_name_plural = "Акции"
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='promotion_window_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -207,6 +524,9 @@ class Favorite(models.Model):
         verbose_name_plural = "Избранные туры"
         unique_together = ('user', 'tour')
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['-added_at'], name='favorite_added_idx'),
+        ]
 
     def __str__(self):
         return f"Тур '{self.tour.title}' в избранном у {self.user.username}"
@@ -0,0 +1,138 @@
+import base64
+from datetime import date
+
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    """Страница выдачи, открытая по курсору."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    """Пагинация по ключу (key, id) вместо OFFSET.
+
+    Каждая страница — это диапазонное чтение по индексу с LIMIT, поэтому
+    глубокие страницы стоят столько же, сколько первая.
+    """
+
+    def __init__(self, queryset, per_page, key='start_date', descending=False, parse_key=date.fromisoformat):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+        self.descending = descending
+        self.parse_key = parse_key
+
+    def encode_cursor(self, direction, obj):
+        raw = f"{direction}|{getattr(obj, self.key)}|{obj.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            direction, value, pk = raw.split('|')
+            if direction not in ('next', 'prev'):
+                raise ValueError(direction)
+            return direction, self.parse_key(value), int(pk)
+        except (ValueError, TypeError, UnicodeDecodeError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def _ordering(self, reverse):
+        prefix = '-' if self.descending != reverse else ''
+        return [f'{prefix}{self.key}', f'{prefix}pk']
+
+    def _after(self, value, pk, reverse):
+        # (key, id) > (value, pk) в направлении обхода; лишнее условие на key
+        # оставляет SQLite диапазонный поиск по индексу
+        op = 'lt' if self.descending != reverse else 'gt'
+        return (Q(**{f'{self.key}__{op}e': value}) &
+                (Q(**{f'{self.key}__{op}': value}) | Q(**{self.key: value, f'pk__{op}': pk})))
+
+    def get_page(self, cursor=None):
+        direction, value, pk = self.decode_cursor(cursor) if cursor else ('next', None, None)
+        reverse = direction == 'prev'
+        queryset = self.queryset.order_by(*self._ordering(reverse))
+        if value is not None:
+            queryset = queryset.filter(self._after(value, pk, reverse))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows)
+
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor('next', rows[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor('prev', rows[0]) if has_previous else None,
+        )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) по всей большой таблице.
+
+    Для выборки без фильтров число строк оценивается по MAX(id) — это чтение
+    одной строки первичного ключа. Оценка завышена на число удаленных строк,
+    поэтому используется только выше порога; отфильтрованные выборки и
+    небольшие таблицы считаются точно.
+    """
+
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = queryset.model._base_manager.aggregate(n=Max('pk'))['n'] or 0
+            if estimate > self.estimate_threshold:
+                return estimate
+        return super().count
+
+
+def get_page_size(request, default, maximum):
+    """Размер страницы из параметра page_size с ограничением сверху."""
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def page_url(request, cursor):
+    """Ссылка на ту же выдачу с другим курсором."""
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f"{request.path}?{query.urlencode()}"
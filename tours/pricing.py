@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+from django.db.models import F, FloatField, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Round
+
+from .models import Promotion, Tour
+
+# Туров в одном UPDATE при пересчете всего каталога
+BATCH_SIZE = 5000
+
+
+def _best_discount(link, target, outer, day):
+    """Подзапрос: наибольшая скидка действующих акций, связанных с объектом через таблицу link."""
+    return Subquery(
+        link.objects.filter(**{f'{target}_id': OuterRef(outer)},
+                            promotion__start_date__lte=day, promotion__end_date__gte=day)
+        .order_by().values(f'{target}_id').annotate(best=Max('promotion__discount_percent')).values('best'),
+        output_field=IntegerField(),
+    )
+
+
+def discount_expression(day):
+    """Скидка тура в процентах: лучшая из акций на сам тур и на его страну (скидки не суммируются)."""
+    return Greatest(
+        Coalesce(_best_discount(Promotion.tours.through, 'tour', 'pk', day), Value(0)),
+        Coalesce(_best_discount(Promotion.countries.through, 'country', 'country_id', day), Value(0)),
+    )
+
+
+def effective_price_expression(day):
+    # Через float, чтобы SQLite не делил целые цены нацело; Round вернет numeric и в PostgreSQL
+    return Round(Cast(F('price') * (100 - discount_expression(day)), FloatField()) / 100, 2)
+
+
+def reprice_tours(tour_ids=None, day=None, batch_size=BATCH_SIZE):
+    """Пересчитывает effective_price одним UPDATE на пачку туров.
+
+    Без tour_ids пересчитывается весь каталог диапазонами id по batch_size.
+    Возвращает число обновленных туров.
+    """
+    expression = effective_price_expression(day or date.today())
+    if tour_ids is not None:
+        tour_ids = list(tour_ids)
+        updated = 0
+        for i in range(0, len(tour_ids), batch_size):
+            updated += Tour.objects.filter(pk__in=tour_ids[i:i + batch_size]).update(effective_price=expression)
+        return updated
+    updated = 0
+    last_id = 0
+    while True:
+        edge = list(Tour.objects.filter(pk__gt=last_id).order_by('pk')
+                    .values_list('pk', flat=True)[batch_size - 1:batch_size])
+        bound = edge[0] if edge else None
+        batch = Tour.objects.filter(pk__gt=last_id)
+        if bound is not None:
+            batch = batch.filter(pk__lte=bound)
+        updated += batch.update(effective_price=expression)
+        if bound is None:
+            return updated
+        last_id = bound
+
+
+def promotion_tour_ids(promotion_ids):
+    """id туров, на цену которых влияют акции: указанных в них напрямую и из их стран."""
+    promotion_ids = list(promotion_ids)
+    direct = Promotion.tours.through.objects.filter(promotion_id__in=promotion_ids).values_list('tour_id', flat=True)
+    countries = Promotion.countries.through.objects.filter(promotion_id__in=promotion_ids).values('country_id')
+    return set(direct) | set(Tour.objects.filter(country_id__in=countries).values_list('pk', flat=True))
+
+
+def boundary_tour_ids(day=None):
+    """Туры, у которых на день day началась или вчера закончилась какая-то акция."""
+    day = day or date.today()
+    changed = Promotion.objects.filter(Q(start_date=day) | Q(end_date=day - timedelta(days=1)))
+    return promotion_tour_ids(changed.values_list('pk', flat=True))
@@ -0,0 +1,61 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Value
+
+from .caching import get_version
+from .models import Promotion
+
+PROMOTION_FIELDS = ('id', 'title', 'description', 'start_date', 'end_date')
+
+
+def build_active_promotions(day):
+    """Акции, действующие в день day, и их привязки к турам и странам.
+
+    Два запроса: акции по индексу окна дат и одна выборка UNION из обеих
+    связующих таблиц.
+    """
+    promotions = {p['id']: p for p in Promotion.objects.filter(start_date__lte=day, end_date__gte=day)
+                  .order_by('-start_date', 'id').values(*PROMOTION_FIELDS)}
+    by_tour, by_country = {}, {}
+    if promotions:
+        ids = list(promotions)
+        tour_links = (Promotion.tours.through.objects.filter(promotion_id__in=ids)
+                      .annotate(kind=Value('tour')).values_list('promotion_id', 'tour_id', 'kind'))
+        country_links = (Promotion.countries.through.objects.filter(promotion_id__in=ids)
+                         .annotate(kind=Value('country')).values_list('promotion_id', 'country_id', 'kind'))
+        for promotion_id, target_id, kind in tour_links.union(country_links, all=True):
+            (by_tour if kind == 'tour' else by_country).setdefault(target_id, []).append(promotion_id)
+    return {'promotions': promotions, 'by_tour': by_tour, 'by_country': by_country}
+
+
+def get_active_promotions(day=None):
+    """Индекс действующих акций на день из кэша; сбрасывается сигналами при правке акций."""
+    day = day or date.today()
+    key = f"tours:promotions:{get_version('promotions')}:{day.isoformat()}"
+    return cache.get_or_set(key, lambda: build_active_promotions(day), settings.TOURS_PROMOTIONS_TIMEOUT)
+
+
+def promotions_for_tours(tours, day=None):
+    """{id тура: [акции]} для пачки туров без запросов к базе, если индекс уже в кэше.
+
+    Акция подходит туру, если он указан в ней напрямую или она действует
+    на всю его страну. Ближе к началу — акции, которые закончатся раньше.
+    """
+    index = get_active_promotions(day)
+    promotions, by_tour, by_country = index['promotions'], index['by_tour'], index['by_country']
+    result = {}
+    for tour in tours:
+        ids = set(by_tour.get(tour.pk, ())) | set(by_country.get(tour.country_id, ()))
+        result[tour.pk] = sorted((promotions[i] for i in ids), key=lambda p: (p['end_date'], p['id']))
+    return result
+
+
+def attach_promotions(tours, day=None):
+    """Проставляет каждому туру active_promotions для бейджей в карточках."""
+    tours = list(tours)
+    resolved = promotions_for_tours(tours, day)
+    for tour in tours:
+        tour.active_promotions = resolved[tour.pk]
+    return tours
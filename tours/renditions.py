@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from django.conf import settings
+from PIL import Image as PILImage, ImageOps
+
+from .workers import submit_after_commit
+
+# Модуль импортируется и в процессах пула (spawn), где Django не настроен:
+# модели подключаются только внутри функций, которые выполняет основной процесс
+
+RENDITIONS_DIR = 'renditions'
+
+# Формат копии: (формат Pillow, параметры сохранения)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_name(source, width, fmt):
+    return f'{RENDITIONS_DIR}/{source}.{width}w.{fmt}'
+
+
+def render(source, media_root, widths):
+    """Строит копии картинки source (путь внутри media_root) во всех форматах.
+
+    Ширины больше оригинала заменяются шириной оригинала: увеличивать
+    картинку бессмысленно, а перекодировать в WebP все равно выгодно.
+    Выполняется в процессе пула, база не нужна.
+    """
+    with PILImage.open(os.path.join(media_root, source)) as original:
+        targets = sorted({min(width, original.width) for width in widths})
+        # JPEG декодируется сразу в уменьшенном масштабе — для больших фото это в разы быстрее
+        original.draft('RGB', (targets[-1], targets[-1] * original.height // original.width))
+        picture = ImageOps.exif_transpose(original).convert('RGB')
+
+    result = {'source': source, **{fmt: {} for fmt in FORMATS}}
+    for width in targets:
+        height = max(1, round(picture.height * width / picture.width))
+        resized = picture if width == picture.width else picture.resize(
+            (width, height), PILImage.Resampling.LANCZOS, reducing_gap=3.0)
+        for fmt, (pil_format, params) in FORMATS.items():
+            name = rendition_name(source, width, fmt)
+            path = os.path.join(media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Пишем во временный файл, чтобы по URL никогда не отдавался недописанный
+            partial_path = f'{path}.part'
+            resized.save(partial_path, format=pil_format, **params)
+            os.replace(partial_path, path)
+            result[fmt][str(width)] = name
+    return result
+
+
+def delete_renditions(renditions, media_root=None):
+    media_root = media_root or settings.MEDIA_ROOT
+    for fmt in FORMATS:
+        for name in renditions.get(fmt, {}).values():
+            try:
+                os.remove(os.path.join(media_root, name))
+            except FileNotFoundError:
+                pass
+
+
+def is_rendered(image):
+    return bool(image.image) and image.renditions.get('source') == image.image.name
+
+
+def _save(image_id, source, result):
+    from .models import Image
+
+    # Пока строились копии, картинку могли заменить — тогда результат уже не нужен
+    if not Image.objects.filter(pk=image_id, image=source).update(renditions=result):
+        delete_renditions(result)
+
+
+def schedule_renditions(image):
+    """Ставит построение копий в очередь после коммита: загрузка не ждет Pillow."""
+    image_id, source = image.pk, image.image.name
+    submit_after_commit(render, (source, settings.MEDIA_ROOT, tuple(settings.TOURS_RENDITION_WIDTHS)),
+                        partial(_save, image_id, source), f"копии картинки {source}")
+
+
+def render_many(items, workers, widths=None):
+    """Строит копии для пар (id, имя файла) в отдельном пуле. Отдает (id, имя, результат или ошибка)."""
+    widths = tuple(widths or settings.TOURS_RENDITION_WIDTHS)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(render, source, settings.MEDIA_ROOT, widths): (pk, source) for pk, source in items}
+        for future in as_completed(futures):
+            pk, source = futures[future]
+            try:
+                yield pk, source, future.result()
+            except Exception as error:
+                yield pk, source, error
@@ -0,0 +1,165 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Booking, DailyOccupancy, DailySales, RollupDirtyDay, RollupWatermark, Tour
+
+WATERMARK = 'bookings'
+
+# Перекрытие окна: брони, закоммиченные чуть позже чтения водяного знака,
+# попадут в следующий проход. Пересчет дня идемпотентен, повтор безопасен
+OVERLAP = timedelta(minutes=5)
+
+# Сколько дней пересчитывается в одной транзакции
+CHUNK_DAYS = 31
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _sales_rows(start, end, days=None):
+    bookings = (Booking.objects.exclude(status='cancelled')
+                .filter(booking_date__gte=_day_start(start), booking_date__lt=_day_start(end))
+                .annotate(day=TruncDate('booking_date')))
+    if days is not None:
+        bookings = bookings.filter(day__in=days)
+    revenue = ExpressionWrapper(F('num_people') * F('tour__price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    rows = (bookings.order_by().values_list('day', 'tour__country_id', 'tour__tour_type')
+            .annotate(n=Count('id'), people=Sum('num_people'), revenue=Sum(revenue)))
+    return [DailySales(day=day, country_id=country_id, tour_type=tour_type, bookings=n, people=people, revenue=total)
+            for day, country_id, tour_type, n, people, total in rows]
+
+
+def _occupancy_rows(start, end, days=None):
+    tours = Tour.objects.filter(start_date__gte=start, start_date__lt=end)
+    bookings = Booking.objects.exclude(status='cancelled').filter(tour__start_date__gte=start, tour__start_date__lt=end)
+    if days is not None:
+        tours = tours.filter(start_date__in=days)
+        bookings = bookings.filter(tour__start_date__in=days)
+    booked = {(day, country_id, tour_type): people for day, country_id, tour_type, people in
+              bookings.order_by().values_list('tour__start_date', 'tour__country_id', 'tour__tour_type')
+              .annotate(people=Sum('num_people'))}
+    rows = (tours.order_by().values_list('start_date', 'country_id', 'tour_type')
+            .annotate(n=Count('id'), free=Sum('available_slots')))
+    return [DailyOccupancy(day=day, country_id=country_id, tour_type=tour_type, departures=n,
+                           seats_booked=booked.get((day, country_id, tour_type), 0), seats_free=max(free, 0))
+            for day, country_id, tour_type, n, free in rows]
+
+
+def _sales_bounds():
+    bounds = Booking.objects.aggregate(first=Min('booking_date'), last=Max('booking_date'))
+    return bounds['first'] and (timezone.localdate(bounds['first']), timezone.localdate(bounds['last']))
+
+
+def _occupancy_bounds():
+    bounds = Tour.objects.aggregate(first=Min('start_date'), last=Max('start_date'))
+    return bounds['first'] and (bounds['first'], bounds['last'])
+
+
+# Вид сводки: (модель, построение строк за диапазон дней, границы исходных данных)
+ROLLUPS = {
+    RollupDirtyDay.SALES: (DailySales, _sales_rows, _sales_bounds),
+    RollupDirtyDay.OCCUPANCY: (DailyOccupancy, _occupancy_rows, _occupancy_bounds),
+}
+
+
+def _replace(kind, start, end, days=None):
+    """Заменяет строки сводки за дни [start, end) (или только за days из них) одной транзакцией."""
+    model, build, _ = ROLLUPS[kind]
+    with transaction.atomic():
+        rows = build(start, end, days)
+        stale = model.objects.filter(day__gte=start, day__lt=end)
+        if days is not None:
+            stale = stale.filter(day__in=days)
+        stale.delete()
+        model.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def recompute_days(kind, days):
+    """Пересчитывает сводку за перечисленные дни пачками по CHUNK_DAYS."""
+    days = sorted(set(days))
+    for i in range(0, len(days), CHUNK_DAYS):
+        chunk = days[i:i + CHUNK_DAYS]
+        _replace(kind, chunk[0], chunk[-1] + timedelta(days=1), chunk)
+    return len(days)
+
+
+def mark_dirty(kind, days):
+    RollupDirtyDay.objects.bulk_create([RollupDirtyDay(kind=kind, day=day) for day in set(days) if day],
+                                       ignore_conflicts=True)
+
+
+def mark_tours_dirty(tour_ids, departure_days=()):
+    """Отмечает дни, которые меняет правка туров: цена, страна и тип влияют на уже проданные брони."""
+    tour_ids = list(tour_ids)
+    mark_dirty(RollupDirtyDay.OCCUPANCY, list(departure_days) + list(
+        Tour.objects.filter(pk__in=tour_ids).values_list('start_date', flat=True)))
+    mark_dirty(RollupDirtyDay.SALES, Booking.objects.filter(tour__in=tour_ids).annotate(day=TruncDate('booking_date'))
+               .order_by().values_list('day', flat=True).distinct())
+
+
+def rebuild_rollups(chunk_days=CHUNK_DAYS):
+    """Полностью пересобирает сводки диапазонами по chunk_days дней. Возвращает {вид: строк}."""
+    started = timezone.now()
+    # Отметки, пришедшие во время пересборки, останутся и попадут в следующий проход
+    RollupDirtyDay.objects.all().delete()
+    totals = {}
+    for kind, (model, _, bounds) in ROLLUPS.items():
+        span = bounds()
+        if not span:
+            model.objects.all().delete()
+            totals[kind] = 0
+            continue
+        first, last = span
+        model.objects.exclude(day__gte=first, day__lte=last).delete()
+        total = 0
+        start = first
+        while start <= last:
+            end = start + timedelta(days=chunk_days)
+            total += _replace(kind, start, end)
+            start = end
+        totals[kind] = total
+    RollupWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': started})
+    return totals
+
+
+def update_rollups():
+    """Инкрементально пересчитывает дни, затронутые с прошлого прохода.
+
+    Берутся брони с updated_at после водяного знака (с перекрытием OVERLAP)
+    и отметки RollupDirtyDay об удалениях и правках туров. Пересчитываются
+    только эти дни, целиком. Без водяного знака выполняется полная пересборка.
+    Возвращает {вид: число пересчитанных дней}.
+    """
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).first()
+    if watermark is None:
+        rebuild_rollups()
+        return {kind: None for kind in ROLLUPS}
+
+    now = timezone.now()
+    changed = Booking.objects.filter(updated_at__gt=watermark.value - OVERLAP, updated_at__lte=now).order_by()
+    days = {
+        RollupDirtyDay.SALES: set(changed.annotate(day=TruncDate('booking_date')).values_list('day', flat=True).distinct()),
+        RollupDirtyDay.OCCUPANCY: set(changed.values_list('tour__start_date', flat=True).distinct()),
+    }
+    with transaction.atomic():
+        marks = list(RollupDirtyDay.objects.values_list('pk', 'kind', 'day'))
+        RollupDirtyDay.objects.filter(pk__in=[pk for pk, _, _ in marks]).delete()
+    for _, kind, day in marks:
+        days[kind].add(day)
+
+    try:
+        result = {kind: recompute_days(kind, kind_days) for kind, kind_days in days.items()}
+    except Exception:
+        # Снятые отметки возвращаем, чтобы следующий проход их не потерял
+        for kind, kind_days in days.items():
+            mark_dirty(kind, kind_days)
+        raise
+    watermark.value = now
+    watermark.save(update_fields=['value'])
+    return result
@@ -0,0 +1,75 @@
+from datetime import date
+from decimal import Decimal
+
+from .fulltext import build_match_query, fts_available, matching_ids, rank_expression
+from .models import Tour
+from .pagination import KeysetPaginator
+
+SEARCH_PARAMS = ('q', 'country', 'city', 'start_date', 'end_date', 'tour_type', 'min_price', 'max_price')
+
+# Варианты сортировки выдачи: ключ пагинации, по убыванию, разбор ключа из курсора
+SORT_OPTIONS = {
+    'date': ('start_date', False, date.fromisoformat),
+    'rating': ('rating_avg', True, float),
+    'price': ('effective_price', False, Decimal),
+}
+
+# Связи, которые карточка тура читает в шаблонах списков
+LISTING_RELATED = ('country', 'city', 'main_image')
+
+
+def get_search_params(query_dict):
+    """Достает параметры поиска из GET-запроса."""
+    return {name: query_dict.get(name) for name in SEARCH_PARAMS}
+
+
+def normalize_params(params):
+    """Оставляет только заданные фильтры в каноническом виде (ключ кэша, фасеты)."""
+    normalized = {}
+    for name in SEARCH_PARAMS:
+        value = (params.get(name) or '').strip()
+        if value and not (name == 'tour_type' and value == 'all'):
+            normalized[name] = value
+    return normalized
+
+
+def active_tours():
+    """Туры, которые еще можно забронировать."""
+    return Tour.objects.filter(available_slots__gt=0, end_date__gte=date.today())
+
+
+def filter_tours(params):
+    """Применяет фильтры поиска к активным турам.
+
+    Условия совпадают с частичными индексами Tour (available_slots > 0),
+    поэтому любая комбинация фильтров читается по индексу. Параметр q
+    ищет по полнотекстовому индексу и добавляет релевантность fts_rank.
+    """
+    tours = active_tours().order_by('start_date')
+
+    match = build_match_query(params.get('q')) if fts_available() else None
+    if match:
+        tours = tours.filter(id__in=matching_ids(match)).annotate(fts_rank=rank_expression(match))
+    if params.get('country'):
+        tours = tours.filter(country_id=params['country'])
+    if params.get('city'):
+        tours = tours.filter(city_id=params['city'])
+    if params.get('start_date'):
+        tours = tours.filter(start_date__gte=params['start_date'])
+    if params.get('end_date'):
+        tours = tours.filter(end_date__lte=params['end_date'])
+    if params.get('tour_type') and params['tour_type'] != 'all':
+        tours = tours.filter(tour_type=params['tour_type'])
+    if params.get('min_price'):
+        tours = tours.filter(effective_price__gte=params['min_price'])
+    if params.get('max_price'):
+        tours = tours.filter(effective_price__lte=params['max_price'])
+    return tours
+
+
+def tour_paginator(tours, sort, per_page):
+    """Пагинатор выдачи: явная сортировка, иначе релевантность для q, иначе по дате."""
+    if sort not in SORT_OPTIONS and 'fts_rank' in tours.query.annotations:
+        return KeysetPaginator(tours, per_page, key='fts_rank', parse_key=float)
+    key, descending, parse_key = SORT_OPTIONS.get(sort, SORT_OPTIONS['date'])
+    return KeysetPaginator(tours, per_page, key=key, descending=descending, parse_key=parse_key)
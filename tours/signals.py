@@ -0,0 +1,234 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fulltext
+from .availability import refresh_availability
+from .caching import bump_version
+from .favorites import invalidate_favorites
+from .models import Booking, City, Country, Favorite, Hotel, Image, Promotion, Review, RollupDirtyDay, Tour
+from .pricing import promotion_tour_ids, reprice_tours
+from .renditions import delete_renditions, is_rendered, schedule_renditions
+from .rollups import mark_dirty, mark_tours_dirty
+
+# Поля тура, от которых зависит его ячейка календаря
+CALENDAR_FIELDS = {'country', 'start_date', 'price', 'available_slots'}
+
+# Поля тура, от которых зависит цена со скидкой
+PRICING_FIELDS = {'country', 'price'}
+
+
+@receiver(post_save, sender=Tour)
+def index_saved_tour(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fulltext.index_tours([instance.pk])
+
+
+@receiver(post_delete, sender=Tour)
+def unindex_deleted_tour(sender, instance, **kwargs):
+    fulltext.remove_tours([instance.pk])
+
+
+def _tour_cells(tour):
+    return {tour._calendar_cell, tour.calendar_cell()} - {None}
+
+
+@receiver(post_save, sender=Tour)
+def mark_tour_rollups(sender, instance, created=False, raw=False, **kwargs):
+    # Изменения броней видны по updated_at, а правка тура — нет: отмечаем его дни явно.
+    # Обработчик подключен раньше refresh_tour_calendar, который обновляет _calendar_cell
+    if raw:
+        return
+    if created:
+        mark_dirty(RollupDirtyDay.OCCUPANCY, [instance.start_date])
+    else:
+        mark_tours_dirty([instance.pk], [cell[1] for cell in _tour_cells(instance)])
+
+
+@receiver(post_delete, sender=Tour)
+def mark_deleted_tour_rollups(sender, instance, **kwargs):
+    mark_dirty(RollupDirtyDay.OCCUPANCY, [cell[1] for cell in _tour_cells(instance)])
+
+
+@receiver(post_save, sender=Tour)
+def refresh_tour_calendar(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Тур мог переехать в другую страну или на другую дату — пересчитываем и старую ячейку
+    if raw or update_fields is not None and update_fields.isdisjoint(CALENDAR_FIELDS):
+        return
+    refresh_availability(_tour_cells(instance))
+    instance._calendar_cell = instance.calendar_cell()
+
+
+@receiver(post_save, sender=Tour)
+def reprice_saved_tour(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or update_fields is not None and update_fields.isdisjoint(PRICING_FIELDS):
+        return
+    reprice_tours([instance.pk])
+
+
+@receiver(post_delete, sender=Tour)
+def refresh_deleted_tour_calendar(sender, instance, **kwargs):
+    refresh_availability(_tour_cells(instance))
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=Hotel)
+def reindex_renamed_place(sender, instance, created=False, raw=False, **kwargs):
+    # Название страны, города или отеля хранится в индексе у каждого тура
+    if not created and not raw:
+        field = sender._meta.model_name
+        fulltext.index_tours(Tour.objects.filter(**{field: instance}).values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Country)
+@receiver(pre_delete, sender=City)
+@receiver(pre_delete, sender=Hotel)
+def remember_place_tours(sender, instance, **kwargs):
+    # После удаления у туров обнулится ссылка (SET_NULL), запоминаем их заранее
+    field = sender._meta.model_name
+    instance._fts_tour_ids = list(Tour.objects.filter(**{field: instance}).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=Hotel)
+def reindex_place_tours(sender, instance, **kwargs):
+    fulltext.index_tours(getattr(instance, '_fts_tour_ids', []))
+
+
+def _bump_after_commit(name):
+    # Версия меняется только после коммита: иначе параллельный запрос успеет
+    # закэшировать под новой версией (или отдать с новым ETag) еще старые строки
+    transaction.on_commit(lambda: bump_version(name))
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_reference_data(sender, **kwargs):
+    _bump_after_commit('reference')
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(m2m_changed, sender=Promotion.tours.through)
+@receiver(m2m_changed, sender=Promotion.countries.through)
+def invalidate_promotions(sender, action=None, **kwargs):
+    # m2m_changed приходит и до, и после изменения связей — сбрасываем один раз
+    if action is None or action.startswith('post_'):
+        _bump_after_commit('promotions')
+
+
+def _reprice_promotion_tours(tour_ids):
+    if tour_ids:
+        reprice_tours(tour_ids)
+        _bump_after_commit('catalog')
+
+
+@receiver(post_save, sender=Promotion)
+def reprice_saved_promotion(sender, instance, raw=False, **kwargs):
+    # Могли поменяться скидка или даты — затронуты все туры акции
+    if not raw:
+        _reprice_promotion_tours(promotion_tour_ids([instance.pk]))
+
+
+@receiver(pre_delete, sender=Promotion)
+def remember_promotion_tours(sender, instance, **kwargs):
+    # После удаления связи акции исчезнут, запоминаем ее туры заранее
+    instance._priced_tour_ids = promotion_tour_ids([instance.pk])
+
+
+@receiver(post_delete, sender=Promotion)
+def reprice_deleted_promotion(sender, instance, **kwargs):
+    _reprice_promotion_tours(getattr(instance, '_priced_tour_ids', ()))
+
+
+def _linked_tour_ids(sender, instance, reverse, pk_set):
+    """Туры, цену которых меняет правка связей акции с турами или странами."""
+    if sender is Promotion.tours.through:
+        if reverse:
+            return {instance.pk}
+        return set(pk_set) if pk_set is not None else set(instance.tours.values_list('pk', flat=True))
+    if reverse:
+        countries = [instance.pk]
+    else:
+        countries = list(pk_set) if pk_set is not None else list(instance.countries.values_list('pk', flat=True))
+    return set(Tour.objects.filter(country_id__in=countries).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Promotion.tours.through)
+@receiver(m2m_changed, sender=Promotion.countries.through)
+def reprice_promotion_links(sender, instance, action, reverse, pk_set, **kwargs):
+    # Затронутые туры определяем до изменения: после clear связей уже не видно
+    if action.startswith('pre_'):
+        instance._priced_tour_ids = _linked_tour_ids(sender, instance, reverse, pk_set)
+    else:
+        _reprice_promotion_tours(instance.__dict__.pop('_priced_tour_ids', ()))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_user_favorites(sender, instance, **kwargs):
+    # Правки из админки и каскадное удаление туров; сервис избранного сбрасывает кэш сам
+    invalidate_favorites(instance.user_id)
+
+
+@receiver(post_save, sender=Image)
+def render_saved_image(sender, instance, raw=False, **kwargs):
+    # Новая картинка или замененный файл: копии строятся в пуле процессов после коммита
+    if raw or not instance.image or is_rendered(instance):
+        return
+    stale = instance.renditions
+    if stale:
+        transaction.on_commit(lambda: delete_renditions(stale))
+    schedule_renditions(instance)
+
+
+@receiver(post_delete, sender=Image)
+def delete_image_renditions(sender, instance, **kwargs):
+    renditions = instance.renditions
+    if renditions:
+        transaction.on_commit(lambda: delete_renditions(renditions))
+
+
+@receiver(post_delete, sender=Booking)
+def uncount_deleted_booking(sender, instance, **kwargs):
+    # Удаление идет внутри транзакции Collector, счетчик меняется вместе с ним
+    if instance._counted_tour_id is not None:
+        Tour.objects.filter(pk=instance._counted_tour_id).update(booking_count=F('booking_count') - 1)
+
+
+@receiver(post_save, sender=Booking)
+def mark_moved_booking_rollups(sender, instance, created=False, raw=False, **kwargs):
+    # До конца Booking.save() _counted_tour_id еще указывает на прежний тур
+    old_tour_id = instance._counted_tour_id
+    if not created and not raw and old_tour_id is not None and old_tour_id != instance.tour_id:
+        mark_dirty(RollupDirtyDay.OCCUPANCY, Tour.objects.filter(pk=old_tour_id).values_list('start_date', flat=True))
+
+
+@receiver(post_delete, sender=Booking)
+def mark_deleted_booking_rollups(sender, instance, **kwargs):
+    mark_dirty(RollupDirtyDay.SALES, [timezone.localdate(instance.booking_date)])
+    mark_dirty(RollupDirtyDay.OCCUPANCY, Tour.objects.filter(pk=instance.tour_id).values_list('start_date', flat=True))
+
+
+@receiver(post_delete, sender=Review)
+def uncount_deleted_review(sender, instance, **kwargs):
+    instance._apply_counted(instance._counted, -1)
+
+
+# Версия каталога для ETag API: меняется при любой правке данных, попадающих в выдачу
+CATALOG_MODELS = (Tour, Country, City, Hotel, Image, Booking, Review)
+
+
+def invalidate_catalog(sender, **kwargs):
+    _bump_after_commit('catalog')
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_version_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_version_delete_{model.__name__}')
@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него собираются только .gz
+    brotli = None
+
+BLOBS_DIR = 'blobs'
+
+# Что имеет смысл сжимать заранее: картинки и шрифты уже сжаты
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html'}
+
+# Файлы меньше этого размера не сжимаем: выигрыш меньше заголовков
+COMPRESS_MIN_SIZE = 256
+
+
+def content_hash(file):
+    """SHA-256 содержимого файла, читаемого кусками; позиция чтения возвращается в начало."""
+    digest = hashlib.sha256()
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    for chunk in file.chunks() if hasattr(file, 'chunks') else iter(lambda: file.read(1 << 20), b''):
+        digest.update(chunk)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, ext=''):
+    """blobs/ab/cd/<хеш>.ext — два уровня по 256 каталогов, чтобы ни в одном не было миллиона файлов."""
+    return f'{BLOBS_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы хранятся под именем по хешу содержимого: одинаковые байты — один файл.
+
+    Имя, предложенное upload_to, используется только ради расширения.
+    Уже записанный блоб повторно не пишется. Старые файлы с обычными
+    именами читаются как раньше.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = blob_name(content_hash(content), os.path.splitext(name)[1])
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+def compressed_variants(data):
+    """{расширение: сжатые байты} для вариантов, которые меньше исходника."""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {ext: packed for ext, packed in variants.items() if len(packed) < len(data)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хешем содержимого в имени и заранее сжатыми .gz/.br рядом.
+
+    Сжатие делается один раз в collectstatic, а не на каждый запрос;
+    отдает варианты tours.assets по Accept-Encoding.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            if os.path.splitext(hashed_name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            with self.open(hashed_name) as file:
+                data = file.read()
+            if len(data) < COMPRESS_MIN_SIZE:
+                continue
+            for ext, packed in compressed_variants(data).items():
+                if self.exists(hashed_name + ext):
+                    self.delete(hashed_name + ext)
+                self._save(hashed_name + ext, ContentFile(packed))
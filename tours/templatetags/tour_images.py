@@ -0,0 +1,41 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from tours.renditions import is_rendered
+
+register = template.Library()
+
+# Ширина карточки в сетке row-cols-1 / md-2 / lg-3
+CARD_SIZES = '(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw'
+
+FALLBACK_WIDTH = 640
+
+
+def _candidates(renditions, fmt):
+    return sorted((int(width), default_storage.url(name)) for width, name in renditions.get(fmt, {}).items())
+
+
+@register.simple_tag
+def srcset(image, fmt='webp'):
+    """Строка srcset из копий картинки: «url 320w, url 640w»."""
+    if not image or not is_rendered(image):
+        return ''
+    return ', '.join(f'{url} {width}w' for width, url in _candidates(image.renditions, fmt))
+
+
+@register.simple_tag
+def responsive_image(image, alt='', css_class='', sizes=CARD_SIZES):
+    """<picture> с WebP и JPEG копиями нужной ширины; пока копий нет — оригинал."""
+    if not image:
+        return ''
+    if not is_rendered(image):
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">', image.image.url, css_class, alt)
+    # Для браузеров без srcset — копия не уже типичной карточки
+    jpeg = _candidates(image.renditions, 'jpeg')
+    fallback = next((url for width, url in jpeg if width >= FALLBACK_WIDTH), jpeg[-1][1])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy"></picture>',
+        srcset(image, 'webp'), sizes, fallback, srcset(image, 'jpeg'), sizes, css_class, alt,
+    )
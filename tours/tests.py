@@ -1,3 +1,1319 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from itertools import count
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from tours.models import (User, Country, City, Hotel, Image, Tour, Booking, Review, Favorite, Promotion,
+                          AvailabilityDay, DailySales, DailyOccupancy)
+from tours.availability import rebuild_calendar
+from PIL import Image as PILImage
+
+from tours import caching
+from tours.assets import serve_media, serve_static
+from tours.booking import (HoldExpired, NotEnoughSlots, _with_lock_retry, book_tour, cancel_booking, confirm_hold,
+                           expire_holds, hold_slots, release_hold)
+from tours.caching import get_reference_data, reference_cache_stats
+from tours.counters import find_booking_count_drift, find_rating_drift
+from tours.dedupe import dedupe_images
+from tours.facets import compute_facets, get_facets
+from tours.favorites import get_favorite_ids
+from tours.forms import TourForm
+from tours.fulltext import FTS_TABLE, build_match_query, fts_available, matching_ids
+from tours.generate import Generator, finish_generation, flush
+from tours.pricing import reprice_tours
+from tours.promotions import promotions_for_tours
+from tours.rollups import rebuild_rollups, update_rollups
+from tours.search import filter_tours
+from tours.uploads import collect_garbage, staging_root
+
+_seq = count(1)
+
+# Тесты не должны делить файловый кэш с запущенным сервером и друг с другом
+_test_cache = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tours-tests'},
+})
+
+
+def setUpModule():
+    _test_cache.enable()
+
+
+def tearDownModule():
+    _test_cache.disable()
+
+
+def make_tours(n, **extra):
+    """Создает n активных туров со своими страной, городом, отелем и картинкой."""
+    tours = []
+    for _ in range(n):
+        i = next(_seq)
+        country = Country.objects.create(name=f'Страна {i}')
+        city = City.objects.create(name=f'Город {i}', country=country)
+        hotel = Hotel.objects.create(name=f'Отель {i}', stars=4, address='-', description='-', country=country, city=city)
+        image = Image.objects.create(image=f'tour_images/test_{i}.jpg')
+        fields = {
+            'title': f'Тур {i}', 'country': country, 'city': city, 'hotel': hotel, 'price': 1000 + i,
+            'start_date': date.today() + timedelta(days=i), 'end_date': date.today() + timedelta(days=i + 7),
+            'duration': 7, 'available_slots': 20, 'tour_type': 'beach', 'description': 'Описание', 'main_image': image,
+        }
+        fields.update(extra)
+        tours.append(Tour.objects.create(**fields))
+    return tours
+
+
+def make_activity(tour, n):
+    """Добавляет туру n отзывов, бронирований и картинок галереи от разных пользователей."""
+    for _ in range(n):
+        i = next(_seq)
+        user = User.objects.create(username=f'user{i}', first_name=f'Имя {i}')
+        Booking.objects.create(user=user, tour=tour, num_people=1)
+        Review.objects.create(user=user, tour=tour, rating=5, text='Отлично')
+        tour.images.add(Image.objects.create(image=f'tour_images/gallery_{i}.jpg'))
+
+
+def promote(tours):
+    """Действующие акции: одна на сами туры, другая на их страны."""
+    today = date.today()
+    by_tour = Promotion.objects.create(title=f'Акция {next(_seq)}', description='-', start_date=today, end_date=today)
+    by_tour.tours.add(*tours)
+    by_country = Promotion.objects.create(title=f'Акция {next(_seq)}', description='-', start_date=today, end_date=today)
+    by_country.countries.add(*{tour.country_id for tour in tours})
+    return tours
+
+
+class QueryBudgetMixin:
+    """Проверяет, что число запросов страницы фиксировано и не растет с объемом данных."""
+
+    def count_queries(self, url):
+        cache.clear()  # меряем холодный путь, без попаданий в кэш
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertQueryBudget(self, url, budget, grow):
+        """Замеряет url до и после grow(), который добавляет данные."""
+        before = self.count_queries(url)
+        grow()
+        after = self.count_queries(url)
+        self.assertEqual(before, after, f'{url}: число запросов зависит от объема данных ({before} -> {after})')
+        self.assertLessEqual(after, budget, f'{url}: {after} запросов при бюджете {budget}')
+
+
+class SearchQueryPlanTests(TestCase):
+    """Поиск не должен скатываться в полный просмотр таблицы туров."""
+
+    FILTER_COMBINATIONS = [
+        {},
+        {'country': '1'},
+        {'city': '1'},
+        {'tour_type': 'beach'},
+        {'country': '1', 'tour_type': 'beach'},
+        {'country': '1', 'city': '1'},
+        {'start_date': '2030-01-01'},
+        {'country': '1', 'start_date': '2030-01-01', 'end_date': '2030-02-01'},
+        {'min_price': '50000', 'max_price': '100000'},
+        {'tour_type': 'all', 'min_price': '50000'},
+    ]
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        self.assertIsNone(re.search(rf'SCAN {table}(?! USING)', plan), plan)
+        self.assertIn('INDEX', plan)
+
+    def test_common_filters_use_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('План запроса проверяется только для SQLite')
+        for params in self.FILTER_COMBINATIONS:
+            with self.subTest(params=params):
+                self.assertUsesIndex(filter_tours(params))
+
+
+class SearchPaginationTests(TestCase):
+
+    def setUp(self):
+        self.tours = make_tours(7)
+        # Четыре тура с одной датой вылета: порядок внутри дня задает id
+        Tour.objects.filter(pk__in=[t.pk for t in self.tours[1:5]]).update(start_date=self.tours[1].start_date)
+        self.expected = list(Tour.objects.order_by('start_date', 'pk').values_list('pk', flat=True))
+
+    def page(self, url=None, **params):
+        response = self.client.get(url or reverse('search_results'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def ids(self, context):
+        return [t.pk for t in context['tours']]
+
+    def test_next_pages_cover_results_once(self):
+        context = self.page(page_size=2)
+        self.assertIsNone(context['previous_url'])
+        seen = self.ids(context)
+        while context['next_url']:
+            context = self.page(context['next_url'])
+            self.assertLessEqual(len(self.ids(context)), 2)
+            seen += self.ids(context)
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_returns_exact_page(self):
+        first = self.page(page_size=3)
+        second = self.page(first['next_url'])
+        self.assertEqual(self.ids(second), self.expected[3:6])
+        back = self.page(second['previous_url'])
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertIsNone(back['previous_url'])
+        self.assertEqual(self.ids(self.page(back['next_url'])), self.ids(second))
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        first = self.ids(self.page(page_size=2))
+        for cursor in ('мусор', '!!!', 'bmV4dHwyMDI2LTEzLTAxfDE', 'c2lkZXwyMDMwLTAxLTAxfDE'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.ids(self.page(page_size=2, cursor=cursor)), first)
+
+    @override_settings(TOURS_MAX_PAGE_SIZE=3)
+    def test_page_size_is_clamped(self):
+        self.assertEqual(len(self.page(page_size=500)['tours']), 3)
+        self.assertEqual(len(self.page(page_size=0)['tours']), 1)
+        self.assertEqual(len(self.page(page_size='много')['tours']), 3)
+
+
+class FacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.a, self.b = Country.objects.create(name='Страна А'), Country.objects.create(name='Страна Б')
+        self.a1, self.a2 = City.objects.create(name='А1', country=self.a), City.objects.create(name='А2', country=self.a)
+        self.b1 = City.objects.create(name='Б1', country=self.b)
+        layout = [(self.a1, 'beach', 40000), (self.a1, 'ski', 60000), (self.a2, 'beach', 120000),
+                  (self.b1, 'beach', 40000), (self.b1, 'ski', 250000)]
+        for tour, (city, tour_type, price) in zip(make_tours(len(layout)), layout):
+            Tour.objects.filter(pk=tour.pk).update(country=city.country, city=city, tour_type=tour_type,
+                                                   price=price, effective_price=price)
+
+    def test_each_facet_ignores_only_its_own_filter(self):
+        params = {'country': str(self.a.pk), 'tour_type': 'beach', 'max_price': '99999.99'}
+        with CaptureQueriesContext(connection) as queries:
+            facets = compute_facets(params)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('GROUP BY', queries[0]['sql'])
+        self.assertEqual(facets, {
+            'country': {self.a.pk: 1, self.b.pk: 1},
+            'city': {self.a1.pk: 1},
+            'tour_type': {'beach': 1, 'ski': 1},
+            'price': {0: 1, 2: 1},
+        })
+        facets = compute_facets({'city': str(self.b1.pk), 'min_price': '50000'})
+        self.assertEqual(facets['country'], {self.b.pk: 1})
+        self.assertEqual(facets['city'], {self.a1.pk: 1, self.a2.pk: 1, self.b1.pk: 1})
+        self.assertEqual(facets['tour_type'], {'ski': 1})
+        self.assertEqual(facets['price'], {0: 1, 4: 1})
+
+    def test_unfiltered_and_cached(self):
+        facets = get_facets({'tour_type': 'all'})
+        self.assertEqual(facets['country'], {self.a.pk: 3, self.b.pk: 2})
+        self.assertEqual(facets['tour_type'], {'beach': 3, 'ski': 2})
+        self.assertEqual(facets['price'], {0: 2, 1: 1, 2: 1, 4: 1})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_facets({}), facets)
+
+
+class FullTextSearchTests(TestCase):
+
+    def setUp(self):
+        if not fts_available():
+            self.skipTest('Полнотекстовый индекс есть только в SQLite')
+        # Тур с совпадением в описании создан раньше: порядок задает только bm25
+        self.in_description, self.in_title, self.unrelated = make_tours(3)
+        self.in_title.title = 'Лазурный берег'
+        self.in_title.save()
+        self.in_description.description = 'Прогулка на катере вдоль лазурной бухты'
+        self.in_description.save()
+
+    def found(self, text):
+        return set(Tour.objects.filter(pk__in=matching_ids(build_match_query(text))).values_list('pk', flat=True))
+
+    def test_query_matches_and_ranks(self):
+        response = self.client.get(reverse('search_results'), {'q': 'лазурн'})
+        self.assertEqual([t.pk for t in response.context['tours']], [self.in_title.pk, self.in_description.pk])
+        self.assertEqual(self.found('лазурн катер'), {self.in_description.pk})
+        self.assertEqual(self.found(self.unrelated.country.name), {self.unrelated.pk})
+        self.assertIsNone(build_match_query(' "*" '))
+
+    def test_index_follows_tour_save_and_delete(self):
+        self.in_title.title = 'Северное сияние'
+        self.in_title.save()
+        self.assertEqual(self.found('лазурн'), {self.in_description.pk})
+        self.assertEqual(self.found('сияние'), {self.in_title.pk})
+        self.in_title.delete()
+        self.assertEqual(self.found('сияние'), set())
+
+    def test_place_rename_and_delete_reindex_tours(self):
+        tour = self.unrelated
+        for place, name in ((tour.country, 'Исландия'), (tour.city, 'Рейкьявик'), (tour.hotel, 'Гейзер')):
+            old_name = place.name
+            place.name = name
+            place.save()
+            self.assertEqual(self.found(name), {tour.pk})
+            self.assertEqual(self.found(old_name), set())
+        tour.hotel.delete()
+        self.assertEqual(self.found('Гейзер'), set())
+        self.assertEqual(self.found('Рейкьявик'), {tour.pk})
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        response = self.client.get(reverse('admin:tours_tour_changelist'), {'q': 'лазурн'})
+        self.assertEqual({t.pk for t in response.context['cl'].result_list},
+                         {self.in_title.pk, self.in_description.pk})
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        self.assertEqual(self.found('лазурн'), set())
+        out = io.StringIO()
+        call_command('rebuild_search_index', '--batch-size', '1', stdout=out)
+        self.assertIn('Проиндексировано туров: 3', out.getvalue())
+        self.assertEqual(self.found('лазурн'), {self.in_title.pk, self.in_description.pk})
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def test_home_page(self):
+        promote(make_tours(2))
+        self.assertQueryBudget(reverse('home'), 5, lambda: promote(make_tours(10)))
+
+    def test_search_results(self):
+        promote(make_tours(2))
+        self.assertQueryBudget(reverse('search_results'), 6, lambda: promote(make_tours(10)))
+
+    def test_tour_detail(self):
+        tour = make_tours(1)[0]
+        make_activity(tour, 2)
+        self.assertQueryBudget(reverse('tour_detail', args=[tour.pk]), 4, lambda: make_activity(tour, 30))
+
+    def test_tour_reviews_fragment(self):
+        tour = make_tours(1)[0]
+        make_activity(tour, 2)
+        self.assertQueryBudget(reverse('tour_reviews', args=[tour.pk]), 1, lambda: make_activity(tour, 30))
+
+
+class PromotionResolverTests(TestCase):
+
+    def setUp(self):
+        self.tour, self.other = make_tours(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            promote([self.tour])
+        self.direct, self.country_wide = Promotion.objects.order_by('pk')
+
+    def test_resolves_batch_from_cache(self):
+        self.assertEqual(len(promotions_for_tours([self.tour, self.other])[self.tour.pk]), 2)
+        with self.assertNumQueries(0):
+            resolved = promotions_for_tours([self.tour, self.other])
+        self.assertEqual({p['id'] for p in resolved[self.tour.pk]}, {self.direct.pk, self.country_wide.pk})
+        self.assertEqual(resolved[self.other.pk], [])
+
+    def test_changes_invalidate_cache(self):
+        promotions_for_tours([self.other])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country_wide.countries.add(self.other.country)
+        self.assertEqual([p['id'] for p in promotions_for_tours([self.other])[self.other.pk]], [self.country_wide.pk])
+        self.country_wide.end_date = date.today() - timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country_wide.save()
+        self.assertEqual(promotions_for_tours([self.other])[self.other.pk], [])
+
+
+class ReferenceCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caching.stats.clear()
+        caching._local.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country = Country.objects.create(name='Страна')
+            self.city = City.objects.create(name='Город', country=self.country)
+
+    def test_hit_and_miss_counts(self):
+        self.assertIsNone(reference_cache_stats()['hit_ratio'])
+        first = get_reference_data()
+        with self.assertNumQueries(0):
+            self.assertIs(get_reference_data(), first)
+        # Другой процесс: локальной копии нет, данные берутся из общего кэша
+        caching._local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_reference_data()['countries'], first['countries'])
+        self.assertEqual(reference_cache_stats(),
+                         {'local_hits': 1, 'shared_hits': 1, 'misses': 1, 'hit_ratio': 2 / 3})
+
+    def test_country_and_city_changes_invalidate(self):
+        get_reference_data()
+        country, city = self.country, self.city
+        country.name = 'Переименованная страна'
+        with self.captureOnCommitCallbacks() as callbacks:
+            country.save()
+        # До коммита версия прежняя: кэш отдает старые данные
+        self.assertNotIn((country.pk, country.name), get_reference_data()['countries'])
+        for callback in callbacks:
+            callback()
+        self.assertIn((country.pk, country.name), get_reference_data()['countries'])
+        with self.captureOnCommitCallbacks(execute=True):
+            new_city = City.objects.create(name='Новый город', country=country)
+        self.assertIn((new_city.pk, new_city.name, country.pk), get_reference_data()['cities'])
+        with self.captureOnCommitCallbacks(execute=True):
+            city.delete()
+        self.assertNotIn(city.pk, [pk for pk, _, _ in get_reference_data()['cities']])
+        self.assertEqual(reference_cache_stats()['misses'], 4)
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tours = make_tours(3)
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_tour_json_shape(self):
+        data = self.get('api_tours', page_size=2).json()
+        tour = self.tours[0]
+        self.assertEqual(data['results'][0], {
+            'id': tour.pk, 'title': tour.title, 'price': '%.2f' % tour.price,
+            'effective_price': '%.2f' % tour.price, 'start_date': tour.start_date.isoformat(),
+            'end_date': tour.end_date.isoformat(), 'duration': 7, 'available_slots': 20, 'tour_type': 'beach',
+            'rating': {'avg': 0.0, 'count': 0},
+            'country': {'id': tour.country_id, 'name': tour.country.name},
+            'city': {'id': tour.city_id, 'name': tour.city.name},
+            'hotel': {'id': tour.hotel_id, 'name': tour.hotel.name, 'stars': 4},
+            'main_image': {'url': tour.main_image.image.url, 'caption': tour.main_image.caption},
+        })
+        self.assertIsNone(data['previous'])
+        following = self.client.get(data['next']).json()
+        self.assertEqual([t['id'] for t in following['results']], [self.tours[2].pk])
+        self.assertIsNone(following['next'])
+
+    def test_fields_selection(self):
+        data = self.get('api_tours', fields='id,country').json()
+        self.assertEqual(data['results'][0], {'id': self.tours[0].pk,
+                                              'country': {'id': self.tours[0].country_id,
+                                                          'name': self.tours[0].country.name}})
+        response = self.get('api_tours', fields='id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+    def test_bad_cursor(self):
+        for cursor in ('мусор', 'bmV4dHwyMDI2LTEzLTAxfDE'):
+            self.assertEqual(self.get('api_tours', cursor=cursor).status_code, 400)
+
+    def test_etag_round_trip(self):
+        response = self.get('api_tours', fields='id')
+        etag = response['ETag']
+        cached = self.client.get(reverse('api_tours'), {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        # Другие параметры — другая выдача и другой ETag
+        self.assertNotEqual(self.get('api_tours', fields='title')['ETag'], etag)
+
+        tour = self.tours[0]
+        tour.title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            tour.save()
+        changed = self.client.get(reverse('api_tours'), {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_calendar(self):
+        tour = self.tours[0]
+        response = self.get('api_calendar', tour.country_id, month=tour.start_date.strftime('%Y-%m'), months=2)
+        data = response.json()
+        self.assertEqual([m['month'] for m in data['months']][0], tour.start_date.strftime('%Y-%m'))
+        self.assertEqual(len(data['months']), 2)
+        day = data['months'][0]['days'][tour.start_date.day - 1]
+        self.assertEqual(day, {'date': tour.start_date.isoformat(), 'departures': 1,
+                               'min_price': '%.2f' % tour.price, 'free_slots': 20})
+        cached = self.client.get(reverse('api_calendar', args=[tour.country_id]),
+                                 {'month': tour.start_date.strftime('%Y-%m'), 'months': 2},
+                                 HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.get('api_calendar', tour.country_id, month='2026-13').status_code, 400)
+        self.assertEqual(self.get('api_calendar', tour.country_id, months=13).status_code, 400)
+
+
+class PricingTests(TestCase):
+    """Цена со скидкой пересчитывается только у туров, которых касается правка акции."""
+
+    def setUp(self):
+        self.tour, self.other = make_tours(2, price=2000)
+        promote([self.tour])
+        self.direct, self.country_wide = Promotion.objects.order_by('pk')
+
+    def price_of(self, tour):
+        return Tour.objects.values_list('effective_price', flat=True).get(pk=tour.pk)
+
+    def test_best_discount_wins(self):
+        self.assertEqual(self.price_of(self.tour), 2000)
+        self.direct.discount_percent = 10
+        self.direct.save()
+        self.assertEqual(self.price_of(self.tour), 1800)
+        self.country_wide.discount_percent = 25
+        self.country_wide.save()
+        self.assertEqual(self.price_of(self.tour), 1500)
+        self.assertEqual(self.price_of(self.other), 2000)
+
+    def test_link_changes_and_expiry(self):
+        self.country_wide.discount_percent = 15
+        self.country_wide.save()
+        self.country_wide.countries.add(self.other.country)
+        self.assertEqual(self.price_of(self.other), 1700)
+        self.country_wide.countries.clear()
+        self.assertEqual((self.price_of(self.tour), self.price_of(self.other)), (2000, 2000))
+        self.direct.discount_percent = 30
+        self.direct.save()
+        reprice_tours(day=date.today() + timedelta(days=1))
+        self.assertEqual(self.price_of(self.tour), 2000)
+        self.direct.delete()
+        self.assertEqual(self.price_of(self.tour), 2000)
+
+    def test_search_uses_discounted_price(self):
+        self.direct.discount_percent = 50
+        self.direct.save()
+        self.assertEqual(list(filter_tours({'max_price': '1500'})), [self.tour])
+        response = self.client.get(reverse('search_results'), {'sort': 'price'})
+        self.assertEqual([t.pk for t in response.context['tours']], [self.tour.pk, self.other.pk])
+
+
+class FavoriteTests(TestCase):
+
+    def setUp(self):
+        self.tour, self.other = make_tours(2)
+        self.user = User.objects.create_user('fan', password='pass')
+
+    def post(self, name, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse(name, args=args), **kwargs)
+
+    def test_anonymous_gets_401(self):
+        response = self.post('api_favorite_add', self.tour.pk)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_toggle_and_cached_set(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.post('api_favorite_add', self.tour.pk).json(), {'favorites': [self.tour.pk]})
+        self.assertEqual(self.post('api_favorite_add', self.tour.pk).json(), {'favorites': [self.tour.pk]})
+        self.assertEqual(self.post('api_favorite_add', 10 ** 6).status_code, 404)
+        self.assertEqual(get_favorite_ids(self.user), {self.tour.pk})
+        with self.assertNumQueries(0):
+            get_favorite_ids(self.user)
+        self.assertContains(self.client.get(reverse('search_results')), 'aria-pressed="true"', count=1)
+        self.assertEqual(self.post('api_favorite_remove', self.tour.pk).json(), {'favorites': []})
+        self.assertEqual(get_favorite_ids(self.user), set())
+
+    def test_bulk_sync(self):
+        self.client.force_login(self.user)
+        Favorite.objects.create(user=self.user, tour=self.tour)
+        response = self.post('api_favorites_sync', data={'add': [self.tour.pk, self.other.pk, 10 ** 6],
+                                                          'remove': [self.tour.pk]}, content_type='application/json')
+        self.assertEqual(response.json(), {'favorites': [self.other.pk]})
+        response = self.post('api_favorites_sync', data='[1]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TempMediaMixin:
+    """MEDIA_ROOT во временном каталоге; копии картинок строятся сразу, без пула."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        overrides = override_settings(MEDIA_ROOT=media.name, TOURS_WORKERS=0,
+                                      TOURS_RENDITION_WIDTHS=(320, 640, 1280))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def photo(self, width, height, color='teal', name='photo.jpg'):
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (width, height), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def upload(self, width, height):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Image.objects.create(image=self.photo(width, height))
+
+
+class RenditionTests(TempMediaMixin, TestCase):
+
+    def test_renditions_built_after_commit(self):
+        image = self.upload(800, 400)
+        image.refresh_from_db()
+        self.assertEqual(set(image.renditions['webp']), {'320', '640', '800'})
+        with PILImage.open(os.path.join(self.media_root, image.renditions['jpeg']['320'])) as small:
+            self.assertEqual(small.size, (320, 160))
+
+        tour = make_tours(1, main_image=image)[0]
+        response = self.client.get(reverse('search_results'))
+        self.assertContains(response, f"{image.renditions['webp']['640']} 640w")
+        self.assertContains(response, 'type="image/webp"')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tour.delete()
+            image.delete()
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, image.renditions['webp']['320'])))
+
+
+class ImageDedupTests(TempMediaMixin, TestCase):
+
+    def test_same_bytes_resolve_to_one_image(self):
+        first = Image.from_upload(self.photo(40, 30, name='a.jpg'))
+        again = Image.from_upload(self.photo(40, 30, name='b.JPG'))
+        self.assertEqual(first.pk, again.pk)
+        self.assertRegex(first.image.name, rf'^blobs/{first.content_hash[:2]}/{first.content_hash[2:4]}/{first.content_hash}\.jpg$')
+        self.assertNotEqual(Image.from_upload(self.photo(40, 30, 'red')).pk, first.pk)
+
+    def test_dedupe_merges_references(self):
+        data = self.photo(40, 30).read()
+        os.makedirs(os.path.join(self.media_root, 'tour_images'))
+        for name in ('one.jpg', 'two.jpg', 'stray.jpg'):
+            with open(os.path.join(self.media_root, 'tour_images', name), 'wb') as file:
+                file.write(data)
+        keeper = Image.objects.create(image='tour_images/one.jpg')
+        duplicate = Image.objects.create(image='tour_images/two.jpg')
+        tour = make_tours(1, main_image=duplicate)[0]
+        tour.images.add(keeper, duplicate)
+        tour.hotel.images.add(duplicate)
+
+        report = dedupe_images(workers=2)
+        self.assertEqual((report['rows_removed'], report['files_removed'], report['bytes_reclaimed']),
+                         (1, 2, 2 * len(data)))
+        tour.refresh_from_db()
+        self.assertEqual(tour.main_image_id, keeper.pk)
+        self.assertEqual(list(tour.images.all()), [keeper])
+        self.assertEqual(list(tour.hotel.images.all()), [keeper])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'tour_images')), ['one.jpg'])
+        self.assertIsNotNone(Image.objects.get(pk=keeper.pk).content_hash)
+
+    def test_staged_uploads_are_left_alone(self):
+        data = self.photo(40, 30).read()
+        kept = Image.objects.create(image='tour_images/one.jpg')
+        for folder in ('tour_images', 'staging'):
+            os.makedirs(os.path.join(self.media_root, folder))
+            with open(os.path.join(self.media_root, folder, 'one.jpg'), 'wb') as file:
+                file.write(data)
+
+        report = dedupe_images(workers=2)
+        self.assertEqual((report['rows_removed'], report['files_removed']), (0, 0))
+        self.assertEqual(os.listdir(staging_root()), ['one.jpg'])
+        self.assertTrue(Image.objects.filter(pk=kept.pk).exists())
+
+
+class AssetServingTests(TempMediaMixin, TestCase):
+    """Продакшен-режим статики и медиа: хеши в именах, сжатые варианты, ETag и Range."""
+
+    def response(self, view, path, **headers):
+        return view(RequestFactory().get('/', headers=headers), path)
+
+    def test_collected_static_is_hashed_and_precompressed(self):
+        static_root = os.path.join(self.media_root, 'static')
+        storages = {'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                    'staticfiles': {'BACKEND': 'tours.storage.CompressedManifestStaticFilesStorage'}}
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            hashed = next(name for name in os.listdir(os.path.join(static_root, 'css'))
+                          if re.fullmatch(r'home\.[0-9a-f]{12}\.css', name))
+            self.assertTrue(os.path.exists(os.path.join(static_root, 'css', hashed + '.gz')))
+
+            response = self.response(serve_static, f'css/{hashed}', accept_encoding='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            plain = self.response(serve_static, f'css/{hashed}')
+            self.assertNotIn('Content-Encoding', plain)
+            self.assertNotEqual(plain['ETag'], response['ETag'])
+            self.assertEqual(self.response(serve_static, 'css/home.css')['Cache-Control'], 'public, no-cache')
+
+    def test_media_etag_and_ranges(self):
+        with open(os.path.join(self.media_root, 'clip.bin'), 'wb') as file:
+            file.write(bytes(range(100)))
+        response = self.response(serve_media, 'clip.bin')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.response(serve_media, 'clip.bin', if_none_match=response['ETag']).status_code, 304)
+
+        partial = self.response(serve_media, 'clip.bin', range='bytes=10-19')
+        self.assertEqual((partial.status_code, partial['Content-Range']), (206, 'bytes 10-19/100'))
+        self.assertEqual(b''.join(partial), bytes(range(10, 20)))
+        self.assertEqual(b''.join(self.response(serve_media, 'clip.bin', range='bytes=-5')), bytes(range(95, 100)))
+        self.assertEqual(self.response(serve_media, 'clip.bin', range='bytes=200-').status_code, 416)
+        self.assertEqual(self.response(serve_media, 'clip.bin', range='bytes=150-160').status_code, 416)
+        invalid = self.response(serve_media, 'clip.bin', range='bytes=50-10')
+        self.assertEqual(invalid.status_code, 200)
+        self.assertEqual(b''.join(invalid), bytes(range(100)))
+        stale = self.response(serve_media, 'clip.bin', range='bytes=0-1', if_range='"other"')
+        self.assertEqual(stale.status_code, 200)
+
+        image = Image.from_upload(self.photo(20, 20))
+        self.assertIn('immutable', self.response(serve_media, image.image.name)['Cache-Control'])
+
+
+class TourFormUploadTests(TempMediaMixin, TestCase):
+    """Картинка из формы тура: staging, обработка после коммита, сборка мусора."""
+
+    def form(self, tour, upload):
+        data = {'title': 'Новый тур', 'country': tour.country_id, 'city': tour.city_id, 'hotel': tour.hotel_id,
+                'price': '1500', 'start_date': tour.start_date, 'end_date': tour.end_date, 'duration': 7,
+                'available_slots': 10, 'tour_type': 'beach', 'description': 'Описание'}
+        return TourForm(data, {'new_main_image': upload})
+
+    def test_image_attached_after_commit(self):
+        template = make_tours(1)[0]
+        images = Image.objects.count()
+        form = self.form(template, self.photo(3000, 1500, name='big.png'))
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks() as callbacks:
+            tour = form.save()
+            # До коммита тур сохранен без картинки и новых строк Image нет
+            self.assertIsNone(tour.main_image_id)
+            self.assertEqual(Image.objects.count(), images)
+        for callback in callbacks:
+            callback()
+
+        tour.refresh_from_db()
+        self.assertTrue(tour.main_image.image.name.endswith('.jpg'))
+        with PILImage.open(tour.main_image.image.path) as picture:
+            self.assertEqual(picture.size, (2560, 1280))
+        self.assertEqual(os.listdir(staging_root()), [])
+
+    def test_invalid_upload_rejected_without_image(self):
+        template = make_tours(1)[0]
+        images = Image.objects.count()
+        form = self.form(template, SimpleUploadedFile('notes.txt', b'text'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('new_main_image', form.errors)
+
+        # Битый файл с правильным расширением отсеивает пул: тур остается без картинки
+        form = self.form(template, SimpleUploadedFile('broken.jpg', b'not an image'))
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.assertLogs('tours.workers', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            tour = form.save()
+        tour.refresh_from_db()
+        self.assertIsNone(tour.main_image_id)
+        self.assertEqual(Image.objects.count(), images)
+        self.assertEqual(os.listdir(staging_root()), [])
+
+    def test_garbage_collection(self):
+        tour = make_tours(1)[0]
+        orphan = Image.from_upload(self.photo(20, 20, 'red'))
+        shared = Image.objects.create(image=orphan.image.name)
+        fresh = Image.from_upload(self.photo(20, 20, 'blue'))
+        tour.images.add(shared)
+        old = timezone.now() - timedelta(days=2)
+        Image.objects.filter(pk__in=[orphan.pk, shared.pk]).update(uploaded_at=old)
+        os.makedirs(staging_root())
+        stale, recent = (os.path.join(staging_root(), name) for name in ('stale.jpg', 'recent.jpg'))
+        for path in (stale, recent):
+            with open(path, 'wb') as file:
+                file.write(b'x')
+        os.utime(stale, (old.timestamp(), old.timestamp()))
+
+        report = collect_garbage(batch_size=1)
+        self.assertEqual((report['staged_files'], report['images'], report['image_files']), (1, 1, 0))
+        self.assertEqual(os.listdir(staging_root()), ['recent.jpg'])
+        self.assertFalse(Image.objects.filter(pk=orphan.pk).exists())
+        # Файл остался: его использует строка из галереи тура
+        self.assertTrue(os.path.exists(shared.image.path))
+        self.assertTrue(Image.objects.filter(pk=fresh.pk).exists())
+
+
+class GenerateDataTests(TempMediaMixin, TestCase):
+    """Синтетические данные: счетчики сходятся с таблицами, один seed — одни и те же данные."""
+
+    def generate(self, seed):
+        report = Generator(300, users=50, bookings=2000, reviews=600, favorites=400, promotions=5, images=3,
+                           seed=seed, chunk_size=500).run()
+        finish_generation()
+        return report
+
+    def snapshot(self):
+        return list(Tour.objects.order_by('pk').values_list(
+            'title', 'price', 'effective_price', 'start_date', 'available_slots', 'booking_count', 'rating_sum'))
+
+    def test_denormalized_fields_match_rows(self):
+        report = self.generate(seed=1)
+        self.assertEqual((report['tours'], report['bookings'], report['reviews']), (300, 2000, 600))
+        self.assertEqual(Favorite.objects.count(), report['favorites'])
+        self.assertEqual(Image.objects.count(), 3)
+        self.assertFalse(find_booking_count_drift().exists())
+        self.assertFalse(find_rating_drift(Tour).exists())
+        self.assertFalse(find_rating_drift(Hotel).exists())
+        self.assertFalse(Tour.objects.filter(available_slots__lt=0).exists())
+        self.assertTrue(AvailabilityDay.objects.exists())
+        self.assertTrue(Tour.objects.filter(pk__in=matching_ids(build_match_query('Анталия'))).exists())
+
+        # Тяжелый хвост: десятая часть туров собирает больше половины отзывов
+        reviews = sorted(Tour.objects.values_list('review_count', flat=True), reverse=True)
+        self.assertGreater(sum(reviews[:30]), sum(reviews) / 2)
+
+    def test_same_seed_same_data(self):
+        self.generate(seed=5)
+        first = self.snapshot()
+        flush()
+        self.generate(seed=5)
+        self.assertEqual(self.snapshot(), first)
+        flush()
+        self.generate(seed=6)
+        self.assertNotEqual(self.snapshot(), first)
+
+
+class AdminChangelistQueryTests(QueryBudgetMixin, TestCase):
+    """Списки админки: суммы и признаки считаются в SQL, связи грузятся join-ами."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        self.tours = make_tours(2)
+        make_activity(self.tours[0], 2)
+
+    def grow(self):
+        for tour in make_tours(5):
+            make_activity(tour, 5)
+            Favorite.objects.bulk_create(Favorite(user=user, tour=tour) for user in User.objects.filter(is_staff=False)[:5])
+
+    def test_changelists(self):
+        for model, budget in ((Booking, 7), (Review, 8), (Tour, 9), (Favorite, 6), (Hotel, 7), (City, 7)):
+            with self.subTest(model=model.__name__):
+                url = reverse(f'admin:tours_{model._meta.model_name}_changelist')
+                self.assertQueryBudget(url, budget, self.grow)
+
+
+class ImportCatalogTests(TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        self.country = Country.objects.create(name='Италия')
+        self.city = City.objects.create(name='Рим', country=self.country)
+        self.user = User.objects.create_user('guest', password='pass')
+
+    def write(self, name, rows):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            if name.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                f.writelines(f'{row}\n' for row in rows)
+        return path
+
+    def run_import(self, model, path, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_catalog', model, path, *args, stdout=out, stderr=err)
+        return err.getvalue()
+
+    def tour_row(self, external_id, **extra):
+        row = {'external_id': external_id, 'title': f'Тур {external_id}', 'country': 'италия', 'city': 'РИМ',
+               'hotel': 'Колизей', 'price': '1000', 'start_date': '2030-05-01', 'end_date': '2030-05-08',
+               'available_slots': '10'}
+        row.update(extra)
+        return row
+
+    def test_csv_upsert_by_external_id(self):
+        hotels = self.write('hotels.csv', [{'external_id': 'h1', 'name': 'Колизей', 'stars': '4',
+                                           'country': 'Италия', 'city': 'Рим'}])
+        self.run_import('hotel', hotels)
+        tours = self.write('tours.csv', [self.tour_row('t1'), self.tour_row('t2', hotel='')])
+        self.run_import('tour', tours)
+        tour = Tour.objects.get(external_id='t1')
+        self.assertEqual((tour.country, tour.city, tour.hotel.external_id), (self.country, self.city, 'h1'))
+        self.assertIsNone(Tour.objects.get(external_id='t2').hotel)
+
+        self.run_import('tour', self.write('again.csv', [self.tour_row('t1', title='Рим за неделю', price='900')]))
+        self.assertEqual(Tour.objects.count(), 2)
+        tour.refresh_from_db()
+        self.assertEqual((tour.title, tour.price, tour.available_slots), ('Рим за неделю', 900, 10))
+        self.assertEqual(list(filter_tours({'q': 'неделю'})), [tour])
+
+        # Переименованный отель находится поиском по новому названию
+        self.run_import('hotel', self.write('renamed.csv', [{'external_id': 'h1', 'name': 'Пантеон', 'stars': '5',
+                                                             'country': 'Италия', 'city': 'Рим'}]))
+        self.assertEqual(Hotel.objects.get().name, 'Пантеон')
+        self.assertEqual(list(filter_tours({'q': 'Пантеон'})), [tour])
+        self.assertEqual(list(filter_tours({'q': 'Колизей'})), [])
+
+    def test_jsonl_rows_and_errors(self):
+        lines = [
+            json.dumps(self.tour_row('t1'), ensure_ascii=False),
+            '{"external_id": "t2", ',
+            '[1, 2]',
+            json.dumps(self.tour_row('t3', country='Франция')),
+            json.dumps(self.tour_row('t4', end_date='2030-04-01')),
+            json.dumps(self.tour_row('t5', price='дешево')),
+            json.dumps(self.tour_row('t6', hotel='')),
+        ]
+        err = self.run_import('tour', self.write('tours.jsonl', lines))
+        self.assertEqual(sorted(Tour.objects.values_list('external_id', flat=True)), ['t6'])
+        for line_no in (1, 2, 3, 4, 5, 6):
+            self.assertIn(f'строка {line_no}:', err)
+        self.assertIn('некорректный JSON', err)
+        self.assertIn('ожидается JSON-объект', err)
+        self.assertIn("неизвестная страна 'Франция'", err)
+        self.assertNotIn('строка 7:', err)
+
+    def test_booking_accounting(self):
+        tours = self.write('tours.csv', [self.tour_row('t1', hotel=''), self.tour_row('t2', hotel='')])
+        self.run_import('tour', tours)
+        rows = [
+            {'external_id': 'b1', 'tour': 't1', 'user': 'guest', 'num_people': '4', 'status': 'confirmed',
+             'booking_date': '2026-01-15 10:30'},
+            {'external_id': 'b2', 'tour': 't1', 'user': 'guest', 'num_people': '5', 'status': '', 'booking_date': ''},
+            {'external_id': 'b3', 'tour': 't1', 'user': 'guest', 'num_people': '2', 'status': '', 'booking_date': ''},
+            {'external_id': 'b4', 'tour': 't2', 'user': 'guest', 'num_people': '3', 'status': 'cancelled',
+             'booking_date': ''},
+            {'external_id': 'b5', 'tour': 't2', 'user': 'nobody', 'num_people': '1', 'status': '', 'booking_date': ''},
+            {'external_id': 'b6', 'tour': 't2', 'user': 'guest', 'num_people': '1', 'status': '',
+             'booking_date': '15.01.2026'},
+            {'external_id': 'b7', 'tour': 't2', 'user': 'guest', 'num_people': '1', 'status': '',
+             'booking_date': '2099-01-01'},
+        ]
+        err = self.run_import('booking', self.write('bookings.csv', rows))
+        self.assertIn("строка 4: в туре 't1' осталось мест: 1", err)
+        self.assertIn("неизвестный пользователь 'nobody'", err)
+        self.assertIn('строка 7: booking_date', err)
+        self.assertIn('строка 8: booking_date: дата в будущем', err)
+        self.assertEqual(sorted(Booking.objects.values_list('external_id', flat=True)), ['b1', 'b2', 'b4'])
+        first, second = Tour.objects.order_by('external_id')
+        self.assertEqual((first.available_slots, first.booking_count), (1, 2))
+        self.assertEqual((second.available_slots, second.booking_count), (10, 0))
+        self.assertEqual(timezone.localtime(Booking.objects.get(external_id='b1').booking_date).replace(tzinfo=None),
+                         datetime(2026, 1, 15, 10, 30))
+        self.assertEqual(timezone.localdate(Booking.objects.get(external_id='b2').booking_date),
+                         timezone.localdate())
+
+        # Повторная загрузка не создает дублей и не списывает места второй раз
+        self.run_import('booking', self.write('bookings.csv', rows[:2]))
+        self.assertEqual(Booking.objects.count(), 3)
+        first.refresh_from_db()
+        self.assertEqual((first.available_slots, first.booking_count), (1, 2))
+        self.assertEqual(list(find_booking_count_drift()), [])
+
+    def test_resume_from_progress(self):
+        path = self.write('tours.csv', [self.tour_row(f't{i}', hotel='', country='Нет' if i == 2 else 'Италия')
+                                        for i in range(1, 5)])
+        with self.assertRaises(CommandError):
+            self.run_import('tour', path, '--chunk-size', '2', '--max-errors', '1')
+        with open(f'{path}.progress') as f:
+            self.assertEqual(f.read(), '2')
+        self.assertEqual(list(Tour.objects.values_list('external_id', flat=True)), ['t1'])
+
+        Tour.objects.all().delete()
+        self.run_import('tour', path, '--chunk-size', '2', '--resume')
+        self.assertEqual(sorted(Tour.objects.values_list('external_id', flat=True)), ['t3', 't4'])
+        self.assertFalse(os.path.exists(f'{path}.progress'))
+
+
+class AdminExportTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        self.tour = make_tours(1)[0]
+        make_activity(self.tour, 5)
+
+    def export(self, model, action):
+        url = reverse(f'admin:tours_{model._meta.model_name}_changelist')
+        ids = model.objects.values_list('pk', flat=True)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'action': action, '_selected_action': list(ids)})
+            content = b''.join(response.streaming_content)
+        return content, len(ctx.captured_queries)
+
+    def test_bookings_csv(self):
+        content, queries = self.export(Booking, 'export_csv')
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][3], self.tour.title)
+        self.assertEqual(rows[1][6], f'{self.tour.price:.2f}')
+        make_activity(self.tour, 20)
+        self.assertEqual(self.export(Booking, 'export_csv')[1], queries)
+
+    def test_tours_xlsx(self):
+        content, _ = self.export(Tour, 'export_xlsx')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 2)
+        self.assertIn(self.tour.country.name, sheet)
+
+
+class BookingAdminTests(TestCase):
+    """Правки броней в админке меняют места тура и календарь так же, как сервис бронирования."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        self.tour = make_tours(1, available_slots=5)[0]
+        self.user = User.objects.create(username='client')
+
+    def state(self):
+        self.tour.refresh_from_db()
+        cell = AvailabilityDay.objects.filter(country=self.tour.country, date=self.tour.start_date).first()
+        return self.tour.available_slots, self.tour.booking_count, cell.free_slots if cell else 0
+
+    def url(self, view, *args):
+        return reverse(f'admin:tours_booking_{view}', args=args)
+
+    def add(self, num_people, status='pending'):
+        return self.client.post(self.url('add'), {'user': self.user.pk, 'tour': self.tour.pk,
+                                                  'num_people': num_people, 'status': status})
+
+    def test_add_reserves_slots(self):
+        self.assertEqual(self.add(2).status_code, 302)
+        self.assertEqual(self.state(), (3, 1, 3))
+        self.assertFormError(self.add(4).context['adminform'].form, 'num_people', "В туре осталось мест: 3")
+        self.assertEqual(self.add(1, status='cancelled').status_code, 200)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_change_cannot_touch_seats(self):
+        booking = book_tour(self.user, self.tour.pk, 2)
+        response = self.client.post(self.url('change', booking.pk), {'user': self.user.pk, 'tour': self.tour.pk,
+                                                                     'num_people': 5, 'status': 'cancelled'})
+        self.assertEqual(response.status_code, 302)
+        booking.refresh_from_db()
+        self.assertEqual((booking.num_people, booking.status), (2, 'pending'))
+        self.assertEqual(self.state(), (3, 1, 3))
+
+    def test_actions_and_delete_return_slots(self):
+        first, second, third = (book_tour(self.user, self.tour.pk, 1) for _ in range(3))
+        expired = hold_slots(self.user, self.tour.pk, 1, minutes=0)
+        changelist = self.url('changelist')
+        self.client.post(changelist, {'action': 'confirm_bookings', '_selected_action': [first.pk, expired.pk]})
+        self.assertEqual(Booking.objects.get(pk=first.pk).status, 'confirmed')
+        self.assertEqual(Booking.objects.get(pk=expired.pk).status, 'pending')
+
+        self.client.post(changelist, {'action': 'cancel_bookings', '_selected_action': [expired.pk]})
+        self.assertEqual(self.state(), (2, 3, 2))
+        self.client.post(self.url('delete', first.pk), {'post': 'yes'})
+        self.assertEqual(self.state(), (3, 2, 3))
+        self.client.post(changelist, {'action': 'delete_selected', 'post': 'yes',
+                                      '_selected_action': [second.pk, third.pk, expired.pk]})
+        self.assertEqual(self.state(), (5, 0, 5))
+        self.assertFalse(Booking.objects.exists())
+
+    def test_lock_errors_are_not_retried_inside_a_transaction(self):
+        calls = []
+
+        def locked():
+            calls.append(1)
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            _with_lock_retry(locked)
+        self.assertEqual(len(calls), 1)
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        self.tours = make_tours(2, available_slots=10)
+        self.user = User.objects.create(username='client')
+        rebuild_rollups()
+
+    def snapshot(self):
+        return (list(DailySales.objects.order_by('day', 'country', 'tour_type')
+                     .values_list('day', 'country', 'tour_type', 'bookings', 'people', 'revenue')),
+                list(DailyOccupancy.objects.order_by('day', 'country', 'tour_type')
+                     .values_list('day', 'country', 'tour_type', 'departures', 'seats_booked', 'seats_free')))
+
+    def assertIncrementalMatchesRebuild(self):
+        update_rollups()
+        incremental = self.snapshot()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_update(self):
+        first, second = self.tours
+        booking = book_tour(self.user, first.pk, 3)
+        book_tour(self.user, second.pk, 2)
+        self.assertIncrementalMatchesRebuild()
+        self.assertEqual(DailySales.objects.aggregate(n=Sum('people'))['n'], 5)
+
+        cancel_booking(booking)
+        second.price = 5000
+        second.tour_type = 'ski'
+        second.save()
+        self.assertIncrementalMatchesRebuild()
+
+        Booking.objects.filter(tour=second).delete()
+        first.delete()
+        self.assertIncrementalMatchesRebuild()
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_report_for_managers_only(self):
+        url = reverse('sales_report')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.user.role = User.ROLE_MANAGER
+        self.user.save()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        tables = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('tours_booking', tables)
+
+
+class BookingCountTests(TestCase):
+
+    def setUp(self):
+        self.tour, self.other = make_tours(2)
+        make_activity(self.tour, 3)
+        make_activity(self.other, 1)
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_booking_counts', *args, stdout=out)
+        return out.getvalue()
+
+    def test_counter_follows_bookings(self):
+        self.assertEqual(Tour.objects.get(pk=self.tour.pk).booking_count, 3)
+        booking = self.tour.bookings.first()
+        booking.tour = self.other
+        booking.save()
+        self.assertEqual([Tour.objects.get(pk=t.pk).booking_count for t in (self.tour, self.other)], [2, 2])
+        booking.delete()
+        self.assertEqual(Tour.objects.get(pk=self.other.pk).booking_count, 1)
+        self.assertEqual(self.run_command(), "Расхождений нет.\n")
+
+    def test_command_restores_corrupted_counter(self):
+        Tour.objects.filter(pk=self.tour.pk).update(booking_count=10)
+        Tour.objects.filter(pk=self.other.pk).update(booking_count=0)
+
+        output = self.run_command('--dry-run')
+        self.assertIn(f"Тур #{self.tour.pk}: сохранено 10, фактически 3", output)
+        self.assertIn("найдено: 2, суммарный дрейф: 8", output)
+        self.assertEqual(Tour.objects.get(pk=self.tour.pk).booking_count, 10)
+
+        output = self.run_command('--batch-size', '1')
+        self.assertIn("исправлено: 2", output)
+        self.assertEqual([Tour.objects.get(pk=t.pk).booking_count for t in (self.tour, self.other)], [3, 1])
+        self.assertFalse(find_booking_count_drift().exists())
+
+
+class RatingAggregateTests(TestCase):
+
+    def setUp(self):
+        self.tour = make_tours(1)[0]
+        self.hotel = self.tour.hotel
+        self.users = [User.objects.create(username=f'critic{i}') for i in range(3)]
+        self.reviews = [Review.objects.create(user=user, tour=self.tour, hotel=self.hotel, rating=rating, text='-')
+                        for user, rating in zip(self.users, (5, 4, 3))]
+
+    def aggregates(self, obj):
+        obj.refresh_from_db()
+        return obj.review_count, obj.rating_sum, obj.rating_avg
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('recompute_ratings', *args, stdout=out)
+        return out.getvalue()
+
+    def test_aggregates_follow_edit_and_delete(self):
+        self.assertEqual(self.aggregates(self.tour), (3, 12, 4.0))
+        review = self.reviews[2]
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.aggregates(self.tour), (3, 10, 10 / 3))
+        self.assertEqual(self.aggregates(self.hotel), (3, 10, 10 / 3))
+        review.hotel = None
+        review.save()
+        self.assertEqual(self.aggregates(self.hotel), (2, 9, 4.5))
+        self.reviews[0].delete()
+        self.assertEqual(self.aggregates(self.tour), (2, 5, 2.5))
+        self.assertEqual(self.aggregates(self.hotel), (1, 4, 4.0))
+        review.delete()
+        self.reviews[1].delete()
+        self.assertEqual(self.aggregates(self.tour), (0, 0, 0.0))
+        self.assertIn("расхождений нет", self.run_command())
+
+    def test_command_restores_corrupted_aggregates(self):
+        Tour.objects.filter(pk=self.tour.pk).update(review_count=7, rating_sum=7, rating_avg=1.0)
+        Hotel.objects.filter(pk=self.hotel.pk).update(rating_sum=100)
+
+        output = self.run_command('--dry-run')
+        self.assertIn(f"#{self.tour.pk}: отзывов 7 -> 3, сумма оценок 7 -> 12", output)
+        self.assertEqual(self.aggregates(self.tour), (7, 7, 1.0))
+
+        self.run_command('--batch-size', '1')
+        self.assertEqual(self.aggregates(self.tour), (3, 12, 4.0))
+        self.assertEqual(self.aggregates(self.hotel), (3, 12, 4.0))
+        self.assertFalse(find_rating_drift(Tour).exists())
+        self.assertFalse(find_rating_drift(Hotel).exists())
+
+    def test_command_restores_stale_average(self):
+        Tour.objects.filter(pk=self.tour.pk).update(rating_avg=2.0)
+        self.assertEqual(list(find_rating_drift(Tour)), [(self.tour.pk, 3, 12, 2.0, 3, 12)])
+        self.assertFalse(find_rating_drift(Hotel).exists())
+        self.assertIn(f"#{self.tour.pk}: отзывов 3 -> 3, сумма оценок 12 -> 12, средняя 2.00 -> 4.00",
+                      self.run_command('--dry-run'))
+        self.run_command()
+        self.assertEqual(self.aggregates(self.tour), (3, 12, 4.0))
+        self.assertFalse(find_rating_drift(Tour).exists())
+
+
+class BookingServiceTests(TestCase):
+
+    def setUp(self):
+        self.tour = make_tours(1, available_slots=5)[0]
+        self.user = User.objects.create(username='client')
+
+    def test_reserves_slots(self):
+        booking = book_tour(self.user, self.tour.pk, 3)
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.available_slots, 2)
+        self.assertEqual(self.tour.booking_count, 1)
+        self.assertEqual(booking.status, 'pending')
+
+    def test_rejects_oversubscription(self):
+        book_tour(self.user, self.tour.pk, 4)
+        with self.assertRaises(NotEnoughSlots):
+            book_tour(self.user, self.tour.pk, 2)
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.available_slots, 1)
+        self.assertEqual(Booking.objects.filter(tour=self.tour).count(), 1)
+
+    def test_cancel_returns_slots_once(self):
+        booking = book_tour(self.user, self.tour.pk, 2)
+        self.assertTrue(cancel_booking(booking))
+        self.assertFalse(cancel_booking(booking))
+        self.tour.refresh_from_db()
+        self.assertEqual(self.tour.available_slots, 5)
+        self.assertEqual(self.tour.booking_count, 0)
+
+
+class BookingHoldTests(TestCase):
+
+    def setUp(self):
+        self.tour, self.other = make_tours(2, available_slots=5)
+        self.user = User.objects.create(username='payer')
+
+    def slots(self, tour):
+        tour.refresh_from_db()
+        return tour.available_slots, tour.booking_count
+
+    def test_hold_confirm_and_release(self):
+        hold = hold_slots(self.user, self.tour.pk, 3)
+        self.assertEqual(hold.status, 'pending')
+        self.assertAlmostEqual(hold.hold_expires_at, timezone.now() + timedelta(minutes=15), delta=timedelta(seconds=5))
+        self.assertEqual(self.slots(self.tour), (2, 1))
+        confirm_hold(hold)
+        self.assertEqual(Booking.objects.get(pk=hold.pk).status, 'confirmed')
+        self.assertIsNone(Booking.objects.get(pk=hold.pk).hold_expires_at)
+        with self.assertRaises(HoldExpired):
+            confirm_hold(hold)
+
+        other = hold_slots(self.user, self.tour.pk, 2)
+        self.assertEqual(self.slots(self.tour), (0, 2))
+        self.assertTrue(release_hold(other))
+        self.assertFalse(release_hold(other))
+        self.assertEqual(self.slots(self.tour), (2, 1))
+
+    def test_confirming_expired_hold(self):
+        hold = hold_slots(self.user, self.tour.pk, 2, minutes=0)
+        with self.assertRaises(HoldExpired):
+            confirm_hold(hold)
+        self.assertEqual(Booking.objects.get(pk=hold.pk).status, 'pending')
+        self.assertEqual(self.slots(self.tour), (3, 1))
+
+    def test_batch_expiry_across_tours(self):
+        past = hold_slots(self.user, self.tour.pk, 2, minutes=0)
+        hold_slots(self.user, self.tour.pk, 1, minutes=0)
+        hold_slots(self.user, self.other.pk, 4, minutes=0)
+        alive = hold_slots(self.user, self.other.pk, 1)
+        book_tour(self.user, self.tour.pk, 1, status='confirmed')
+        self.assertEqual((self.slots(self.tour), self.slots(self.other)), ((1, 3), (0, 2)))
+
+        self.assertEqual(expire_holds(batch_size=2), 3)
+        self.assertEqual((self.slots(self.tour), self.slots(self.other)), ((4, 1), (4, 1)))
+        self.assertEqual(Booking.objects.get(pk=past.pk).status, 'cancelled')
+        self.assertEqual(Booking.objects.get(pk=alive.pk).status, 'pending')
+        self.assertEqual(expire_holds(), 0)
+        self.assertEqual(list(find_booking_count_drift()), [])
+
+    def test_expiry_skips_hold_confirmed_meanwhile(self):
+        hold = hold_slots(self.user, self.tour.pk, 2, minutes=0)
+        late = hold_slots(self.user, self.tour.pk, 1, minutes=0)
+
+        racing = [late.pk]
+
+        def confirm_before_update(execute, sql, params, many, context):
+            # Параллельная оплата успевает между выборкой и UPDATE пачки
+            if racing and sql.startswith('UPDATE "tours_booking"'):
+                Booking.objects.filter(pk=racing.pop()).update(status='confirmed', hold_expires_at=None)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(confirm_before_update):
+            self.assertEqual(expire_holds(), 1)
+        self.assertEqual(Booking.objects.get(pk=hold.pk).status, 'cancelled')
+        self.assertEqual(Booking.objects.get(pk=late.pk).status, 'confirmed')
+        self.assertEqual(self.slots(self.tour), (4, 1))
+
+
+class AvailabilityCalendarTests(TestCase):
+
+    def setUp(self):
+        self.tour, self.other = make_tours(2, available_slots=5)
+        self.other.country = self.tour.country
+        self.other.start_date = self.tour.start_date
+        self.other.price = 500
+        self.other.save()
+        self.user = User.objects.create(username='client')
+
+    def cell(self, day=None):
+        return AvailabilityDay.objects.filter(country=self.tour.country, date=day or self.other.start_date).first()
+
+    def assertMatchesRebuild(self):
+        cells = list(AvailabilityDay.objects.values_list('country', 'date', 'departures', 'min_price', 'free_slots'))
+        rebuild_calendar()
+        self.assertEqual(cells, list(AvailabilityDay.objects.values_list(
+            'country', 'date', 'departures', 'min_price', 'free_slots')))
+
+    def test_tracks_tours_and_bookings(self):
+        cell = self.cell()
+        self.assertEqual((cell.departures, cell.min_price, cell.free_slots), (2, 500, 10))
+
+        booking = book_tour(self.user, self.other.pk, 5)
+        cell = self.cell()
+        self.assertEqual((cell.departures, cell.min_price, cell.free_slots), (1, self.tour.price, 5))
+        cancel_booking(booking)
+        self.assertEqual(self.cell().free_slots, 10)
+
+        self.tour.start_date += timedelta(days=1)
+        self.tour.save()
+        self.assertEqual(self.cell().departures, 1)
+        self.assertEqual(self.cell(self.tour.start_date).departures, 1)
+        self.assertMatchesRebuild()
+
+        day = self.other.start_date
+        self.other.delete()
+        self.assertIsNone(self.cell(day))
+        self.assertMatchesRebuild()
+
+    def test_month_grid_is_one_query(self):
+        month = self.tour.start_date.strftime('%Y-%m')
+        url = reverse('api_calendar', args=[self.tour.country_id]) + f'?month={month}&months=3'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        months = response.json()['months']
+        self.assertEqual([m['month'] for m in months][0], month)
+        day = next(d for m in months for d in m['days'] if d['date'] == self.tour.start_date.isoformat())
+        self.assertEqual((day['departures'], day['min_price'], day['free_slots']), (2, '500.00', 10))
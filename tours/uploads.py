@@ -0,0 +1,152 @@
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from PIL import ExifTags, Image as PILImage, ImageOps
+
+from .workers import submit_after_commit
+
+# Модуль импортируется и в процессах пула: модели подключаются внутри функций
+
+STAGING_DIR = 'staging'
+
+# Форматы, которые сохраняются как есть; остальное перекодируется в JPEG
+KEPT_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+
+def staging_root():
+    return os.path.join(settings.MEDIA_ROOT, STAGING_DIR)
+
+
+def stage_upload(upload):
+    """Переносит загруженный файл в staging без чтения в память. Возвращает путь.
+
+    Большие загрузки Django уже записал во временный файл — его просто
+    перемещаем; маленькие пишем кусками.
+    """
+    os.makedirs(staging_root(), exist_ok=True)
+    path = os.path.join(staging_root(), f'{uuid.uuid4().hex}{os.path.splitext(upload.name)[1].lower()}')
+    if hasattr(upload, 'temporary_file_path'):
+        shutil.move(upload.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as file:
+            for chunk in upload.chunks():
+                file.write(chunk)
+    return path
+
+
+def prepare_upload(path, max_side):
+    """Декодирует и проверяет картинку, уменьшает до max_side по большей стороне.
+
+    Выполняется в процессе пула. Возвращает (путь к готовому файлу,
+    расширение по настоящему формату); битый или неподдерживаемый файл
+    вызывает исключение и сразу удаляется.
+    """
+    try:
+        return _prepare(path, max_side)
+    except Exception:
+        _discard(path)
+        raise
+
+
+def _prepare(path, max_side):
+    with PILImage.open(path) as probe:
+        probe.verify()
+    with PILImage.open(path) as original:
+        source_format = original.format
+        upright = original.getexif().get(ExifTags.Base.Orientation, 1) == 1
+        if source_format in KEPT_FORMATS and upright and max(original.size) <= max_side:
+            # Менять нечего: полностью декодируем для проверки и отдаем исходник
+            original.load()
+            return path, KEPT_FORMATS[source_format]
+        picture = ImageOps.exif_transpose(original)
+    picture.thumbnail((max_side, max_side), PILImage.Resampling.LANCZOS, reducing_gap=3.0)
+    if source_format not in KEPT_FORMATS:
+        source_format = 'JPEG'
+        picture = picture.convert('RGB')
+    ext = KEPT_FORMATS[source_format]
+    ready = f'{os.path.splitext(path)[0]}.ready{ext}'
+    picture.save(ready, format=source_format, quality=88)
+    return ready, ext
+
+
+def _discard(*paths):
+    for path in set(paths):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def attach_upload(staged, tour_id, prepared):
+    """Создает Image из подготовленного файла и делает его главной картинкой тура."""
+    from django.core.files import File
+
+    from .caching import bump_version
+    from .models import Image, Tour
+
+    ready, ext = prepared
+    try:
+        with open(ready, 'rb') as file:
+            image = Image.from_upload(File(file, name=f'upload{ext}'))
+        Tour.objects.filter(pk=tour_id).update(main_image=image)
+        bump_version('catalog')
+    finally:
+        _discard(staged, ready)
+
+
+def schedule_upload(staged, tour_id):
+    """После коммита тура отдает загрузку пулу; картинка появится у тура, когда будет готова."""
+    submit_after_commit(
+        prepare_upload, (staged, settings.TOURS_UPLOAD_MAX_SIDE),
+        lambda prepared: attach_upload(staged, tour_id, prepared), f"загрузка {os.path.basename(staged)}",
+    )
+
+
+def collect_garbage(max_age=None, batch_size=500, dry_run=False):
+    """Удаляет забытые файлы staging и картинки, на которые ничто не ссылается.
+
+    Берется только то, что старше max_age: свежие загрузки еще могут быть
+    в очереди пула. Строки Image удаляются пачками, их файлы — если на них
+    больше не ссылается ни одна строка. Возвращает {что: сколько}.
+    """
+    from .models import Hotel, Image, Tour
+
+    max_age = max_age or timedelta(seconds=settings.TOURS_UPLOAD_GRACE)
+    report = {'staged_files': 0, 'staged_bytes': 0, 'images': 0, 'image_files': 0}
+
+    cutoff = time.time() - max_age.total_seconds()
+    if os.path.isdir(staging_root()):
+        for entry in os.scandir(staging_root()):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                report['staged_files'] += 1
+                report['staged_bytes'] += entry.stat().st_size
+                if not dry_run:
+                    _discard(entry.path)
+
+    unreferenced = Image.objects.filter(
+        ~Exists(Tour.objects.filter(main_image=OuterRef('pk'))),
+        ~Exists(Tour.images.through.objects.filter(image=OuterRef('pk'))),
+        ~Exists(Hotel.images.through.objects.filter(image=OuterRef('pk'))),
+        uploaded_at__lt=timezone.now() - max_age,
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(unreferenced.filter(pk__gt=last_pk).values_list('pk', 'image')[:batch_size])
+        if not batch:
+            return report
+        last_pk = batch[-1][0]
+        report['images'] += len(batch)
+        if dry_run:
+            continue
+        Image.objects.filter(pk__in=[pk for pk, _ in batch]).delete()
+        names = {name for _, name in batch if name}
+        still_used = set(Image.objects.filter(image__in=names).values_list('image', flat=True))
+        for name in names - still_used:
+            report['image_files'] += 1
+            _discard(os.path.join(settings.MEDIA_ROOT, name))
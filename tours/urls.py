@@ -1,11 +1,18 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home_page, name='home'),
     path('search-results/', views.search_results, name='search_results'),
     path('tour/<int:tour_id>/', views.tour_detail, name='tour_detail'),
+    path('tour/<int:tour_id>/reviews/', views.tour_reviews, name='tour_reviews'),
     path('tour/add/', views.tour_add, name='tour_add'),
     path('tour/<int:tour_id>/edit/', views.tour_edit, name='tour_edit'),
     path('tour/<int:tour_id>/delete/', views.tour_delete, name='tour_delete'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
+    path('api/tours/', api.api_tours, name='api_tours'),
+    path('api/calendar/<int:country_id>/', api.api_calendar, name='api_calendar'),
+    path('api/favorites/<int:tour_id>/add/', api.api_favorite_add, name='api_favorite_add'),
+    path('api/favorites/<int:tour_id>/remove/', api.api_favorite_remove, name='api_favorite_remove'),
+    path('api/favorites/sync/', api.api_favorites_sync, name='api_favorites_sync'),
 ]
\ No newline at end of file
@@ -1,91 +1,120 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
-from .models import Tour, Country, City, Promotion, Review, Booking
+from django.core.exceptions import PermissionDenied
+from django.db.models import Sum
+from .models import Tour, Review, Booking, User, DailySales, DailyOccupancy
+from .caching import get_reference_data
+from .facets import get_facets, price_bucket_choices
+from .favorites import get_favorite_ids
 from .forms import TourForm
-from django.db.models import Avg, Count
-from datetime import date
+from .pagination import InvalidCursor, KeysetPaginator, get_page_size, page_url
+from .promotions import attach_promotions, get_active_promotions
+from .search import LISTING_RELATED, filter_tours, get_search_params, tour_paginator
+from datetime import date, datetime, timedelta
 
 def home_page(request):
-    countries = Country.objects.all().order_by('name')
-    cities = City.objects.all().order_by('name')
-    TOUR_TYPES = Tour.TOUR_TYPES
-    featured_tours = Tour.objects.filter(available_slots__gt=0, end_date__gte=date.today()).annotate(booking_count=Count('bookings')).order_by('-booking_count', '-start_date')[:6]
-    active_promotions = Promotion.objects.filter(start_date__lte=date.today(), end_date__gte=date.today()).order_by('-start_date')[:3]
+    reference = get_reference_data()
+    featured_tours = attach_promotions(Tour.objects.filter(available_slots__gt=0, end_date__gte=date.today())
+                                       .select_related(*LISTING_RELATED).order_by('-booking_count', '-start_date')[:6])
+    # Индекс акций уже упорядочен по дате начала, отдельный запрос не нужен
+    active_promotions = list(get_active_promotions()['promotions'].values())[:3]
 
     context = {
-        'countries': countries,
-        'cities': cities,
-        'TOUR_TYPES': TOUR_TYPES,
+        'country_options': reference['country_options'],
+        'city_options': reference['city_options'],
+        'tour_type_options': reference['tour_type_options'],
         'featured_tours': featured_tours,
         'active_promotions': active_promotions,
+        'favorite_ids': get_favorite_ids(request.user),
     }
     return render(request, 'tours/home.html', context)
 
 def search_results(request):
-    country_id = request.GET.get('country')
-    city_id = request.GET.get('city')
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    tour_type = request.GET.get('tour_type')
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-
-    tours = Tour.objects.filter(available_slots__gt=0, end_date__gte=date.today()).order_by('start_date')
-
-    if country_id:
-        tours = tours.filter(country__id=country_id)
-    if city_id:
-        tours = tours.filter(city__id=city_id)
-    if start_date:
-        tours = tours.filter(start_date__gte=start_date)
-    if end_date:
-        tours = tours.filter(end_date__lte=end_date)
-    if tour_type and tour_type != 'all':
-        tours = tours.filter(tour_type=tour_type)
-    if min_price:
-        tours = tours.filter(price__gte=min_price)
-    if max_price:
-        tours = tours.filter(price__lte=max_price)
-
-    countries = Country.objects.all().order_by('name')
-    cities = City.objects.all().order_by('name')
-    TOUR_TYPES = Tour.TOUR_TYPES
+    params = get_search_params(request.GET)
+    per_page = get_page_size(request, settings.TOURS_PAGE_SIZE, settings.TOURS_MAX_PAGE_SIZE)
+    sort = request.GET.get('sort')
+    paginator = tour_paginator(filter_tours(params).select_related(*LISTING_RELATED), sort, per_page)
+    try:
+        tours = paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        tours = paginator.get_page()
+    attach_promotions(tours)
+
+    reference = get_reference_data()
+    facets = get_facets(params)
+
+    price_facets = []
+    for label, min_price, max_price, count in price_bucket_choices(facets['price']):
+        query = request.GET.copy()
+        query.pop('cursor', None)
+        query['min_price'], query['max_price'] = min_price, max_price
+        price_facets.append((label, f"{request.path}?{query.urlencode()}", count))
 
     context = {
         'tours': tours,
-        'countries': countries,
-        'cities': cities,
-        'TOUR_TYPES': TOUR_TYPES,
-        'selected_country': country_id,
-        'selected_city': city_id,
-        'selected_start_date': start_date,
-        'selected_end_date': end_date,
-        'selected_tour_type': tour_type,
-        'selected_min_price': min_price,
-        'selected_max_price': max_price,
+        'next_url': page_url(request, tours.next_cursor) if tours.has_next else None,
+        'previous_url': page_url(request, tours.previous_cursor) if tours.has_previous else None,
+        'country_options': [(pk, name, facets['country'].get(pk, 0)) for pk, name in reference['countries']],
+        'city_options': [(pk, name, facets['city'].get(pk, 0)) for pk, name, _ in reference['cities']],
+        'tour_type_options': [(code, name, facets['tour_type'].get(code, 0)) for code, name in reference['tour_types']],
+        'price_facets': price_facets,
+        'favorite_ids': get_favorite_ids(request.user),
+        'selected_q': params['q'],
+        'selected_sort': sort,
+        'selected_country': params['country'],
+        'selected_city': params['city'],
+        'selected_start_date': params['start_date'],
+        'selected_end_date': params['end_date'],
+        'selected_tour_type': params['tour_type'],
+        'selected_min_price': params['min_price'],
+        'selected_max_price': params['max_price'],
     }
     return render(request, 'tours/search_results.html', context)
 
+def _reviews_page(request, tour_id):
+    # tour и hotel нужны Review.from_db для учета оценок в агрегатах
+    reviews = Review.objects.filter(tour_id=tour_id).select_related('user').only(
+        'tour', 'hotel', 'rating', 'text', 'created_at', 'user__username')
+    paginator = KeysetPaginator(reviews, settings.TOURS_REVIEWS_PAGE_SIZE, key='created_at', descending=True,
+                                parse_key=datetime.fromisoformat)
+    try:
+        page = paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        page = paginator.get_page()
+    next_url = None
+    if page.has_next:
+        next_url = f"{reverse('tour_reviews', args=[tour_id])}?cursor={page.next_cursor}"
+    return {'reviews': page, 'reviews_next_url': next_url}
+
 def tour_detail(request, tour_id):
-    tour = get_object_or_404(Tour, pk=tour_id)
-    reviews = Review.objects.filter(tour=tour).order_by('-created_at')
-    average_rating = reviews.aggregate(Avg('rating'))['rating__avg']
-    bookings = Booking.objects.filter(tour=tour).order_by('-booking_date')[:5]
+    tour = get_object_or_404(Tour.objects.select_related('country', 'city', 'hotel', 'main_image'), pk=tour_id)
+    bookings = (Booking.objects.filter(tour=tour).select_related('user')
+                .only('tour', 'num_people', 'status', 'booking_date', 'user__username', 'user__first_name')
+                .order_by('-booking_date')[:5])
 
     context = {
         'tour': tour,
-        'reviews': reviews,
-        'average_rating': average_rating,
+        'gallery': list(tour.images.all()),
+        'average_rating': tour.rating_avg if tour.review_count else None,
         'bookings': bookings,
+        **_reviews_page(request, tour.pk),
     }
     return render(request, 'tours/tour_detail.html', context)
 
+def tour_reviews(request, tour_id):
+    """Следующая страница отзывов фрагментом HTML для подгрузки на странице тура."""
+    return render(request, 'tours/reviews_list.html', _reviews_page(request, tour_id))
+
 def tour_add(request):
     if request.method == 'POST':
         form = TourForm(request.POST, request.FILES)
         if form.is_valid():
             form.save()
             messages.success(request, 'Тур успешно добавлен!')
+            if form.cleaned_data.get('new_main_image'):
+                messages.info(request, 'Изображение обрабатывается и появится у тура через несколько секунд.')
             return redirect('home')
         else:
             messages.error(request, 'Ошибка при добавлении тура. Проверьте введенные данные.')
@@ -100,6 +129,8 @@ def tour_edit(request, tour_id):
         if form.is_valid():
             form.save()
             messages.success(request, 'Тур успешно обновлен!')
+            if form.cleaned_data.get('new_main_image'):
+                messages.info(request, 'Изображение обрабатывается и появится у тура через несколько секунд.')
             return redirect('tour_detail', tour_id=tour.pk)
         else:
             messages.error(request, 'Ошибка при обновлении тура. Проверьте введенные данные.')
@@ -113,4 +144,54 @@ def tour_delete(request, tour_id):
         tour.delete()
         messages.success(request, 'Тур успешно удален.')
         return redirect('home')
-    return render(request, 'tours/tour_confirm_delete.html', {'tour': tour})
\ No newline at end of file
+    return render(request, 'tours/tour_confirm_delete.html', {'tour': tour})
+
+def _report_period(request):
+    try:
+        end = date.fromisoformat(request.GET.get('end') or date.today().isoformat())
+        start = date.fromisoformat(request.GET.get('start') or (end - timedelta(days=29)).isoformat())
+    except ValueError:
+        end = date.today()
+        start = end - timedelta(days=29)
+    return start, end
+
+def sales_report(request):
+    """Выручка и загрузка за период. Читаются только сводные таблицы, а не брони."""
+    user = request.user
+    if not (user.is_authenticated and (user.is_superuser or user.role == User.ROLE_MANAGER)):
+        raise PermissionDenied
+    start, end = _report_period(request)
+    reference = get_reference_data()
+    country_names = dict(reference['countries'])
+    type_names = dict(reference['tour_types'])
+
+    sales = DailySales.objects.filter(day__gte=start, day__lte=end).order_by()
+    totals = {'bookings': Sum('bookings'), 'people': Sum('people'), 'revenue': Sum('revenue')}
+    by_day = sales.values('day').annotate(**totals).order_by('day')
+    by_country = sorted(
+        ({**row, 'name': country_names.get(row['country'], 'Без страны')} for row in sales.values('country').annotate(**totals)),
+        key=lambda row: -row['revenue'],
+    )
+    by_type = sorted(
+        ({**row, 'name': type_names.get(row['tour_type'], row['tour_type'])} for row in sales.values('tour_type').annotate(**totals)),
+        key=lambda row: -row['revenue'],
+    )
+
+    occupancy = []
+    for row in (DailyOccupancy.objects.filter(day__gte=start, day__lte=end).order_by().values('country')
+                .annotate(departures=Sum('departures'), booked=Sum('seats_booked'), free=Sum('seats_free'))):
+        capacity = row['booked'] + row['free']
+        occupancy.append({**row, 'name': country_names.get(row['country'], 'Без страны'),
+                          'rate': 100 * row['booked'] / capacity if capacity else None})
+    occupancy.sort(key=lambda row: row['name'])
+
+    context = {
+        'start': start,
+        'end': end,
+        'by_day': by_day,
+        'by_country': by_country,
+        'by_type': by_type,
+        'occupancy': occupancy,
+        'total': sales.aggregate(**totals),
+    }
+    return render(request, 'tours/sales_report.html', context)
@@ -0,0 +1,53 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+def get_pool(renew=False):
+    """Общий пул процессов для тяжелой работы с картинками. spawn, а не fork: веб-сервер многопоточный."""
+    global _pool
+    if _pool is None or renew:
+        _pool = ProcessPoolExecutor(max_workers=settings.TOURS_WORKERS,
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _finish(callback, description, future):
+    # Выполняется в служебном потоке пула: свое подключение к базе закрываем сразу
+    try:
+        callback(future.result())
+    except Exception:
+        logger.exception("Фоновая задача не выполнена: %s", description)
+    finally:
+        connection.close()
+
+
+def submit_after_commit(func, args, callback, description):
+    """После коммита запускает func(*args) в пуле, а callback(результат) — в основном процессе.
+
+    func выполняется без Django и базы; callback пишет результат в базу.
+    При TOURS_WORKERS = 0 оба шага выполняются сразу в текущем процессе.
+    """
+    def submit():
+        if settings.TOURS_WORKERS:
+            try:
+                future = get_pool().submit(func, *args)
+            except BrokenProcessPool:
+                # Процесс пула упал (например, убит по памяти) — пул больше не принимает задачи
+                future = get_pool(renew=True).submit(func, *args)
+            future.add_done_callback(lambda done: _finish(callback, description, done))
+            return
+        try:
+            callback(func(*args))
+        except Exception:
+            logger.exception("Фоновая задача не выполнена: %s", description)
+
+    transaction.on_commit(submit)